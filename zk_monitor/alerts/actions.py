@@ -15,3 +15,5 @@
 NONE = 'No action on this path.'
 ALERT = 'This path is alerting.'
 SENT = 'Alert has been sent.'
+HELD = 'Alert is held back by a mass event.'
+SUPPRESSED = 'Alert is suppressed by a failing dependency.'
@@ -0,0 +1,187 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Correlation of state changes across paths.
+
+When a Zookeeper session expires or a whole availability zone goes away,
+hundreds of paths leave the OK state within seconds of each other. Rather
+than alerting on every one of them, the Dispatcher hands every such change to
+a Correlator. Once enough paths went bad within the correlation window, the
+Correlator opens an Incident; the Dispatcher then announces the Incident once
+and holds back the alerts of the paths that are part of it.
+
+An Incident is closed once most of its paths are back to OK, or after a
+while at the latest. The paths still failing then alert on their own, and
+the next burst can open a new Incident.
+"""
+
+import collections
+import logging
+import math
+import time
+
+log = logging.getLogger(__name__)
+
+# Defaults: 10 paths going bad within 10 seconds are a mass event.
+WINDOW = 10
+PATHS = 10
+
+# Number of paths named in an incident alert
+LISTED = 50
+
+# An incident is over once 90% of its paths are back to OK, or an hour after
+# it started.
+RECOVERED = 90
+DURATION = 3600
+
+
+class Incident(object):
+    """A group of paths that went bad together."""
+
+    __slots__ = ('started', 'paths', 'open', 'announced')
+
+    def __init__(self, paths, started=None):
+        self.started = started or time.time()
+        # Every path that is part of the incident, and the ones not back to
+        # OK yet.
+        self.paths = set(paths)
+        self.open = set(paths)
+        self.announced = False
+
+    def __repr__(self):
+        return '<Incident of %d paths (%d open)>' % (
+            len(self.paths), len(self.open))
+
+
+class Correlator(object):
+    """Detects bursts of paths leaving the OK state."""
+
+    def __init__(self, window=WINDOW, paths=PATHS, percent=None, total=0,
+                 recovered=RECOVERED, duration=DURATION):
+        """Initialize the correlator.
+
+        args:
+            window: Seconds within which the state changes must happen.
+            paths: Number of paths going bad that makes a mass event.
+            percent: Alternatively, the percentage of all paths that makes a
+                     mass event. Whichever of the two is reached first wins.
+            total: The number of monitored paths (used with percent).
+            recovered: Percentage of the paths of an incident that must be
+                       back to OK to close it.
+            duration: Seconds after which an incident is closed anyway.
+        """
+        self.window = window
+        self.recovered = recovered
+        self.duration = duration
+        self.threshold = paths
+        if percent:
+            self.threshold = min(
+                self.threshold, int(math.ceil(total * percent / 100.0)))
+        self.threshold = max(self.threshold, 2)
+
+        # Paths that went bad within the window, oldest first
+        self._recent = collections.OrderedDict()
+        self.incident = None
+
+    def _expire(self, now):
+        """Forget about changes that fell out of the window."""
+        while self._recent:
+            path, when = next(self._recent.iteritems())
+            if when > now - self.window:
+                break
+            del self._recent[path]
+
+    def observe(self, path, now=None):
+        """Record that a path left the OK state.
+
+        args:
+            path: The path.
+            now: Time of the change (def: time.time()).
+
+        returns:
+            The Incident if this change opened a new one, otherwise None.
+        """
+        now = now or time.time()
+        self._expire(now)
+
+        incident = self.incident
+        if incident is not None:
+            # Stragglers join until the incident has been announced.
+            if not incident.announced:
+                incident.paths.add(path)
+                incident.open.add(path)
+            return None
+
+        self._recent.pop(path, None)
+        self._recent[path] = now
+        if len(self._recent) < self.threshold:
+            return None
+
+        self.incident = Incident(self._recent.keys(), started=now)
+        self._recent.clear()
+        log.warning('%d paths changed state within %ss, opening %s' % (
+            len(self.incident.paths), self.window, self.incident))
+        return self.incident
+
+    def resolve(self, path):
+        """Record that a path is back to OK.
+
+        returns:
+            The Incident if this closed it, otherwise None.
+        """
+        self._recent.pop(path, None)
+
+        incident = self.incident
+        if incident is None or path not in incident.open:
+            return None
+
+        incident.open.discard(path)
+        if len(incident.open) * 100 > \
+                len(incident.paths) * (100 - self.recovered):
+            return None
+
+        log.warning('%d of the paths of %s are back to OK' % (
+            len(incident.paths) - len(incident.open), incident))
+        self.incident = None
+        return incident
+
+    def close(self, incident):
+        """Close an incident that went on for too long.
+
+        returns:
+            True if it was still open.
+        """
+        if self.incident is not incident:
+            return False
+        log.warning('Closing %s after %ss' % (incident, self.duration))
+        self.incident = None
+        return True
+
+    def holds(self, path):
+        """Returns True if the alerts for a path are held by an incident.
+
+        Paths that recovered since are no longer part of it.
+        """
+        return self.incident is not None and path in self.incident.open
+
+    def status(self):
+        """Returns a dict describing the open incident, or None."""
+        incident = self.incident
+        if incident is None:
+            return None
+        return {
+            'started': incident.started,
+            'paths': sorted(incident.paths),
+            'open': sorted(incident.open),
+        }
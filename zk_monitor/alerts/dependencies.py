@@ -0,0 +1,169 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Dependencies between monitored paths.
+
+When /services/foo breaks, alerts about /services/foo/web and every other
+path below it add nothing but noise. A path can declare what it depends on:
+
+    /services/foo/web:
+      children: 3
+      depends_on: /services/foo
+
+or, with inference turned on, every path depends on its closest monitored
+ancestor in the path tree. A declared `depends_on` (even an empty list)
+replaces the inferred one.
+
+The dependencies are resolved once into parent links, so finding a failing
+ancestor of a path only walks its chain of ancestors.
+
+Watch events arrive in no particular order: a child may be evaluated before
+the parent that broke it. Paths with dependencies therefore wait a few
+seconds (`settle`) before alerting, and the pending alerts of the dependents
+of a path that fails are suppressed right away.
+"""
+
+import logging
+import posixpath
+
+from zk_monitor.monitor import states
+
+log = logging.getLogger(__name__)
+
+# Default seconds a path with dependencies waits for them before alerting
+SETTLE = 5
+
+
+class Dependencies(object):
+    """Parent/child links between monitored paths."""
+
+    def __init__(self, config, infer=False, settle=SETTLE):
+        """Build the links from the path configuration.
+
+        args:
+            config: Dict of path configurations, as loaded from YAML.
+            infer: Make every path without a `depends_on` setting depend on
+                   its closest monitored ancestor.
+            settle: Seconds a path with dependencies waits before alerting,
+                    so a failure of its dependencies can be seen first.
+        """
+        # {path: (parent, ...)} and the reverse {parent: set(children)}
+        self.parents = {}
+        self.dependents = {}
+        self.settle = settle
+        self._infer = infer
+
+        for path, settings in config.iteritems():
+            self._link(path, settings, config)
+
+    def _link(self, path, settings, config):
+        """Add the links of a single path."""
+        parents = self._declared(path, settings)
+        if parents is None and self._infer:
+            parents = self._inferred(path, config)
+        if not parents:
+            return
+
+        for parent in parents:
+            if parent not in config:
+                log.warning('%s depends on %s, which is not monitored' %
+                            (path, parent))
+
+        self.parents[path] = parents
+        for parent in parents:
+            self.dependents.setdefault(parent, set()).add(path)
+
+    def _unlink(self, path):
+        """Drop the links from a path to its parents."""
+        for parent in self.parents.pop(path, ()):
+            children = self.dependents.get(parent)
+            if children is not None:
+                children.discard(path)
+                if not children:
+                    del self.dependents[parent]
+
+    def set(self, path, settings, config):
+        """Re-link a path added or changed at runtime.
+
+        Only the links from the path to its parents change; paths that (would)
+        depend on it keep their links until the configuration is reloaded.
+
+        args:
+            path: The path.
+            settings: Its configuration dict (or None).
+            config: Dict of all path configurations.
+        """
+        self._unlink(path)
+        self._link(path, settings, config)
+
+    def remove(self, path):
+        """Drop the links from a path that is no longer monitored."""
+        self._unlink(path)
+
+    @staticmethod
+    def _declared(path, settings):
+        """Returns the tuple of declared parents, or None if not declared."""
+        if not isinstance(settings, dict) or 'depends_on' not in settings:
+            return None
+
+        declared = settings['depends_on'] or ()
+        if isinstance(declared, basestring):
+            declared = (declared,)
+        return tuple(p for p in declared if p != path)
+
+    @staticmethod
+    def _inferred(path, config):
+        """Returns the closest monitored ancestor of a path (as a tuple)."""
+        parent = posixpath.dirname(path.rstrip('/'))
+        while parent and parent != '/':
+            if parent in config:
+                return (parent,)
+            parent = posixpath.dirname(parent)
+        return ()
+
+    def failing_ancestor(self, path, index):
+        """Returns an ancestor of a path that is in the ERROR state.
+
+        args:
+            path: The path.
+            index: pathstate.PathIndex holding the alert state of every path.
+
+        returns:
+            The path of the closest failing ancestor, or None.
+        """
+        seen = set([path])
+        pending = list(self.parents.get(path, ()))
+        while pending:
+            parent = pending.pop(0)
+            if parent in seen:
+                continue
+            seen.add(parent)
+
+            if parent in index and \
+                    index.get(parent).alert_state == states.ERROR:
+                return parent
+            pending.extend(self.parents.get(parent, ()))
+        return None
+
+    def descendants(self, path):
+        """Returns every path that depends on a path, directly or not."""
+        found = set()
+        pending = list(self.dependents.get(path, ()))
+        while pending:
+            child = pending.pop(0)
+            if child in found or child == path:
+                continue
+            found.add(child)
+            pending.extend(self.dependents.get(child, ()))
+        return found
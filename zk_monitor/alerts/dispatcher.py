@@ -12,6 +12,7 @@
 #
 # Copyright 2014 Nextdoor.com, Inc
 
+import json
 import logging
 import time
 
@@ -22,17 +23,25 @@ from zk_monitor.alerts import email
 from zk_monitor.alerts import hipchat
 from zk_monitor.alerts import slack
 from zk_monitor.alerts import actions
+from zk_monitor.alerts import correlation
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import priority
 from zk_monitor.monitor import states
 
 
 log = logging.getLogger(__name__)
 
+# Default maximum number of paths whose alerts are being delivered at once
+DELIVERY_CONCURRENCY = 10
+
 
 class Dispatcher(object):
 
     """Handles timing/cancelling/dispatching/dedup of all alerts to Alerter."""
 
-    def __init__(self, cluster_state, config):
+    def __init__(self, cluster_state, config, index=None, correlator=None,
+                 dependencies=None, priorities=None,
+                 delivery_concurrency=DELIVERY_CONCURRENCY, statsd=None):
         """Set up local 'cache' of path meta data and available alerters.
 
         We only allow a single Dispatcher to alert in a given cluster of
@@ -49,13 +58,33 @@ class Dispatcher(object):
                 {'/foo': {'children': 1,
                           'alerter': {'email': 'unit@test.com',
                                       'body': 'Unit test body here.'}}}
+            index: pathstate.PathIndex shared with the Monitor. A private one
+                   is created if not supplied.
+            correlator: correlation.Correlator object. If supplied, paths
+                        that go bad together are announced as one incident
+                        instead of alerting one by one.
+            dependencies: dependencies.Dependencies object. If supplied, no
+                          alerts are sent for paths that have a dependency in
+                          the Error state.
+            priorities: priority.Priorities shared with the Monitor. They are
+                        resolved from config if not supplied.
+            delivery_concurrency: Maximum number of paths whose alerts are
+                                  delivered at once. When more are waiting,
+                                  the highest priority ones go first.
+            statsd: statsd.StatsD to count the alerts sent with.
 
         """
         log.debug('Initiating Dispatcher.')
 
-        self._live_path_status = {}
+        self._index = index if index is not None else pathstate.PathIndex()
         self._config = config
         self._cluster_state = cluster_state
+        self._correlator = correlator
+        self._dependencies = dependencies
+        self._priorities = priorities if priorities is not None \
+            else priority.Priorities(config)
+        self._delivery = priority.PrioritySemaphore(delivery_concurrency)
+        self._statsd = statsd
 
         self.alerts = {}
         self.alerts['email'] = email.EmailAlerter()
@@ -72,7 +101,7 @@ class Dispatcher(object):
         self._lock.acquire()
 
     @gen.coroutine
-    def update(self, path, state, reason):
+    def update(self, path, state, reason, correlate=True):
         """Update path meta data and maybe alert.
 
         This method should be thought of in 3 steps:
@@ -84,8 +113,29 @@ class Dispatcher(object):
             path: String of zk path that is being updated.
             state: monitor.states - the new path state.
             reason: String - message explaining why the state is updated.
+            correlate: Whether the update may count towards a mass event.
         """
-        self._path_status(path, message=reason, state=state)
+        if path not in self._config:
+            log.debug('Ignoring update of unmonitored path %s', path)
+            raise gen.Return()
+
+        self._path_status(path, message=reason, alert_state=state)
+
+        if state == states.OK and self._correlator:
+            incident = self._correlator.resolve(path)
+            if incident:
+                self._incident_closed(incident)
+
+        if state == states.OK and self._dependencies:
+            self._release_dependents(path)
+        if state == states.ERROR and self._dependencies:
+            self._suppress_dependents(path)
+
+        # Paths that are just watched (a null or empty config) never alert;
+        # they only keep their state, for the paths that depend on them.
+        config = self._config[path]
+        if not config:
+            raise gen.Return()
 
         if state == states.OK:
             # Two scenarios here:
@@ -93,44 +143,148 @@ class Dispatcher(object):
             # cancel the alert and do nothing
             # 2) We come back after it has been sent, so we need to send a
             # "now in spec" follow up.
-            next_action = self._path_status(path)['next_action']
+            next_action = self._path_status(path).next_action
             if next_action == actions.ALERT:
-                log.info('Cancelling an existing alert for %s' % path)
+                log.info('Cancelling an existing alert for %s', path)
                 # Cancel the alert and bail out of here.
                 self._path_status(path, next_action=actions.NONE)
                 raise gen.Return()
             elif next_action == actions.SENT:
-                log.info('Sending a "Now in Spec" alert for %s' % path)
+                log.info('Sending a "Now in Spec" alert for %s', path)
                 # Send a "now in spec"
                 self._path_status(path, next_action=actions.NONE)
-                yield self.send_alerts(path)
+                yield self._deliver(path)
+                raise gen.Return()
+            elif next_action in (actions.HELD, actions.SUPPRESSED):
+                # Nothing was ever sent for this path.
+                self._path_status(path, next_action=actions.NONE)
                 raise gen.Return()
 
         # Set the alert, and continue to check your timer
         self._path_status(path, next_action=actions.ALERT)
 
+        if self._correlator and correlate:
+            incident = self._correlator.observe(path)
+            if incident:
+                IOLoop.current().add_callback(
+                    self._announce_incident, incident)
+
         # Check if we should timeout
-        config = self._config[path]
         # TODO: Should be able to set a 'default' timeout for all paths where a
         # specifric cancel_timeout is not set.
         # TODO: refactor to self.get_config(path, value)
         # to check for default value, then grab path-specific value
         sleep_seconds = config.get('cancel_timeout', 0)
 
+        # Give other paths the chance to turn this into a mass event before
+        # alerting on it alone.
+        if self._correlator:
+            sleep_seconds = max(float(sleep_seconds or 0),
+                                self._correlator.window)
+
+        # Give the dependencies of this path the chance to report that they
+        # fail too, as their watch events may arrive after ours.
+        if self._dependencies and path in self._dependencies.parents:
+            sleep_seconds = max(float(sleep_seconds or 0),
+                                self._dependencies.settle)
+
         yield self.sleep(sleep_seconds)
 
+        # The path may have been removed in the meantime
+        if path not in self._config:
+            raise gen.Return()
+
         # Re-fetch the status here -- it's important
         status = self._path_status(path)
 
-        action = status['next_action']
+        action = status.next_action
 
-        log.debug('Action required by %s: "%s"' % (state, action))
-        if action == actions.ALERT:
-            yield self.send_alerts(path)
-            self._path_status(path, next_action=actions.SENT)
+        log.debug('Action required by %s: "%s"', state, action)
+        if action != actions.ALERT:
+            raise gen.Return()
+
+        if self._correlator and self._correlator.holds(path):
+            log.info('Holding back the alert for %s', path)
+            self._path_status(path, next_action=actions.HELD)
+            raise gen.Return()
+
+        if self._dependencies:
+            ancestor = self._dependencies.failing_ancestor(path, self._index)
+            if ancestor:
+                log.info('Suppressing the alert for %s, %s is failing',
+                         path, ancestor)
+                self._path_status(path, next_action=actions.SUPPRESSED)
+                raise gen.Return()
+
+        sent = yield self._deliver(path, expect=actions.ALERT)
+        if sent:
+            self._path_status(path, next_action=actions.SENT,
+                              alerted=time.time())
 
         raise gen.Return()
 
+    @gen.coroutine
+    def _deliver(self, path, expect=None):
+        """Send the alerts for a path once a delivery slot is free.
+
+        When delivery is backed up, the highest priority paths get the free
+        slots first.
+
+        args:
+            path: The path to alert on.
+            expect: If set, only send if the path's next_action is still this
+                    once a slot is free (it may have recovered meanwhile).
+
+        returns:
+            True if the alerts were sent.
+        """
+        yield self._delivery.acquire(self._priorities.get(path))
+        try:
+            if expect and self._path_status(path).next_action != expect:
+                log.debug('%s changed while waiting for delivery', path)
+                raise gen.Return(False)
+            yield self.send_alerts(path)
+        finally:
+            self._delivery.release()
+
+        raise gen.Return(True)
+
+    def _release_dependents(self, path):
+        """Re-dispatch the suppressed alerts of the dependents of a path.
+
+        Once a path is back to OK, the paths that depend on it (directly or
+        not) and are still failing deserve an alert of their own, unless
+        another one of their dependencies is failing, which update() checks
+        again.
+        """
+        for child in self._dependencies.descendants(path):
+            if child not in self._config:
+                continue
+            record = self._path_status(child)
+            if record.next_action != actions.SUPPRESSED:
+                continue
+            log.info('%s is back to OK, re-dispatching %s', path, child)
+            self._path_status(child, next_action=actions.NONE)
+            IOLoop.current().add_callback(
+                self.update, path=child, state=record.alert_state,
+                reason=record.message)
+
+    def _suppress_dependents(self, path):
+        """Suppress the pending alerts of the dependents of a failing path.
+
+        Their update() is still waiting out its cancel_timeout; once the
+        path recovers, _release_dependents() dispatches them again.
+        """
+        for child in self._dependencies.descendants(path):
+            if child not in self._config:
+                continue
+            record = self._path_status(child)
+            if record.next_action != actions.ALERT:
+                continue
+            log.info('Suppressing the pending alert for %s, %s is failing',
+                     child, path)
+            self._path_status(child, next_action=actions.SUPPRESSED)
+
     @gen.coroutine
     def sleep(self, seconds):
         """Do nothing for `seconds`, then continue the IO loop.
@@ -161,51 +315,180 @@ class Dispatcher(object):
 
         # Here 'message' explains why the alert was fired off.
         # We use that as the details of the message.
-        message = self._path_status(path)['message']
-        state = self._path_status(path)['state']
+        config = self._config.get(path)
+        if not config:
+            log.debug('%s is no longer monitored; not alerting.', path)
+            raise gen.Return(False)
 
-        config = self._config[path]
-        for alert_type, params in config['alerter'].items():
+        status = self._path_status(path)
+        message = status.message
+        state = status.alert_state
+
+        for alert_type, params in (config.get('alerter') or {}).items():
             alert_engine = self.alerts.get(alert_type, None)
 
             if not alert_engine:
                 log.warning('Alerter engine "%s" specified '
-                            'but not available to dispatcher.' % alert_type)
+                            'but not available to dispatcher.', alert_type)
                 continue
 
-            log.debug('Invoking alert type `%s`.' % alert_type)
+            log.debug('Invoking alert type `%s`.', alert_type)
 
             yield alert_engine.alert(
                 path=path,
                 state=state,
                 message=message,
                 params=params)
+            if self._statsd:
+                self._statsd.incr('dispatcher.alerts', tags={
+                    'alerter': alert_type, 'state': state})
+
+    @gen.coroutine
+    def _announce_incident(self, incident):
+        """Announce an incident once the paths joining it have settled."""
+        yield self.sleep(self._correlator.window)
+
+        incident.announced = True
+        if self._correlator.incident is not incident:
+            # Every path recovered before we got to announce it.
+            raise gen.Return()
+
+        IOLoop.current().add_timeout(
+            incident.started + self._correlator.duration,
+            self._expire_incident, incident)
+        yield self.send_incident(incident, states.ERROR)
+
+    def _expire_incident(self, incident):
+        """Close an incident that some paths never recovered from."""
+        if self._correlator.close(incident):
+            self._incident_closed(incident)
+
+    def _incident_closed(self, incident):
+        """Follow up on a closed incident.
+
+        The paths of the incident that are still failing alert on their own
+        from now on; they do not make up a new mass event.
+        """
+        if incident.announced:
+            IOLoop.current().add_callback(
+                self.send_incident, incident, states.OK)
+
+        for path in incident.open:
+            record = self._path_status(path)
+            if path not in self._config or \
+                    record.next_action != actions.HELD:
+                continue
+            log.info('%s is over, re-dispatching %s', incident, path)
+            self._path_status(path, next_action=actions.NONE)
+            IOLoop.current().add_callback(
+                self.update, path=path, state=record.alert_state,
+                reason=record.message, correlate=False)
+
+    @gen.coroutine
+    def send_incident(self, incident, state):
+        """Send one alert about an incident to every alerter involved.
+
+        Paths often share an alerter (the same email address or chat room),
+        so each distinct alerter configuration is only alerted once.
+
+        args:
+            incident: correlation.Incident object.
+            state: monitor.states value; OK once the incident is over.
+        """
+        if not self._lock.status():
+            log.debug('Not the primary dispatcher; not sending alerts.')
+            raise gen.Return(False)
+
+        paths = sorted(incident.paths)
+        name = 'Mass event (%d paths)' % len(paths)
+        if state == states.OK and incident.open:
+            message = '%d of %d paths are back in spec, the rest alert ' \
+                'on their own' % (len(paths) - len(incident.open),
+                                  len(paths))
+        elif state == states.OK:
+            message = 'All %d paths are back in spec' % len(paths)
+        else:
+            message = '%d paths changed state within %ss' % (
+                len(paths), self._correlator.window)
+        shown = paths[:correlation.LISTED]
+        message = '%s: %s' % (message, ', '.join(shown))
+        if len(paths) > len(shown):
+            message += ' and %d more' % (len(paths) - len(shown))
+
+        channels = {}
+        for path in paths:
+            alerter = (self._config.get(path) or {}).get('alerter') or {}
+            for alert_type, params in alerter.items():
+                key = (alert_type, json.dumps(params, sort_keys=True))
+                channels.setdefault(key, params)
+
+        for (alert_type, _), params in sorted(channels.items()):
+            alert_engine = self.alerts.get(alert_type, None)
+            if not alert_engine:
+                continue
+            yield alert_engine.alert(
+                path=name,
+                state=state,
+                message=message,
+                params=params)
+            if self._statsd:
+                self._statsd.incr('dispatcher.incidents', tags={
+                    'alerter': alert_type, 'state': state})
 
     def _path_status(self, path, **kwargs):
         """Get or create meta data for specific data path.
 
         Args:
             path: string - some zk registered path /foo
-            kwargs: dictionary can be anything but here are some common keys:
-                state: monitor.states value.
+            kwargs: any pathstate.PathState attribute. The Dispatcher uses:
+                alert_state: monitor.states value.
                 message: reason for this state / message along with the action.
                 next_action: alerts.actions value.
+                alerted: timestamp of the last alert sent.
+
+        Returns:
+            pathstate.PathState object
         """
+        record = self._index.get(path)
 
-        if path not in self._live_path_status:
-            self._live_path_status[path] = {
-                'state': states.UNKNOWN,
-                'message': False,
-                'next_action': None}
+        # Update local knowledge of the path metadata with any keywords that
+        # were passed in
+        if kwargs:
+            record.update(**kwargs)
 
-        # Update local knowledge of the path metadata with any arbitrary
-        # keywords that were passed in
-        path_data = self._live_path_status[path]
+        return record
 
-        if kwargs:
-            path_data.update(kwargs)
+    def set_path(self, path, config):
+        """Take on the config of a path added or changed at runtime.
+
+        The alert state of the path is kept; the new alerters are used from
+        its next alert on.
+
+        args:
+            path: The path.
+            config: Its configuration dict.
+        """
+        self._config[path] = config
+        if self._dependencies:
+            self._dependencies.set(path, config, self._config)
 
-        return path_data
+    def remove_path(self, path):
+        """Forget about a path that is no longer monitored.
+
+        Any alert still pending for it is dropped.
+        """
+        self._config.pop(path, None)
+        if self._dependencies:
+            self._dependencies.remove(path)
+        if self._correlator:
+            incident = self._correlator.resolve(path)
+            if incident:
+                self._incident_closed(incident)
+        self._index.remove(path)
+
+    def alerting(self):
+        """Returns whether we hold the alerter lock (without asking ZK)."""
+        return self._lock.status()
 
     def status(self):
         """Return status of the dispatcher and alerts.
@@ -214,10 +497,15 @@ class Dispatcher(object):
         """
 
         alerter_list = self.alerts.keys()
-        lock = self._lock.status()
+        lock = self.alerting()
 
-        return {
+        status = {
             'name': self._cluster_state._name,
             'alerters': alerter_list,
             'alerting': lock,
         }
+
+        if self._correlator:
+            status['incident'] = self._correlator.status()
+
+        return status
@@ -67,7 +67,8 @@ class HipchatAlerter(base.AlerterBase):
 
         styles = {
             states.OK: ('green', 'successful'),
-            states.ERROR: ('red', 'failed')
+            states.ERROR: ('red', 'failed'),
+            states.ANOMALY: ('yellow', 'warning')
         }
 
         default = ('gray', 'unknown')
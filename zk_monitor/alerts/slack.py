@@ -62,7 +62,8 @@ class SlackAlerter(base.AlerterBase):
         """
         styles = {
             states.OK: ':+1:',
-            states.ERROR: ':exclamation:'
+            states.ERROR: ':exclamation:',
+            states.ANOMALY: ':warning:'
         }
 
         default = ':grey_question:'
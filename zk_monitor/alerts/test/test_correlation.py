@@ -0,0 +1,97 @@
+from tornado.testing import unittest
+
+from zk_monitor.alerts import correlation
+
+
+class TestCorrelator(unittest.TestCase):
+    def testThreshold(self):
+        self.assertEquals(10, correlation.Correlator().threshold)
+        self.assertEquals(5, correlation.Correlator(
+            paths=10, percent=5, total=100).threshold)
+        self.assertEquals(10, correlation.Correlator(
+            paths=10, percent=50, total=100).threshold)
+        # A single path is never a mass event
+        self.assertEquals(
+            2, correlation.Correlator(paths=1).threshold)
+
+    def testWindow(self):
+        c = correlation.Correlator(window=10, paths=3)
+        self.assertEquals(None, c.observe('/a', now=100))
+        self.assertEquals(None, c.observe('/b', now=105))
+
+        # /a fell out of the window
+        self.assertEquals(None, c.observe('/c', now=111))
+        self.assertEquals(None, c.incident)
+
+        # The same path going bad twice counts once
+        self.assertEquals(None, c.observe('/c', now=112))
+        self.assertEquals(None, c.incident)
+
+        # A path that recovered does not count
+        c.resolve('/b')
+        self.assertEquals(None, c.observe('/d', now=113))
+
+        incident = c.observe('/e', now=114)
+        self.assertEquals(set(['/c', '/d', '/e']), incident.paths)
+        self.assertTrue(c.holds('/c'))
+        self.assertFalse(c.holds('/b'))
+
+    def testStragglers(self):
+        c = correlation.Correlator(window=10, paths=2)
+        c.observe('/a', now=100)
+        incident = c.observe('/b', now=100)
+
+        # Paths join until the incident is announced
+        self.assertEquals(None, c.observe('/c', now=101))
+        incident.announced = True
+        self.assertEquals(None, c.observe('/d', now=102))
+        self.assertEquals(set(['/a', '/b', '/c']), incident.paths)
+        self.assertFalse(c.holds('/d'))
+
+    def testResolve(self):
+        c = correlation.Correlator(window=10, paths=2)
+        c.observe('/a', now=100)
+        incident = c.observe('/b', now=100)
+        self.assertEquals(['/a', '/b'], c.status()['open'])
+
+        self.assertEquals(None, c.resolve('/a'))
+        self.assertEquals(None, c.resolve('/x'))
+        self.assertEquals(['/b'], c.status()['open'])
+        self.assertEquals(incident, c.resolve('/b'))
+
+        self.assertEquals(None, c.incident)
+        self.assertEquals(None, c.status())
+        self.assertFalse(c.holds('/a'))
+
+    def testResolveMost(self):
+        c = correlation.Correlator(window=10, paths=2, recovered=75)
+        for path in ('/a', '/b', '/c', '/d'):
+            c.observe(path, now=100)
+        incident = c.incident
+        incident.announced = True
+
+        self.assertEquals(None, c.resolve('/a'))
+        self.assertEquals(None, c.resolve('/b'))
+
+        # A path that recovered and fails again is not held
+        c.observe('/a', now=101)
+        self.assertFalse(c.holds('/a'))
+        self.assertTrue(c.holds('/d'))
+
+        # Three quarters back to OK close the incident
+        self.assertEquals(incident, c.resolve('/c'))
+        self.assertEquals(set(['/d']), incident.open)
+        self.assertFalse(c.holds('/d'))
+
+        # ... and the next burst opens a new one
+        c.observe('/x', now=200)
+        self.assertTrue(c.observe('/y', now=200) is not None)
+
+    def testClose(self):
+        c = correlation.Correlator(window=10, paths=2)
+        c.observe('/a', now=100)
+        incident = c.observe('/b', now=100)
+
+        self.assertTrue(c.close(incident))
+        self.assertFalse(c.close(incident))
+        self.assertEquals(None, c.incident)
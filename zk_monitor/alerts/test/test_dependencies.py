@@ -0,0 +1,93 @@
+from tornado.testing import unittest
+
+from zk_monitor.alerts import dependencies
+from zk_monitor.monitor import pathstate
+
+
+class TestDependencies(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            '/services': {},
+            '/services/foo': {},
+            '/services/foo/web': {},
+            '/services/foo/web/canary': {'depends_on': []},
+            '/services/foo/deep/down': {},
+            '/jobs/bar': {'depends_on': '/services/foo/web'},
+            '/jobs/baz': {'depends_on': ['/jobs/bar', '/unmonitored']},
+        }
+
+    def testDeclared(self):
+        deps = dependencies.Dependencies(self.config)
+        self.assertEquals(
+            {'/jobs/bar': ('/services/foo/web',),
+             '/jobs/baz': ('/jobs/bar', '/unmonitored')},
+            deps.parents)
+        self.assertEquals(set(['/jobs/bar']),
+                          deps.dependents['/services/foo/web'])
+
+    def testInferred(self):
+        deps = dependencies.Dependencies(self.config, infer=True)
+        self.assertEquals(('/services',), deps.parents['/services/foo'])
+        self.assertEquals(('/services/foo',),
+                          deps.parents['/services/foo/web'])
+
+        # Unmonitored levels of the tree are skipped
+        self.assertEquals(('/services/foo',),
+                          deps.parents['/services/foo/deep/down'])
+
+        # Declarations win over the tree
+        self.assertFalse('/services/foo/web/canary' in deps.parents)
+        self.assertEquals(('/services/foo/web',), deps.parents['/jobs/bar'])
+        self.assertFalse('/services' in deps.parents)
+
+    def testSetAndRemove(self):
+        deps = dependencies.Dependencies(self.config)
+        self.config['/jobs/qux'] = {'depends_on': '/jobs/bar'}
+        deps.set('/jobs/qux', self.config['/jobs/qux'], self.config)
+        self.assertEquals(('/jobs/bar',), deps.parents['/jobs/qux'])
+        self.assertEquals(set(['/jobs/baz', '/jobs/qux']),
+                          deps.dependents['/jobs/bar'])
+
+        # A changed declaration replaces the old links
+        deps.set('/jobs/qux', {'depends_on': '/services'}, self.config)
+        self.assertEquals(set(['/jobs/baz']), deps.dependents['/jobs/bar'])
+        self.assertEquals(set(['/jobs/qux']), deps.dependents['/services'])
+
+        deps.remove('/jobs/qux')
+        self.assertFalse('/jobs/qux' in deps.parents)
+        self.assertFalse('/services' in deps.dependents)
+
+    def testFailingAncestor(self):
+        deps = dependencies.Dependencies(self.config, infer=True)
+        index = pathstate.PathIndex()
+        for path in self.config:
+            index.get(path).alert_state = 'OK'
+
+        self.assertEquals(None, deps.failing_ancestor('/jobs/baz', index))
+
+        index.get('/services').alert_state = 'Error'
+        self.assertEquals('/services',
+                          deps.failing_ancestor('/jobs/baz', index))
+        self.assertEquals('/services',
+                          deps.failing_ancestor('/services/foo/web', index))
+        self.assertEquals(None, deps.failing_ancestor('/services', index))
+
+        # The closest failing ancestor is named
+        index.get('/services/foo/web').alert_state = 'Error'
+        self.assertEquals('/services/foo/web',
+                          deps.failing_ancestor('/jobs/baz', index))
+
+    def testDescendants(self):
+        deps = dependencies.Dependencies({'/a': None,
+                                          '/a/b': {'depends_on': '/a'},
+                                          '/a/b/c': {'depends_on': '/a/b'},
+                                          '/d': {'depends_on': '/a/b/c'}})
+        self.assertEquals(set(['/a/b', '/a/b/c', '/d']),
+                          deps.descendants('/a'))
+        self.assertEquals(set(), deps.descendants('/d'))
+
+    def testCycles(self):
+        deps = dependencies.Dependencies({'/a': {'depends_on': '/b'},
+                                          '/b': {'depends_on': '/a'}})
+        index = pathstate.PathIndex()
+        self.assertEquals(None, deps.failing_ancestor('/a', index))
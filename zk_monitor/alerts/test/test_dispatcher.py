@@ -6,9 +6,13 @@ from tornado import gen
 from tornado import testing
 from tornado.ioloop import IOLoop
 
+from zk_monitor.alerts import actions
+from zk_monitor.alerts import correlation
+from zk_monitor.alerts import dependencies
 from zk_monitor.alerts import dispatcher
 from zk_monitor.alerts import email
 from zk_monitor.alerts import hipchat
+from zk_monitor.monitor import pathstate
 
 
 log = logging.getLogger(__name__)
@@ -210,6 +214,73 @@ class TestDispatcher(testing.AsyncTestCase):
         # Email...
         self.dispatcher.alerts['email'].alert.assert_not_called()
 
+    @testing.gen_test
+    def test_shared_index(self):
+        """Dispatcher keeps its path status in the shared PathIndex."""
+
+        index = pathstate.PathIndex()
+        index.get('/bar').state = 'Error'
+        self.dispatcher = dispatcher.Dispatcher(self._cs, self.config, index)
+        self.dispatcher.send_alerts = mock_tornado()
+
+        yield self.dispatcher.update(path='/bar', state='Error', reason='Test')
+
+        record = index.get('/bar')
+        self.assertEquals(record.alert_state, 'Error')
+        self.assertEquals(record.message, 'Test')
+        self.assertEquals(record.next_action, actions.SENT)
+        self.assertTrue(record.alerted)
+
+        # The Monitor's side of the record is left alone
+        self.assertEquals(record.state, 'Error')
+        self.assertFalse('state' in self.config['/bar'])
+
+    @testing.gen_test
+    def test_delivery_priority(self):
+        """Backed up alerts are delivered highest priority first."""
+
+        config = dict(
+            (path, {'children': 1, 'priority': prio,
+                    'alerter': {'email': 'unit@test.com'}})
+            for path, prio in (('/low', 'low'), ('/normal', 'normal'),
+                               ('/critical', 'critical')))
+        self.dispatcher = dispatcher.Dispatcher(
+            self._cs, config, delivery_concurrency=1)
+
+        delivered = []
+
+        @gen.coroutine
+        def send_alerts(path):
+            delivered.append(path)
+            yield self.sleep(0.01)
+        self.dispatcher.send_alerts = send_alerts
+
+        yield [self.dispatcher.update(path=path, state='Error', reason='x')
+               for path in ('/low', '/normal', '/critical')]
+        self.assertEquals(['/low', '/critical', '/normal'], delivered)
+
+    @testing.gen_test
+    def test_delivery_cancelled_while_waiting(self):
+        self.dispatcher = dispatcher.Dispatcher(
+            self._cs, {'/a': {'children': 1}, '/b': {'children': 1}},
+            delivery_concurrency=1)
+        delivered = []
+
+        @gen.coroutine
+        def send_alerts(path):
+            delivered.append(path)
+            yield self.sleep(0.01)
+        self.dispatcher.send_alerts = send_alerts
+
+        first = self.dispatcher.update(path='/a', state='Error', reason='x')
+        second = self.dispatcher.update(path='/b', state='Error', reason='x')
+        yield self.dispatcher.update(path='/b', state='OK', reason='ok')
+        yield [first, second]
+
+        self.assertEquals(['/a'], delivered)
+        self.assertEquals(self.dispatcher._path_status('/b').next_action,
+                          actions.NONE)
+
     def test_lock(self):
         """Only one dispatcher should fire off alerts."""
 
@@ -237,6 +308,220 @@ class TestDispatcher(testing.AsyncTestCase):
         self.assertItemsEqual(status['alerters'], ['other', 'email'])
         self.assertTrue('alerting' in status)
 
+    @testing.gen_test
+    def test_set_and_remove_path(self):
+        self.dispatcher = dispatcher.Dispatcher(self._cs, self.config)
+        self.dispatcher.send_alerts = mock_tornado()
+
+        self.dispatcher.set_path('/new', {'children': 1, 'alerter': {}})
+        yield self.dispatcher.update(path='/new', state='Error', reason='x')
+        self.assertEquals(1, self.dispatcher.send_alerts._call_count)
+
+        # A pending alert of a removed path is dropped
+        update_task = self.dispatcher.update(
+            path='/bar', state='Error', reason='Test')
+        self.dispatcher.remove_path('/bar')
+        yield update_task
+        self.assertEquals(1, self.dispatcher.send_alerts._call_count)
+        self.assertFalse('/bar' in self.dispatcher._index)
+
+        # ... and so are later updates
+        yield self.dispatcher.update(path='/bar', state='Error', reason='x')
+        self.assertFalse('/bar' in self.dispatcher._index)
+
+    @testing.gen_test
+    def test_watched_path_never_alerts(self):
+        self.dispatcher = dispatcher.Dispatcher(
+            self._cs, {'/watched': None, '/empty': {}})
+        self.dispatcher.send_alerts = mock_tornado()
+
+        for path in ('/watched', '/empty'):
+            yield self.dispatcher.update(path=path, state='Error', reason='x')
+            self.assertEquals('Error',
+                              self.dispatcher._path_status(path).alert_state)
+        self.assertEquals(0, self.dispatcher.send_alerts._call_count)
+
+
+class TestCorrelation(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestCorrelation, self).setUp()
+
+        self.config = dict(
+            ('/%s' % name, {'children': 1,
+                            'alerter': {'email': 'unit@test.com'}})
+            for name in 'abcd')
+        self.config['/d']['alerter'] = {'email': 'other@test.com'}
+
+        self.correlator = correlation.Correlator(window=0.1, paths=3)
+        self.dispatcher = dispatcher.Dispatcher(
+            mock.MagicMock(), self.config, correlator=self.correlator)
+        self.dispatcher.send_alerts = mock_tornado()
+        self.dispatcher.alerts['email'] = mock.MagicMock()
+        self.dispatcher.alerts['email'].alert = mock.Mock(
+            side_effect=lambda **kwargs: mock_tornado()())
+
+    @gen.coroutine
+    def sleep(self, seconds):
+        yield gen.Task(IOLoop.current().add_timeout, time.time() + seconds)
+
+    @testing.gen_test
+    def test_single_path_alerts(self):
+        yield self.dispatcher.update(path='/a', state='Error', reason='Test')
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 1)
+
+    @testing.gen_test
+    def test_mass_event(self):
+        yield [self.dispatcher.update(path=path, state='Error', reason='x')
+               for path in sorted(self.config)]
+        yield self.sleep(0.15)
+
+        # No alerts for the individual paths ...
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 0)
+        for path in self.config:
+            self.assertEquals(self.dispatcher._path_status(path).next_action,
+                              actions.HELD)
+
+        # ... but one per alerter channel about the incident
+        calls = self.dispatcher.alerts['email'].alert.call_args_list
+        self.assertEquals(
+            ['other@test.com', 'unit@test.com'],
+            [c[1]['params'] for c in calls])
+        self.assertEquals('Mass event (4 paths)', calls[0][1]['path'])
+        self.assertEquals(
+            '4 paths changed state within 0.1s: /a, /b, /c, /d',
+            calls[0][1]['message'])
+        self.assertEquals(
+            ['/a', '/b', '/c', '/d'],
+            self.dispatcher.status()['incident']['paths'])
+
+        # Recovery is silent per path, and announced once it is complete
+        for path in sorted(self.config):
+            yield self.dispatcher.update(path=path, state='OK', reason='ok')
+        yield self.sleep(0.01)
+
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 0)
+        calls = self.dispatcher.alerts['email'].alert.call_args_list
+        self.assertEquals(4, len(calls))
+        self.assertEquals('OK', calls[3][1]['state'])
+        self.assertEquals(None, self.dispatcher.status()['incident'])
+
+    @testing.gen_test
+    def test_mass_event_expires(self):
+        self.correlator.duration = 0.2
+        yield [self.dispatcher.update(path=path, state='Error', reason='x')
+               for path in sorted(self.config)]
+        yield self.dispatcher.update(path='/a', state='OK', reason='ok')
+        yield self.sleep(0.25)
+
+        # The paths that never recovered alert on their own
+        self.assertEquals(None, self.dispatcher.status()['incident'])
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 3)
+        for path in ('/b', '/c', '/d'):
+            self.assertEquals(self.dispatcher._path_status(path).next_action,
+                              actions.SENT)
+        calls = self.dispatcher.alerts['email'].alert.call_args_list
+        self.assertEquals('OK', calls[-1][1]['state'])
+        self.assertTrue(calls[-1][1]['message'].startswith(
+            '1 of 4 paths are back in spec'))
+
+
+class TestDependencies(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestDependencies, self).setUp()
+
+        self.config = {
+            '/foo': {'children': 1, 'alerter': {'email': 'unit@test.com'}},
+            '/foo/web': {'children': 1, 'cancel_timeout': 0.05,
+                         'alerter': {'email': 'unit@test.com'}}}
+        self.dispatcher = dispatcher.Dispatcher(
+            mock.MagicMock(), self.config,
+            dependencies=dependencies.Dependencies(
+                self.config, infer=True, settle=0.05))
+        self.dispatcher.send_alerts = mock_tornado()
+
+    @gen.coroutine
+    def sleep(self, seconds):
+        yield gen.Task(IOLoop.current().add_timeout, time.time() + seconds)
+
+    @testing.gen_test
+    def test_suppressed_while_parent_fails(self):
+        yield [self.dispatcher.update(path='/foo', state='Error', reason='x'),
+               self.dispatcher.update(path='/foo/web', state='Error',
+                                      reason='y')]
+
+        # Only the parent alerted
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 1)
+        self.assertEquals(self.dispatcher.send_alerts._last_args, ('/foo',))
+        self.assertEquals(
+            self.dispatcher._path_status('/foo/web').next_action,
+            actions.SUPPRESSED)
+
+        # Once the parent recovers the child alerts on its own
+        yield self.dispatcher.update(path='/foo', state='OK', reason='ok')
+        yield self.sleep(0.1)
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 3)
+        self.assertEquals(self.dispatcher.send_alerts._last_args,
+                          ('/foo/web',))
+        self.assertEquals(
+            self.dispatcher._path_status('/foo/web').next_action,
+            actions.SENT)
+
+    @testing.gen_test
+    def test_child_reported_before_parent(self):
+        # Even without a cancel_timeout, the child waits for its parent
+        del self.config['/foo/web']['cancel_timeout']
+        child = self.dispatcher.update(path='/foo/web', state='Error',
+                                       reason='y')
+        yield self.dispatcher.update(path='/foo', state='Error', reason='x')
+        self.assertEquals(
+            self.dispatcher._path_status('/foo/web').next_action,
+            actions.SUPPRESSED)
+        yield child
+
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 1)
+        self.assertEquals(self.dispatcher.send_alerts._last_args, ('/foo',))
+
+    @testing.gen_test
+    def test_grandchild_released(self):
+        # /foo/web stays OK while /foo and /foo/web/app fail
+        self.config['/foo/web/app'] = {
+            'children': 1, 'cancel_timeout': 0.05,
+            'alerter': {'email': 'unit@test.com'}}
+        self.dispatcher = dispatcher.Dispatcher(
+            mock.MagicMock(), self.config,
+            dependencies=dependencies.Dependencies(
+                self.config, infer=True, settle=0.05))
+        self.dispatcher.send_alerts = mock_tornado()
+
+        yield [self.dispatcher.update(path='/foo', state='Error', reason='x'),
+               self.dispatcher.update(path='/foo/web/app', state='Error',
+                                      reason='z')]
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 1)
+        self.assertEquals(
+            self.dispatcher._path_status('/foo/web/app').next_action,
+            actions.SUPPRESSED)
+
+        yield self.dispatcher.update(path='/foo', state='OK', reason='ok')
+        yield self.sleep(0.1)
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 3)
+        self.assertEquals(self.dispatcher.send_alerts._last_args,
+                          ('/foo/web/app',))
+        self.assertEquals(
+            self.dispatcher._path_status('/foo/web/app').next_action,
+            actions.SENT)
+
+    @testing.gen_test
+    def test_suppressed_child_recovers_silently(self):
+        yield [self.dispatcher.update(path='/foo', state='Error', reason='x'),
+               self.dispatcher.update(path='/foo/web', state='Error',
+                                      reason='y')]
+        yield self.dispatcher.update(path='/foo/web', state='OK', reason='ok')
+
+        self.assertEquals(self.dispatcher.send_alerts._call_count, 1)
+        self.assertEquals(
+            self.dispatcher._path_status('/foo/web').next_action,
+            actions.NONE)
+
 
 class TestWithEmail(testing.AsyncTestCase):
     def setUp(self):
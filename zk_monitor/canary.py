@@ -0,0 +1,225 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+End-to-end watch latency canary.
+
+How quickly a change in Zookeeper turns into an alert depends on the
+ensemble, our session, the Kazoo callback thread and the IOLoop -- none of
+which the paths themselves tell us about. The canary writes a marker znode
+under the cluster workspace every interval, and times how long it takes the
+resulting watch event to arrive through the Monitor, the same way the update
+of any monitored path does.
+
+The latencies are kept in a histogram (served in /status). When a marker
+takes longer than the threshold to come back, or does not come back at all,
+the canary is in the Error state until one makes it in time. Its state is
+handed to the Dispatcher under the 'canary' key, so alerting on it works like
+for any path:
+
+    canary:
+      alerter:
+        email: ops@example.com
+"""
+
+import bisect
+import logging
+import time
+
+from tornado import gen
+from tornado import ioloop
+
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import states
+
+log = logging.getLogger(__name__)
+
+# Key of the canary in the path config, the Dispatcher and the path index
+KEY = 'canary'
+
+# Defaults: seconds between markers, and the latency that is too slow
+INTERVAL = 60
+THRESHOLD = 5
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram(object):
+    """Counts observed values into fixed buckets."""
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        args:
+            buckets: Sorted upper bounds of the buckets. Anything above the
+                     last one is counted in an overflow bucket.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def status(self):
+        """Returns the cumulative count of values up to every bound."""
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {'buckets': cumulative, 'count': self.count,
+                'sum': round(self.sum, 6)}
+
+
+class Canary(object):
+    """Periodically times a marker write until its watch event arrives."""
+
+    def __init__(self, cluster_state, monitor, dispatcher, index=None,
+                 interval=INTERVAL, threshold=THRESHOLD, statsd=None):
+        """
+        args:
+            cluster_state: cluster.State object to write the marker with.
+            monitor: monitor.Monitor to receive the watch events through.
+            dispatcher: alerts.dispatcher.Dispatcher object.
+            index: pathstate.PathIndex shared with the Dispatcher. A private
+                   one is created if not supplied.
+            interval: Seconds between markers.
+            threshold: Seconds after which a marker is too slow.
+            statsd: statsd.StatsD to report the latencies to.
+        """
+        self._cs = cluster_state
+        self._monitor = monitor
+        self._dispatcher = dispatcher
+        self._index = index if index is not None else pathstate.PathIndex()
+        self._interval = interval
+        self._threshold = threshold
+        self._statsd = statsd
+        self._path = cluster_state.getCanaryPath()
+        self._timer = None
+
+        # Sequence number and write time of the marker in flight
+        self._sequence = 0
+        self._sent = None
+
+        self.histogram = Histogram()
+        self.last = None
+        self.timeouts = 0
+
+    def start(self):
+        """Watch our marker, then write one every interval."""
+        self._monitor.probe(self._path, self._received)
+        self._timer = ioloop.PeriodicCallback(
+            self.send, self._interval * 1000)
+        self._timer.start()
+        ioloop.IOLoop.current().add_callback(self.send)
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+        self._monitor.unprobe(self._path)
+
+    @gen.coroutine
+    def send(self):
+        """Write the next marker, unless one is still in flight."""
+        if self._sent is not None:
+            return
+
+        self._sequence += 1
+        sequence = self._sequence
+        self._sent = time.time()
+        try:
+            yield self._cs.putCanary({'sequence': sequence,
+                                      'time': self._sent})
+        except Exception, e:
+            log.warning('Could not write the canary marker: %s' % e)
+            self._sent = None
+            self._update(states.ERROR,
+                         'Could not write the canary marker: %s' % e)
+            return
+
+        ioloop.IOLoop.current().add_timeout(
+            self._sent + self._threshold, self._expire, sequence)
+
+    def _received(self, data):
+        """Time a marker that arrived through the Monitor."""
+        marker = data.get('data')
+        if not isinstance(marker, dict) or self._sent is None or \
+                marker.get('sequence') != self._sequence:
+            # Our initial read, or a marker we already gave up on
+            return
+
+        latency = time.time() - self._sent
+        self._sent = None
+        self.last = latency
+        self.histogram.observe(latency)
+        if self._statsd:
+            self._statsd.timing('canary.latency', latency)
+        log.debug('Canary marker %s arrived after %.3fs' % (
+            self._sequence, latency))
+
+        if latency > self._threshold:
+            self._update(states.ERROR, 'Watch latency %.1fs is more than '
+                         'maximum %ss' % (latency, self._threshold))
+        else:
+            self._update(states.OK, 'Watch latency %.3fs' % latency)
+
+    def _expire(self, sequence):
+        """Give up on a marker that did not arrive within the threshold."""
+        if self._sent is None or sequence != self._sequence:
+            return
+
+        self._sent = None
+        self.timeouts += 1
+        if self._statsd:
+            self._statsd.incr('canary.timeouts')
+        self._update(states.ERROR, 'No watch event for the canary marker '
+                     'within %ss' % self._threshold)
+
+        # The watch itself may have gone missing; register it again
+        self._monitor.unprobe(self._path)
+        self._monitor.probe(self._path, self._received)
+
+    def _update(self, new_state, reason):
+        """Record the state of the canary, and dispatch it if it changed."""
+        record = self._index.get(KEY)
+        old_state = record.state
+        now = time.time()
+        if new_state != old_state:
+            record.changed = now
+        record.update(state=new_state, reason=reason, updated=now)
+
+        if new_state == old_state or \
+                (old_state == states.UNKNOWN and new_state == states.OK):
+            return
+
+        log.warning('Canary changed from %s to %s: %s' % (
+            old_state, new_state, reason))
+        ioloop.IOLoop.current().add_callback(
+            self._dispatcher.update,
+            path=KEY, state=new_state, reason=reason)
+
+    def status(self):
+        """Returns the state of the canary and its latency histogram."""
+        record = self._index.get(KEY)
+        return {
+            'state': record.state,
+            'message': record.reason,
+            'last': round(self.last, 6) if self.last is not None else None,
+            'timeouts': self.timeouts,
+            'latency': self.histogram.status(),
+        }
@@ -19,12 +19,27 @@ This class manages all of the communication between zk_monitor agents
 from zk_monitor into Zookeeper in one common module.
 """
 
+import json
 import logging
 import platform
 import os
+import time
+
+from kazoo import exceptions
+from nd_service_registry import funcs
+from tornado import gen
+from tornado import ioloop
+
+from zk_monitor import utils
+from zk_monitor.version import __version__ as VERSION
 
 log = logging.getLogger(__name__)
 
+# Default seconds between refreshes of an agent registration, and the lowest
+# interval allowed (every refresh that changes something is a write).
+ANNOUNCE_INTERVAL = 30
+MIN_ANNOUNCE_INTERVAL = 5
+
 
 class ClusterException(Exception):
     """Thrown when the Cluster state engine has an exception."""
@@ -54,9 +69,159 @@ class State(object):
         # in a degraded state (no cluster support).
         self._register_myself()
 
-    def _register_myself(self):
-        """Register myself as a zk_monitor agent."""
-        self._ndsr.set_node('%s/agents/%s' % (self._path, self._name))
+    @property
+    def name(self):
+        """Unique name of this agent in the cluster."""
+        return self._name
+
+    def _register_myself(self, data=None):
+        """Register myself as a zk_monitor agent.
+
+        The registration is an ephemeral node, so it goes away with our
+        Zookeeper session. Registering again only writes to Zookeeper if the
+        data changed.
+
+        args:
+            data: Optional dict describing this agent.
+        """
+        self._ndsr.set_node('%s/agents/%s' % (self._path, self._name),
+                            data=data)
+
+    def register(self, data):
+        """Update the data of our agent registration.
+
+        args:
+            data: Dict describing this agent (see Announcer).
+        """
+        self._register_myself(data)
+
+    def unregister(self):
+        """Remove our agent registration (eg. when shutting down)."""
+        self._ndsr.set_node('%s/agents/%s' % (self._path, self._name),
+                            state=False)
+
+    @gen.coroutine
+    def getAgents(self):
+        """Returns the registrations of all zk_monitor agents.
+
+        The agent list comes from the Service Registry's watch cache. The
+        registrations are read straight from Zookeeper, so agents that come
+        and go do not leave watches behind. Agents that cannot be read (eg.
+        because they just went away) are skipped.
+
+        returns:
+            A dict of {agent name: registration data dict}
+        """
+        agents_path = '%s/agents' % self._path
+        node = self._ndsr.get(agents_path)
+        if not node:
+            # No connection to Zookeeper, and nothing cached either
+            raise gen.Return({})
+
+        names = node['children'] or []
+        results = yield [self._getAgent('%s/%s' % (agents_path, name))
+                         for name in names]
+        agents = {}
+        for name, data in zip(names, results):
+            if data is not None:
+                agents[name] = data if isinstance(data, dict) else {}
+        raise gen.Return(agents)
+
+    @gen.coroutine
+    def _getAgent(self, path):
+        """Returns the decoded registration at path, or None."""
+        try:
+            data, _ = yield utils.kazooFuture(self._ndsr._zk.get_async, path)
+        except Exception, e:
+            log.debug('Could not read agent %s: %s' % (path, e))
+            raise gen.Return(None)
+        raise gen.Return(funcs.decode(data) or {})
+
+    @gen.coroutine
+    def putSnapshot(self, header, chunks):
+        """Publish a compliance snapshot (see zk_monitor.snapshot).
+
+        The chunks are written first, as children of the snapshot node named
+        <version>-<number>. Only then is the header written to the snapshot
+        node itself, so readers never see a header without its chunks. The
+        chunks of older versions are removed last.
+
+        args:
+            header: Dict describing the snapshot; must have a 'version'.
+            chunks: List of strings holding the snapshot data.
+        """
+        zk = self._ndsr._zk
+        base = '%s/snapshot' % self._path
+        prefix = '%s-' % header['version']
+
+        for number, chunk in enumerate(chunks):
+            yield utils.kazooFuture(
+                zk.create_async, '%s/%s%d' % (base, prefix, number), chunk,
+                None, False, False, True)
+
+        data = json.dumps(header)
+        try:
+            yield utils.kazooFuture(zk.set_async, base, data)
+        except exceptions.NoNodeError:
+            yield utils.kazooFuture(zk.create_async, base, data,
+                                    None, False, False, True)
+
+        children = yield utils.kazooFuture(zk.get_children_async, base)
+        for child in children:
+            if not child.startswith(prefix):
+                try:
+                    yield utils.kazooFuture(zk.delete_async,
+                                            '%s/%s' % (base, child))
+                except exceptions.NoNodeError:
+                    pass
+
+    @gen.coroutine
+    def getSnapshotHeader(self):
+        """Returns the header of the published snapshot, or None."""
+        try:
+            data, _ = yield utils.kazooFuture(
+                self._ndsr._zk.get_async, '%s/snapshot' % self._path)
+        except exceptions.NoNodeError:
+            raise gen.Return(None)
+        raise gen.Return(json.loads(data) if data else None)
+
+    @gen.coroutine
+    def getSnapshotChunks(self, header):
+        """Returns the list of chunks of a published snapshot.
+
+        raises:
+            kazoo.exceptions.NoNodeError: If the snapshot was replaced in the
+                                          meantime.
+        """
+        zk = self._ndsr._zk
+        base = '%s/snapshot' % self._path
+        results = yield [
+            utils.kazooFuture(zk.get_async, '%s/%s-%d' % (
+                base, header['version'], number))
+            for number in xrange(header['chunks'])]
+        raise gen.Return([data for data, _ in results])
+
+    def getCanaryPath(self):
+        """Returns the path of this agent's canary marker."""
+        return '%s/canary/%s' % (self._path, self._name)
+
+    @gen.coroutine
+    def putCanary(self, data):
+        """Write this agent's canary marker (see zk_monitor.canary).
+
+        The marker is an ephemeral node, so it goes away with our session.
+
+        args:
+            data: Dict to store in the marker.
+        """
+        zk = self._ndsr._zk
+        path = self.getCanaryPath()
+        value = json.dumps(data)
+        try:
+            yield utils.kazooFuture(zk.set_async, path, value)
+        except exceptions.NoNodeError:
+            yield utils.kazooFuture(zk.create_async, path, value,
+                                    None, True, False, True)
 
     def getLock(self, name):
         """Retreives an async Service Registry Lock object.
@@ -69,3 +234,84 @@ class State(object):
         """
         lock_path = '%s/locks/%s' % (self._path, name)
         return self._ndsr.get_lock(lock_path, self._name, wait=0)
+
+
+class Announcer(object):
+    """Keeps the registration of this agent up to date.
+
+    The registration describes the agent and its load, so that operators and
+    other agents can make decisions from one cheap read:
+
+        endpoint: Base URL of our HTTP interface.
+        version: zk_monitor version.
+        started: When this agent started.
+        paths: Number of watched paths.
+        lag: How late (seconds) the IOLoop ran its last heartbeat.
+        event_rate: Watch events per second since the previous refresh.
+
+    Values are rounded, so a refresh only writes to Zookeeper when something
+    changed noticeably, and at most once per interval.
+    """
+
+    def __init__(self, cluster_state, monitor, endpoint, heartbeat=None,
+                 interval=ANNOUNCE_INTERVAL):
+        """
+        args:
+            cluster_state: cluster.State object to register with.
+            monitor: monitor.Monitor whose load is described.
+            endpoint: Base URL of our HTTP interface.
+            heartbeat: heartbeat.Heartbeat to read the IOLoop lag from.
+            interval: Seconds between refreshes (at least
+                      MIN_ANNOUNCE_INTERVAL).
+        """
+        self._cs = cluster_state
+        self._monitor = monitor
+        self._heartbeat = heartbeat
+        self._interval = max(interval, MIN_ANNOUNCE_INTERVAL)
+        self._static = {
+            'endpoint': endpoint,
+            'version': VERSION,
+            'started': int(time.time()),
+        }
+        self._last = None
+        self._timer = None
+
+    def start(self):
+        """Register right away, then refresh every interval."""
+        self.announce()
+        self._timer = ioloop.PeriodicCallback(
+            self.announce, self._interval * 1000)
+        self._timer.start()
+
+    def stop(self):
+        """Stop refreshing, and remove our registration."""
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+        self._cs.unregister()
+
+    def describe(self):
+        """Returns the registration data describing this agent right now."""
+        now = time.time()
+        health = self._monitor.health()
+        events = health['events']
+
+        rate = 0.0
+        if self._last is not None and now > self._last[0]:
+            rate = float(events - self._last[1]) / (now - self._last[0])
+        self._last = (now, events)
+
+        data = dict(self._static)
+        data.update({
+            'paths': health['paths'],
+            'lag': round(self._heartbeat.lag, 2) if self._heartbeat else None,
+            'event_rate': round(rate, 1),
+        })
+        return data
+
+    def announce(self):
+        """Refresh our registration."""
+        try:
+            self._cs.register(self.describe())
+        except Exception:
+            log.exception('Could not update our agent registration')
@@ -0,0 +1,70 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+IOLoop liveness tracking.
+
+A periodic callback on the IOLoop records when it last ran, and how late it
+ran compared to when it was due. A blocked or overloaded IOLoop shows up as a
+growing age of the last beat, or as lag.
+"""
+
+import time
+
+from tornado import ioloop
+
+# Default seconds between beats, and the age after which the IOLoop is
+# considered stuck.
+INTERVAL = 1
+STALL = 10
+
+
+class Heartbeat(object):
+    """Beats on the IOLoop at a fixed interval."""
+
+    def __init__(self, interval=INTERVAL, stall=STALL):
+        """
+        args:
+            interval: Seconds between beats.
+            stall: Seconds without a beat after which alive() is False.
+        """
+        self.interval = interval
+        self.stall = stall
+        self.last = time.time()
+        self.lag = 0.0
+        self._timer = None
+
+    def start(self):
+        """Begin beating on the current IOLoop."""
+        self.last = time.time()
+        self._timer = ioloop.PeriodicCallback(
+            self._beat, self.interval * 1000)
+        self._timer.start()
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    def _beat(self):
+        now = time.time()
+        self.lag = max(0.0, now - self.last - self.interval)
+        self.last = now
+
+    def age(self):
+        """Returns the seconds since the last beat."""
+        return time.time() - self.last
+
+    def alive(self):
+        """Returns True unless the IOLoop has not beaten for too long."""
+        return self.age() < self.stall
@@ -0,0 +1,248 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Latency and throughput of our Zookeeper operations.
+
+To tell whether slow alerts come from the ensemble or from zk_monitor itself,
+the Service Registry used by the Monitor, the cluster.State and (through its
+lock) the Dispatcher is wrapped in a Registry that counts and times every:
+
+    get         read of a path (served from the Service Registry cache)
+    watch       registration of a watch on a path
+    watch_fire  run of our callback when a watch fires
+    set_node    write of a node (eg. our agent registration)
+    lock        creation, acquisition or release of a lock
+
+per operation and path prefix (the first few components of the path). The
+hot path only takes two timestamps and stores them in a fixed size ring;
+percentiles are only computed when asked for.
+"""
+
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Default number of path components making up a prefix, and the number of
+# recent samples kept per operation and prefix for the percentiles.
+DEPTH = 2
+SAMPLES = 1024
+
+# Percentiles reported in every summary
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(ordered, percent):
+    """Returns the nearest-rank percentile of a sorted list."""
+    rank = int(len(ordered) * percent / 100.0 + 0.5)
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class Recorder(object):
+    """Counts and samples the durations of one operation on one prefix."""
+
+    __slots__ = ('count', 'errors', 'total', '_durations', '_times', '_lock')
+
+    def __init__(self, samples=SAMPLES):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self._durations = [None] * samples
+        self._times = [None] * samples
+        self._lock = threading.Lock()
+
+    def record(self, duration, now, error=False):
+        with self._lock:
+            slot = self.count % len(self._durations)
+            self._durations[slot] = duration
+            self._times[slot] = now
+            self.count += 1
+            self.total += duration
+            if error:
+                self.errors += 1
+
+    def summary(self, now=None):
+        """Returns the counts, the recent rate and latency percentiles.
+
+        The rate and percentiles are computed over the samples in the ring,
+        ie. the most recent operations.
+        """
+        now = now or time.time()
+        with self._lock:
+            durations = [d for d in self._durations if d is not None]
+            times = [t for t in self._times if t is not None]
+            count, errors, total = self.count, self.errors, self.total
+
+        summary = {'count': count, 'errors': errors}
+        if not durations:
+            return summary
+
+        durations.sort()
+        summary.update({
+            'mean': round(total / count, 6),
+            'max': round(durations[-1], 6),
+            'rate': round(len(durations) / max(now - min(times), 1.0), 2),
+        })
+        for percent in PERCENTILES:
+            summary['p%d' % percent] = round(
+                percentile(durations, percent), 6)
+        return summary
+
+
+class OperationStats(object):
+    """Recorders for every operation and path prefix seen."""
+
+    def __init__(self, depth=DEPTH, samples=SAMPLES, statsd=None):
+        """
+        args:
+            depth: Number of path components that make up a prefix.
+            samples: Number of recent samples kept per operation and prefix.
+            statsd: statsd.StatsD to report every operation to as well.
+        """
+        self._depth = depth
+        self._samples = samples
+        self._statsd = statsd
+        self._recorders = {}
+        self._lock = threading.Lock()
+
+    def prefix(self, path):
+        """Returns the first `depth` components of a path."""
+        parts = path.split('/', self._depth + 1)
+        return '/'.join(parts[:self._depth + 1]) or '/'
+
+    def record(self, operation, path, began, error=False):
+        """Record an operation that started at `began` and just finished.
+
+        args:
+            operation: Name of the operation (eg. 'get').
+            path: The path it was done on.
+            began: time.time() when it started.
+            error: Whether it raised.
+        """
+        now = time.time()
+        key = (operation, self.prefix(path))
+        recorder = self._recorders.get(key)
+        if recorder is None:
+            with self._lock:
+                recorder = self._recorders.setdefault(
+                    key, Recorder(self._samples))
+        recorder.record(now - began, now, error)
+        if self._statsd:
+            self._statsd.timing('zookeeper.%s' % operation, now - began,
+                                tags={'prefix': key[1]})
+
+    def summary(self):
+        """Returns {operation: {prefix: summary}} for everything recorded."""
+        now = time.time()
+        summary = {}
+        for (operation, prefix), recorder in self._recorders.items():
+            summary.setdefault(operation, {})[prefix] = recorder.summary(now)
+        return summary
+
+
+class Lock(object):
+    """Times the acquisition and release of a Service Registry lock."""
+
+    def __init__(self, lock, path, stats):
+        self._lock = lock
+        self._path = path
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._lock, name)
+
+    def _timed(self, method):
+        began = time.time()
+        try:
+            result = method()
+        except Exception:
+            self._stats.record('lock', self._path, began, error=True)
+            raise
+        self._stats.record('lock', self._path, began)
+        return result
+
+    def acquire(self):
+        return self._timed(self._lock.acquire)
+
+    def release(self):
+        return self._timed(self._lock.release)
+
+    def status(self):
+        # In-memory, and asked for all the time; not worth recording
+        return self._lock.status()
+
+
+class Registry(object):
+    """Wraps a Service Registry, recording the operations done through it.
+
+    Everything not recorded is passed through to the Service Registry.
+    """
+
+    def __init__(self, ndsr, stats):
+        """
+        args:
+            ndsr: A KazooServiceRegistry object
+            stats: OperationStats to record into.
+        """
+        self._ndsr = ndsr
+        self._stats = stats
+
+        # The Service Registry only registers a callback once per path, so
+        # every callback must always be wrapped by the same function.
+        self._callbacks = {}
+
+    def __getattr__(self, name):
+        return getattr(self._ndsr, name)
+
+    def _wrap(self, callback):
+        """Returns a callback that records the time spent in `callback`."""
+        wrapped = self._callbacks.get(callback)
+        if wrapped is None:
+            stats = self._stats
+
+            def wrapped(data):
+                began = time.time()
+                try:
+                    return callback(data)
+                finally:
+                    stats.record('watch_fire', data.get('path') or '/',
+                                 began)
+            self._callbacks[callback] = wrapped
+        return wrapped
+
+    def _timed(self, operation, path, method, *args, **kwargs):
+        began = time.time()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            self._stats.record(operation, path, began, error=True)
+            raise
+        self._stats.record(operation, path, began)
+        return result
+
+    def get(self, path, callback=None):
+        if callback is None:
+            return self._timed('get', path, self._ndsr.get, path)
+        return self._timed('watch', path, self._ndsr.get, path,
+                           callback=self._wrap(callback))
+
+    def set_node(self, node, *args, **kwargs):
+        return self._timed('set_node', node, self._ndsr.set_node, node,
+                           *args, **kwargs)
+
+    def get_lock(self, path, *args, **kwargs):
+        lock = self._timed('lock', path, self._ndsr.get_lock, path,
+                           *args, **kwargs)
+        return Lock(lock, path, self._stats)
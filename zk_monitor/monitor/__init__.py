@@ -20,13 +20,29 @@ their state, compliance is validated and the appropriate alerts are dispatched.
 """
 
 import logging
+import threading
+import time
 
+from nd_service_registry.watcher import DummyWatcher
+from tornado import gen
 from tornado.ioloop import IOLoop
 
+from zk_monitor import utils
+from zk_monitor.monitor import arming
+from zk_monitor.monitor import history
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import payloads
+from zk_monitor.monitor import priority
+from zk_monitor.monitor import reconcile
+from zk_monitor.monitor import rules
+from zk_monitor.monitor import scheduler
 from zk_monitor.monitor import states
 
 log = logging.getLogger(__name__)
 
+# Number of paths evaluated by a resync pass before yielding to the IOLoop
+RESYNC_BATCH = 100
+
 
 class InvalidConfigException(Exception):
     pass
@@ -35,7 +51,13 @@ class InvalidConfigException(Exception):
 class Monitor(object):
     """Main object used for monitoring nodes in Zookeeper."""
 
-    def __init__(self, dispatcher, ndsr, cs, paths):
+    def __init__(self, dispatcher, ndsr, cs, paths, coalesce_window=0,
+                 index=None, payload_concurrency=payloads.CONCURRENCY,
+                 history_size=history.SIZE, reconcile_interval=0,
+                 reconcile_rate=reconcile.RATE,
+                 reconcile_concurrency=reconcile.CONCURRENCY, watch_rate=0,
+                 watch_jitter=arming.JITTER, priorities=None, watch=True,
+                 statsd=None):
         """Initialize the object and our watches.
 
         args:
@@ -44,21 +66,134 @@ class Monitor(object):
             paths: A dict of paths to monitor.
                    eg: { '/foo': { 'children': 1 },
                          '/bar': { 'children': 2 } }
+            coalesce_window: Seconds to hold a path update before evaluating
+                             it, so that a burst of watch events on the same
+                             path collapses into a single evaluation. 0
+                             evaluates every update immediately.
+            index: pathstate.PathIndex shared with the Dispatcher. A private
+                   one is created if not supplied.
+            payload_concurrency: Maximum number of in-flight Zookeeper reads
+                                 of child data for payload rules.
+            history_size: Number of evaluations remembered per path.
+            reconcile_interval: Seconds between sweeps that compare every
+                                path against Zookeeper to catch missed
+                                watches. 0 disables the sweeps.
+            reconcile_rate: Maximum number of paths checked per second by a
+                            sweep.
+            reconcile_concurrency: Maximum number of paths checked at once by
+                                   a sweep.
+            watch_rate: Maximum number of watches registered per second
+                        (highest priority paths first). 0 registers them all
+                        right away.
+            watch_jitter: Maximum random delay before paced watch
+                          registration starts.
+            priorities: priority.Priorities shared with the Dispatcher. They
+                        are resolved from paths if not supplied.
+            watch: Whether to watch (and evaluate) the paths right away. If
+                   False, nothing is watched until start_watching() is
+                   called.
+            statsd: statsd.StatsD to report watch events, evaluations, state
+                    transitions and child counts to.
         """
-        log.debug('Initializing Monitor with Service Registry %s' % ndsr)
+        log.debug('Initializing Monitor with Service Registry %s', ndsr)
         self._dispatcher = dispatcher
         self._ndsr = ndsr
         self._cs = cs
         self._paths = paths
-
-        # Validate the supplied path configs
-        self._validatePaths(paths)
-
-        # Immediately register a watcher on the connection state
+        self._coalesce_window = coalesce_window
+        self._index = index if index is not None else pathstate.PathIndex()
+        self._statsd = statsd
+
+        # Child data is only ever fetched for paths with payload rules
+        self._payload_cache = payloads.PayloadCache(ndsr, payload_concurrency)
+
+        # Fixed size per-path history of every evaluation
+        self._history = history.HistoryStore(history_size)
+
+        # Paths with time based rules (eg. max_age) are re-evaluated by one
+        # shared scheduler when their next deadline passes, not by polling.
+        self._deadlines = scheduler.DeadlineScheduler(self._deadlineExpired)
+
+        # Latest update data for every path that is waiting out its coalesce
+        # window. Watch callbacks arrive on the Kazoo threads while the window
+        # is flushed on the IOLoop, hence the lock.
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+        # While disconnected from Zookeeper nothing is evaluated; paths that
+        # saw an update in the meantime are remembered here. After
+        # (re)connecting, one resync pass evaluates every path and collects
+        # the dispatcher updates in _deferred until it is done.
+        self._stale = set()
+        self._deferred = None
+        self._resync_again = False
+
+        # Paths that were never evaluated yet. Until it is empty (and no
+        # resync pass is running) we are not ready to be trusted.
+        self._watching = watch
+        self._unevaluated = set(paths) if watch else set()
+
+        # Bumped whenever the state or reason of a path changes
+        self._changes = 0
+
+        # Number of watch events received, for load reporting
+        self._events = 0
+
+        # {path: callback} of paths watched on behalf of someone else (see
+        # probe()); they are never evaluated.
+        self._probes = {}
+
+        # Validate the supplied path configs, compiling them into the rules
+        # that every evaluation of a path is checked against.
+        self._rules = self._validatePaths(paths)
+        if priorities is None:
+            try:
+                priorities = priority.Priorities(paths)
+            except priority.InvalidPriorityException, e:
+                raise InvalidConfigException(str(e))
+        self._priorities = priorities
+
+        # Watches are registered through a paced queue if asked to
+        self._armer = None
+        if watch_rate:
+            self._armer = arming.WatchArmer(
+                self._watchPath, rate=watch_rate, jitter=watch_jitter)
+
+        # Immediately register a watcher on the connection state. The
+        # Service Registry calls the listener right away, before get_state()
+        # returns; None marks the state as not known yet, so that first call
+        # does not count as a reconnect.
+        self._session = None
+        self._state = None
         self._state = self._ndsr.get_state(self._stateListener)
 
         # Generate watches on those paths
-        self._watchPaths(paths.keys())
+        if watch:
+            self._watchPaths(paths.keys())
+
+        # Periodically make sure that none of those watches went missing
+        self._reconciler = None
+        if reconcile_interval:
+            self._reconciler = reconcile.Reconciler(
+                ndsr, self._paths, self._index,
+                rearm=self._rearmWatch,
+                reevaluate=lambda path: self._evaluatePath({'path': path}),
+                interval=reconcile_interval,
+                rate=reconcile_rate,
+                concurrency=reconcile_concurrency)
+            if watch:
+                self._reconciler.start()
+
+    def start_watching(self):
+        """Watch and evaluate all paths, if we are not doing so yet."""
+        if self._watching:
+            return
+        log.warning('Starting to watch all %d paths', len(self._paths))
+        self._watching = True
+        self._unevaluated.update(self._paths)
+        self._watchPaths(self._paths.keys())
+        if self._reconciler:
+            self._reconciler.start()
 
     def _stateListener(self, state):
         """Executed any time the connection state changes.
@@ -66,82 +201,243 @@ class Monitor(object):
         args:
             state: Boolean of the new connection state.
         """
-        log.info('Service registry connection state: %s' % state)
+        log.info('Service registry connection state: %s', state)
+        was_connected = self._state
         self._state = state
 
+        if state and was_connected is False:
+            IOLoop.current().add_callback(self._resync)
+
+        # A new session id means the old session expired
+        if state and self._armer is not None:
+            session = getattr(self._ndsr._zk, 'client_id', None)
+            if self._session is not None and session != self._session:
+                IOLoop.current().add_callback(self._rearmExpired)
+            self._session = session
+
     def _validateConfig(self, config):
-        """Validate a single path configuration setting.
+        """Validate and compile a single path configuration setting.
 
         args:
             config: A dict with the path and the appropriate settings.
                     eg. { 'children': 1, }
 
+        returns:
+            A rules.RuleSet, or None if the config has no rules (in which
+            case we just watch the path and do nothing with it).
+
         raises:
             InvalidConfigException: If the configuration config is invalid.
         """
-        log.debug('Validating supplied config: %s' % config)
+        log.debug('Validating supplied config: %s', config)
 
-        # If there are no config keys at all, then we just watch the
-        # path and do nothing with it.
-        if not config:
-            return
-
-        # if there is a children setting, ensure its a number
-        if 'children' in config:
-            if not isinstance(config['children'], int):
-                raise InvalidConfigException(
-                    'Invalid children setting: %s' % config['children'])
+        try:
+            return rules.compile(config)
+        except rules.InvalidRuleException, e:
+            raise InvalidConfigException(str(e))
 
     def _validatePaths(self, paths):
-        """Validate a dict of paths/configs.
+        """Validate and compile a dict of paths/configs.
 
         args:
             paths: A dict of paths to monitor.
                    eg: { '/foo': { 'children': 1 },
                          '/bar': { 'children': 2 } }
 
+        returns:
+            A dict of paths to their rules.RuleSet (or None).
+
         raises:
             InvalidConfigException: If any part of the config is invalid.
         """
-        log.debug('Validating supplied paths: %s' % paths)
+        log.debug('Validating supplied paths: %s', paths)
 
+        compiled = {}
         if not paths:
-            return
+            return compiled
 
         for path, config in paths.iteritems():
             try:
-                self._validateConfig(config)
+                compiled[path] = self._validateConfig(config)
             except InvalidConfigException, e:
-                log.error('Error reading config for path %s: %s' % (path, e))
+                log.error('Error reading config for path %s: %s', path, e)
                 raise
 
-    def _watchPaths(self, paths):
+        return compiled
+
+    def _watchPaths(self, paths, jitter=True):
         """Add a series of Zookeeper watches for the paths supplied.
 
         args:
             paths: A list of paths to watch
+            jitter: Whether paced registration waits for a random delay
+                    first (see arming.WatchArmer.add).
         """
 
         # Now begin watching our paths, using the above callback
         # function when a path is updated.
         for path in paths:
-            log.debug('Asking to watch %s' % path)
-            self._ndsr.get(path, callback=self._pathUpdateCallback)
+            if self._armer is not None:
+                self._armer.add(path, self._priority(path), jitter=jitter)
+            else:
+                self._watchPath(path)
+
+    def _watchPath(self, path):
+        """Add a Zookeeper watch for a single path.
+
+        args:
+            path: The path to watch
+        """
+        if path not in self._paths:
+            # Removed while waiting to be armed
+            return
+        log.debug('Asking to watch %s', path)
+        self._ndsr.get(path, callback=self._pathUpdateCallback)
+
+    def _priority(self, path):
+        """Returns the priority of a path (higher goes first)."""
+        return self._priorities.get(path)
+
+    def _rearmExpired(self):
+        """Re-register the watches that did not survive a session expiry.
+
+        The Service Registry restores the watches it can by itself. Paths it
+        could not restore are left with no (or a placeholder) watcher; those
+        are queued for paced re-registration.
+        """
+        if not self._watching:
+            return
+        missing = []
+        for path in self._paths:
+            watcher = self._ndsr._watchers.get(path)
+            if watcher is None or isinstance(watcher, DummyWatcher):
+                missing.append(path)
+        log.warning('Session expired, re-registering %d watches',
+                    len(missing))
+        for path in missing:
+            self._rearmWatch(path, paced=True)
+
+    def _rearmWatch(self, path, paced=False):
+        """Replace the Service Registry watcher of a path with a new one.
+
+        args:
+            path: The path whose watch went missing.
+            paced: Queue the new watch for paced registration (if enabled),
+                   rather than registering it right away.
+        """
+        utils.stopWatcher(self._ndsr, path)
+        if paced:
+            self._watchPaths([path])
+        else:
+            self._watchPath(path)
 
     def _pathUpdateCallback(self, data, _unit_test=False):
         """Executed when one of our watched paths is updated.
 
-        This method receives updates from the Service Registry when
-        a path changes, calls out to the _get_compliance() method, and
-        updates the dispatcher with the new status and message.
+        This method receives updates from the Service Registry when a path
+        changes. If no coalesce window is configured the update is evaluated
+        right away. Otherwise only the first update of a burst schedules an
+        evaluation; any further updates that arrive within the window just
+        replace the pending data, so the evaluation sees the latest one.
 
         args:
             data: The data returned by the Service Registry.
             _unit_test: Boolean that changes the return value. Read comments on
                         the bottom.
         """
+        self._events += 1
+        if self._statsd:
+            self._statsd.incr('monitor.events')
+        if not self._coalesce_window:
+            self._evaluatePath(data)
+            return
+
+        with self._pending_lock:
+            scheduled = data['path'] in self._pending
+            self._pending[data['path']] = data
+
+        if not scheduled:
+            IOLoop.current().add_callback(
+                self._scheduleEvaluation, data['path'])
+
+    def _scheduleEvaluation(self, path):
+        """Start the coalesce window for a path on the IOLoop.
+
+        args:
+            path: The path that has a pending update.
+        """
+        IOLoop.current().add_timeout(
+            time.time() + self._coalesce_window, self._flushPath, path)
+
+    def _flushPath(self, path):
+        """Evaluate the most recent pending update for a path.
+
+        args:
+            path: The path whose coalesce window just closed.
+        """
+        with self._pending_lock:
+            data = self._pending.pop(path, None)
+
+        if data is not None:
+            self._evaluatePath(data)
+
+    def _evaluatePath(self, data):
+        """Check the compliance of an updated path and notify the dispatcher.
+
+        Paths with payload rules first bring their cached child data up to
+        date (asynchronously), everything else is evaluated right away.
+
+        args:
+            data: The data returned by the Service Registry.
+        """
         path = data['path']
 
+        probe = self._probes.get(path)
+        if probe is not None:
+            IOLoop.current().add_callback(probe, data)
+            return
+
+        # A late callback of a watch on a path that was removed since, or
+        # a path we do not watch (yet)
+        if path not in self._paths or not self._watching:
+            return
+
+        # Whatever we would read while disconnected is stale. The path is
+        # evaluated by the resync pass once we are connected again.
+        if not self._state:
+            with self._pending_lock:
+                self._stale.add(path)
+            return
+
+        ruleset = self._rules.get(path)
+        if ruleset is not None and ruleset.needs_payloads:
+            IOLoop.current().add_callback(self._refreshPayloads, path)
+            return
+
+        self._updateState(path)
+
+    @gen.coroutine
+    def _refreshPayloads(self, path):
+        """Refresh the cached child data of a path, then evaluate it.
+
+        args:
+            path: The path that was updated.
+        """
+        children = self._ndsr.get(path)['children'] or []
+        yield self._payload_cache.refresh(path, children)
+        self._updateState(path)
+
+    def _updateState(self, path):
+        """Evaluate a path and notify the dispatcher of any state change.
+
+        Calls out to the _get_compliance() method, and updates the dispatcher
+        with the new status and message.
+
+        args:
+            path: The path to evaluate.
+        """
+        if path not in self._paths:
+            return
         new_state, reason = self._get_compliance(path)
 
         # NOTE: temporarily grab the old state, then update local knowledge to
@@ -150,12 +446,121 @@ class Monitor(object):
         # available only when coming into this method.
         old_state = self._path_state(path)
         self._path_state(path, new_state)
+        self._unevaluated.discard(path)
+
+        record = self._index.get(path)
+        if old_state != new_state or record.reason != reason:
+            record.reason = reason
+            self._changes += 1
+        self._history.record(path, record.updated, record.count, new_state)
+
+        if self._statsd:
+            self._statsd.incr('monitor.evaluations')
+            if record.count is not None:
+                self._statsd.gauge('path.children', record.count,
+                                   tags={'path': path})
+            if old_state != new_state:
+                self._statsd.incr('monitor.transitions',
+                                  tags={'state': new_state})
+
+        log.debug('Path %s changed from %s to %s', path, old_state, new_state)
+
+        deferred = self._deferred
+        if deferred is not None:
+            # Keep the state from before the resync pass, and the latest
+            # verdict. They are sent once the pass is complete.
+            first = deferred.get(path, (old_state,))[0]
+            deferred[path] = (first, new_state, reason)
+            return
 
-        log.debug('Path %s changed from %s to %s' % (
-            path, old_state, new_state))
         if self._should_update_dispatcher(old_state, new_state):
             self.issue_dispatch_update(path, new_state, reason)
 
+    @gen.coroutine
+    def _resync(self):
+        """Re-evaluate every path in one pass after (re)connecting.
+
+        Instead of a flood of evaluations and dispatcher updates as the
+        watches fire again one by one, every path is evaluated once, in order
+        of priority. No dispatcher updates are sent until the pass is done;
+        then only the paths whose state actually changed compared to before
+        the pass are sent.
+        """
+        if self._deferred is not None:
+            # A pass is already running, have it go around once more.
+            self._resync_again = True
+            return
+
+        log.info('Re-evaluating all %d paths', len(self._paths))
+        self._deferred = {}
+        try:
+            self._resync_again = True
+            while self._resync_again and self._state:
+                self._resync_again = False
+                with self._pending_lock:
+                    stale, self._stale = self._stale, set()
+                yield self._evaluateAll(self._resyncOrder(stale))
+        finally:
+            deferred, self._deferred = self._deferred, None
+
+        changed = 0
+        for path in sorted(deferred, key=self._priority, reverse=True):
+            old_state, new_state, reason = deferred[path]
+            if old_state == new_state:
+                continue
+            changed += 1
+            if self._should_update_dispatcher(old_state, new_state):
+                self.issue_dispatch_update(path, new_state, reason)
+        log.info('Re-evaluation done, %d paths changed state', changed)
+
+    def _resyncOrder(self, stale):
+        """Returns all paths in the order a resync pass evaluates them.
+
+        Higher priority paths come first. Within a priority, paths that saw
+        updates while we were disconnected come first, then the paths that
+        are not OK, then everything else.
+        """
+        def order(path):
+            return (-self._priority(path),
+                    path not in stale,
+                    self._index.get(path).state == states.OK,
+                    path)
+        return sorted(self._paths, key=order)
+
+    @gen.coroutine
+    def _evaluateAll(self, paths):
+        """Evaluate a list of paths, yielding to the IOLoop in between.
+
+        args:
+            paths: The paths to evaluate, in order.
+        """
+        refreshes = []
+        for i, path in enumerate(paths):
+            if not self._state:
+                with self._pending_lock:
+                    self._stale.update(paths[i:])
+                break
+
+            ruleset = self._rules.get(path)
+            if ruleset is not None and ruleset.needs_payloads:
+                refreshes.append(self._refreshPayloads(path))
+            else:
+                self._updateState(path)
+
+            if (i + 1) % RESYNC_BATCH == 0:
+                yield gen.moment
+
+        yield refreshes
+
+    def _deadlineExpired(self, path):
+        """Re-evaluate a path once one of its time based rules may fail.
+
+        args:
+            path: The path whose deadline passed.
+        """
+        log.debug('Deadline for %s passed, re-evaluating', path)
+        self._evaluatePath({'path': path})
+
     def issue_dispatch_update(self, path, new_state, reason):
         """Update dispatcher in a async-coroutine fashion.
 
@@ -171,41 +576,53 @@ class Monitor(object):
             self._dispatcher.update,
             path=path, state=new_state, reason=reason)
 
-    def _get_compliance(self, path):
+    def _get_compliance(self, path, record=True):
         """Check if a given path is currently within spec.
 
         args:
             path: The path to validate (must exist in self._paths)
+            record: If False, the check leaves no trace: rules with a
+                    history do not remember it, and no deadline is armed.
 
         returns: tuple
             monitor.states: Message describing current status.
             string: reason for the state above.
         """
-        # Begin with no errors
-        state = states.UNKNOWN
-        reason = 'No information is available about this path.'
-
-        # Load up the requirements for this path
-        config = self._paths[path]
-
-        # If there is a minimum 'children' amount, check that.
-        if config and 'children' in config:
-            # TODO: Pass in all needed data to _get_compliance() so it doesn't
-            # make direct SR calls.
-            count = len(self._ndsr.get(path)['children'])
-            log.debug('Comparing %s min children (%s) to current count (%s).' %
-                      (path, config['children'], count))
-            if count < config['children']:
-                state = states.ERROR
-                reason = ('%s children is less than minimum %s' %
-                          (count, config['children']))
-                log.debug(reason)
+        ruleset = self._rules.get(path)
+
+        # Paths without any rules are just watched.
+        if ruleset is None:
+            return (states.UNKNOWN,
+                    'No information is available about this path.')
+
+        # TODO: Pass in all needed data to _get_compliance() so it doesn't
+        # make direct SR calls.
+        data = self._ndsr.get(path)
+        count = len(data['children'] or [])
+        self._index.get(path).count = count
+
+        # Payload rules only ever look at the cache, they never fetch.
+        child_payloads = None
+        if ruleset.needs_payloads:
+            child_payloads = self._payload_cache.get(path)
+
+        sample = rules.Sample(count, time.time(), child_payloads, data['stat'],
+                              record=record)
+        reasons = ruleset.check(sample)
+
+        # Arm the next deadline of any time based rules
+        if ruleset.timed and record:
+            deadline = ruleset.deadline(sample)
+            if deadline is None:
+                self._deadlines.cancel(path)
             else:
-                state = states.OK
-                reason = 'All checks pass.'
+                self._deadlines.schedule(path, deadline)
+        if reasons:
+            reason = '; '.join(reasons)
+            log.debug('%s: %s', path, reason)
+            return states.ERROR, reason
 
-        # Done checking things..
-        return state, reason
+        return states.OK, 'All checks pass.'
 
     def _should_update_dispatcher(self, old_state, new_state):
         # Most conditions should update the dispatcher except a couple
@@ -225,25 +642,226 @@ class Monitor(object):
 
     def _path_state(self, path, new_state=None):
         """Get or set a local knowledge of a path state."""
+        record = self._index.get(path)
 
         if new_state:
-            self._paths[path]['state'] = new_state
+            now = time.time()
+            if new_state != record.state:
+                record.changed = now
+            record.state = new_state
+            record.updated = now
+
+        return record.state
 
-        return self._paths[path].get('state', states.UNKNOWN)
+    def __contains__(self, path):
+        """Whether a path is monitored by us."""
+        return path in self._paths
+
+    def validate(self, config):
+        """Validate a single path configuration, priority included.
+
+        args:
+            config: Its configuration dict (or None to just watch it).
+
+        returns:
+            A rules.RuleSet, or None if the config has no rules.
+
+        raises:
+            InvalidConfigException: If the config is invalid.
+        """
+        ruleset = self._validateConfig(config)
+        if isinstance(config, dict) and 'priority' in config:
+            try:
+                priority.parse(config['priority'])
+            except priority.InvalidPriorityException, e:
+                raise InvalidConfigException(str(e))
+        return ruleset
+
+    def set_path(self, path, config):
+        """Start monitoring a path, or change the config of a monitored one.
+
+        Only the state of this one path is touched. A new path gets a watch
+        of its own, a monitored one keeps its watch and is re-evaluated
+        against its new rules.
+
+        args:
+            path: The path to monitor.
+            config: Its configuration dict (or None to just watch it).
+
+        returns:
+            True if the path was not monitored before.
+
+        raises:
+            InvalidConfigException: If the config is invalid. Nothing is
+                                    changed in that case.
+        """
+        ruleset = self.validate(config)
+        self._priorities.set(path, config)
+
+        new = path not in self._paths
+        log.info('%s monitored path %s', 'Adding' if new else 'Updating',
+                 path)
+        self._paths[path] = config
+        self._rules[path] = ruleset
+
+        # Anything derived from the old rules is evaluated again
+        self._deadlines.cancel(path)
+        if ruleset is None or not ruleset.needs_payloads:
+            self._payload_cache.forget(path)
+
+        if new:
+            if self._watching:
+                self._unevaluated.add(path)
+                self._watchPaths([path], jitter=False)
+        else:
+            self._evaluatePath({'path': path})
+        return new
+
+    def get_path(self, path):
+        """Returns the config of a monitored path.
+
+        raises:
+            KeyError: If the path is not monitored.
+        """
+        return self._paths[path]
+
+    def remove_path(self, path):
+        """Stop monitoring a path, and drop everything known about it.
+
+        args:
+            path: The monitored path.
+
+        returns:
+            False if the path was not monitored.
+        """
+        if path not in self._paths:
+            return False
+
+        log.info('Removing monitored path %s', path)
+        del self._paths[path]
+        self._rules.pop(path, None)
+        self._priorities.remove(path)
+        utils.stopWatcher(self._ndsr, path)
+
+        self._deadlines.cancel(path)
+        self._payload_cache.forget(path)
+        self._history.forget(path)
+        self._index.remove(path)
+        self._unevaluated.discard(path)
+        with self._pending_lock:
+            self._pending.pop(path, None)
+            self._stale.discard(path)
+        if self._deferred is not None:
+            self._deferred.pop(path, None)
+        self._changes += 1
+        return True
+
+    def probe(self, path, callback):
+        """Watch a path that is not monitored, on someone else's behalf.
+
+        Updates of the path travel the same way as those of monitored paths
+        (including the coalesce window), but instead of being evaluated they
+        are handed to the callback on the IOLoop.
+
+        args:
+            path: The path to watch.
+            callback: Function called with the Service Registry data of every
+                      update of the path.
+        """
+        self._probes[path] = callback
+        self._ndsr.get(path, callback=self._pathUpdateCallback)
+
+    def unprobe(self, path):
+        """Stop watching a path registered with probe()."""
+        if self._probes.pop(path, None) is None:
+            return
+        utils.stopWatcher(self._ndsr, path)
+
+    def history(self, path, since=None, points=None):
+        """Returns the evaluation history of a monitored path.
+
+        args:
+            path: The monitored path.
+            since: Only return entries newer than this timestamp.
+            points: Downsample to at most this many entries.
+
+        returns:
+            A list of [timestamp, count, state] lists (see
+            history.History.series), or None if the path is not monitored.
+        """
+        if path not in self._paths:
+            return None
+
+        path_history = self._history.get(path)
+        if path_history is None:
+            return []
+
+        return path_history.series(since=since, points=points)
+
+    def health(self):
+        """Returns a dict of cheap, in-memory health flags.
+
+        Unlike status(), this takes the same (short) time no matter how many
+        paths are monitored, and never talks to Zookeeper.
+
+        returns:
+            connected: Whether we are connected to Zookeeper.
+            warm: Whether every path has been evaluated, no resync pass is
+                  running and no watches are waiting to be registered.
+            paths: Number of monitored paths.
+            events: Number of watch events received so far.
+            changes: Number of changes of path states (or reasons) so far.
+            watching: Whether the paths are watched at all.
+        """
+        pending = len(self._armer) if self._armer is not None else 0
+        warm = (not self._unevaluated and self._deferred is None and
+                not pending)
+        return {
+            'connected': bool(self._state),
+            'warm': warm,
+            'paths': len(self._paths),
+            'events': self._events,
+            'changes': self._changes,
+            'watching': self._watching,
+        }
+
+    def compliance(self):
+        """Returns the state of every path as of its last evaluation.
+
+        Unlike status(), nothing is evaluated again.
+
+        returns:
+            A dict of {path: (state, reason)}
+        """
+        compliance = {}
+        for path in self._paths:
+            record = self._index.get(path)
+            compliance[path] = (record.state, record.reason)
+        return compliance
 
     def status(self):
         """Returns a dict with our current status."""
         # Begin our status dict
         status = {}
 
-        # For every path we are watching, get the live compliance status
+        # For every path we are watching, get the live compliance status.
+        # Asking must not change what the next evaluation finds.
         status['compliance'] = {}
 
         for path in self._paths:
-            state, reason = self._get_compliance(path)
+            if self._watching:
+                state, reason = self._get_compliance(path, record=False)
+            else:
+                state, reason = states.UNKNOWN, 'Not watched by this agent.'
             status['compliance'][path] = {}
             status['compliance'][path]['state'] = state
             status['compliance'][path]['message'] = reason
 
+        if self._reconciler:
+            status['reconciler'] = self._reconciler.status()
+
+        if self._armer is not None:
+            status['watches'] = self._armer.status()
+
         # Return the whole thing
         return status
@@ -0,0 +1,210 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Optional fleet-wide anomaly detection over child counts.
+
+Rather than judging every path against a hand tuned threshold, this samples
+the child count of every monitored path on a timer into one NumPy matrix
+(one row per path, one column per sample, used as a ring). Each sample
+computes the baseline (mean and standard deviation) of every path and the
+z-score of its current count in a single vectorized pass. Paths whose z-score
+crosses the threshold are handed to the Dispatcher in the ANOMALY state.
+
+Anomalies are only raised for paths whose rules consider them OK -- a path
+that is already in ERROR is alerting anyway.
+
+Requires NumPy, which is not a hard dependency of zk_monitor.
+"""
+
+import bisect
+import logging
+import warnings
+
+from tornado import ioloop
+
+from zk_monitor.monitor import states
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = logging.getLogger(__name__)
+
+# Defaults: sample every minute, keep an hour of samples, require at least 10
+# of them before judging a path, and flag anything 4 standard deviations off.
+INTERVAL = 60
+SAMPLES = 60
+MIN_SAMPLES = 10
+THRESHOLD = 4.0
+
+# Floor for the standard deviation, so that a path that has had the exact
+# same count for an hour does not flag a change of a single child.
+MIN_STDDEV = 1.0
+
+
+class AnomalyException(Exception):
+    """Raised when the anomaly detector can not be used."""
+
+
+class AnomalyDetector(object):
+    """Vectorized z-score anomaly detection over all monitored paths."""
+
+    def __init__(self, paths, index, dispatcher, interval=INTERVAL,
+                 samples=SAMPLES, min_samples=MIN_SAMPLES,
+                 threshold=THRESHOLD):
+        """Initialize the detector.
+
+        args:
+            paths: List of monitored paths.
+            index: pathstate.PathIndex the Monitor keeps child counts in.
+            dispatcher: alerts.dispatcher.Dispatcher object.
+            interval: Seconds between samples.
+            samples: Number of samples kept per path for the baseline.
+            min_samples: Samples required before a path can be flagged.
+            threshold: Absolute z-score at which a path is flagged.
+
+        raises:
+            AnomalyException: If NumPy is not installed.
+        """
+        if numpy is None:
+            raise AnomalyException('Anomaly detection requires numpy')
+
+        self._paths = sorted(paths)
+        self._index = index
+        self._dispatcher = dispatcher
+        self._interval = interval
+        self._min_samples = min_samples
+        self._threshold = threshold
+
+        # One row per path, one column per sample. NaN means "no data".
+        self._matrix = numpy.full(
+            (len(self._paths), samples), numpy.nan, dtype=numpy.float32)
+        self._column = 0
+
+        # Paths whose anomaly was handed to the Dispatcher
+        self._flagged = numpy.zeros(len(self._paths), dtype=bool)
+
+        self._timer = None
+
+    def start(self):
+        """Begin sampling on the IOLoop."""
+        self._timer = ioloop.PeriodicCallback(
+            self.sample, self._interval * 1000)
+        self._timer.start()
+
+    def stop(self):
+        """Stop sampling."""
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    def _counts(self):
+        """Returns the current child count of every path as an array."""
+        counts = numpy.empty(len(self._paths), dtype=numpy.float32)
+        for row, path in enumerate(self._paths):
+            count = self._index.get(path).count
+            counts[row] = numpy.nan if count is None else count
+        return counts
+
+    def sample(self):
+        """Take a sample of all paths, and dispatch any change in anomalies.
+        """
+        counts = self._counts()
+        matrix = self._matrix
+
+        # Baselines are computed from the history *before* this sample, so a
+        # sudden change is not watered down by itself. Rows without any
+        # samples yet make NumPy warn; they are never flagged anyway.
+        with warnings.catch_warnings(), numpy.errstate(invalid='ignore'):
+            warnings.simplefilter('ignore', RuntimeWarning)
+            known = numpy.sum(~numpy.isnan(matrix), axis=1)
+            mean = numpy.nanmean(matrix, axis=1)
+            stddev = numpy.fmax(numpy.nanstd(matrix, axis=1), MIN_STDDEV)
+            zscores = (counts - mean) / stddev
+            flagged = ((known >= self._min_samples) &
+                       (numpy.abs(zscores) > self._threshold))
+
+        matrix[:, self._column] = counts
+        self._column = (self._column + 1) % matrix.shape[1]
+
+        # Paths that are not OK now are raised once they are OK again, if
+        # they are still anomalous by then.
+        raised = numpy.nonzero(flagged & ~self._flagged)[0]
+        cleared = numpy.nonzero(self._flagged & ~flagged)[0]
+        for row in raised:
+            self._flagged[row] = self._raise(
+                row, counts[row], mean[row], zscores[row])
+        for row in cleared:
+            self._clear(row)
+            self._flagged[row] = False
+
+        return zscores
+
+    def _raise(self, row, count, mean, zscore):
+        """Hand a newly anomalous path to the Dispatcher.
+
+        returns:
+            True if it was handed over.
+        """
+        path = self._paths[row]
+        if self._index.get(path).state != states.OK:
+            return False
+
+        reason = ('%d children is %.1f standard deviations %s its baseline '
+                  'of %.1f' % (count, abs(zscore),
+                               'below' if zscore < 0 else 'above', mean))
+        log.warning('Anomaly on %s: %s' % (path, reason))
+        ioloop.IOLoop.current().add_callback(
+            self._dispatcher.update,
+            path=path, state=states.ANOMALY, reason=reason)
+        return True
+
+    def _clear(self, row):
+        """Tell the Dispatcher that a path is back within its baseline."""
+        path = self._paths[row]
+        if self._index.get(path).state != states.OK:
+            return
+
+        log.info('Anomaly on %s cleared' % path)
+        ioloop.IOLoop.current().add_callback(
+            self._dispatcher.update,
+            path=path, state=states.OK,
+            reason='Children back within their baseline.')
+
+    def set_path(self, path):
+        """Start sampling a path added at runtime."""
+        row = bisect.bisect_left(self._paths, path)
+        if row < len(self._paths) and self._paths[row] == path:
+            return
+        self._paths.insert(row, path)
+        self._matrix = numpy.insert(self._matrix, row, numpy.nan, axis=0)
+        self._flagged = numpy.insert(self._flagged, row, False)
+
+    def remove_path(self, path):
+        """Stop sampling a path that is no longer monitored."""
+        row = bisect.bisect_left(self._paths, path)
+        if row == len(self._paths) or self._paths[row] != path:
+            return
+        del self._paths[row]
+        self._matrix = numpy.delete(self._matrix, row, axis=0)
+        self._flagged = numpy.delete(self._flagged, row)
+
+    def status(self):
+        """Returns a dict with the currently anomalous paths."""
+        return {
+            'paths': len(self._paths),
+            'anomalous': [self._paths[row]
+                          for row in numpy.nonzero(self._flagged)[0]],
+        }
@@ -0,0 +1,135 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Paced registration of watches.
+
+Registering a watch costs the ensemble a couple of requests. When every
+zk_monitor agent starts up (or loses its session) at the same moment, each of
+them registering thousands of watches at once hammers the ensemble right when
+it is recovering.
+
+The WatchArmer queues the watches to register instead. Draining the queue
+for such a mass registration only starts after a random delay, so agents that
+were hit by the same event spread out, and then proceeds at the rate of a
+token bucket, highest priority paths first. Single paths (eg. added through
+the admin API) skip the delay.
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from zk_monitor.monitor import ratelimit
+
+log = logging.getLogger(__name__)
+
+# Defaults: register up to 200 watches per second, after a random delay of up
+# to 5 seconds.
+RATE = 200
+JITTER = 5
+
+
+class WatchArmer(object):
+    """Registers queued watches at a limited rate, by priority."""
+
+    def __init__(self, arm, rate=RATE, jitter=JITTER):
+        """Initialize the armer.
+
+        args:
+            arm: Function called with each path to register its watch.
+            rate: Maximum number of watches registered per second.
+            jitter: Maximum random delay (seconds) before draining the queue.
+        """
+        self._arm = arm
+        self._bucket = ratelimit.TokenBucket(rate)
+        self._jitter = jitter
+
+        # Heap of (-priority, sequence, path); the sequence keeps the order
+        # of paths with the same priority.
+        self._queue = []
+        self._queued = set()
+        self._sequence = itertools.count()
+        self._draining = False
+
+        self._armed = 0
+        self._total = 0
+        self._began = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, path, priority=0, jitter=True):
+        """Queue a path to have its watch registered.
+
+        Must be called on the IOLoop.
+
+        args:
+            path: The path to watch.
+            priority: Higher priorities are registered first.
+            jitter: Whether draining the queue (if this starts it) waits for
+                    the random delay first. Only mass registrations, like
+                    on start up or after a session expiry, need it.
+        """
+        if path in self._queued:
+            return
+        self._queued.add(path)
+        heapq.heappush(self._queue, (-priority, next(self._sequence), path))
+
+        if not self._draining:
+            self._draining = True
+            self._armed = 0
+            self._total = 0
+            self._began = time.time()
+            delay = random.uniform(0, self._jitter) if jitter else 0
+            IOLoop.current().add_callback(self._drain, delay)
+        self._total += 1
+
+    @gen.coroutine
+    def _drain(self, delay=0):
+        """Register the queued watches, one token at a time.
+
+        args:
+            delay: Seconds to wait before registering the first watch.
+        """
+        if delay:
+            log.info('Registering %d watches in %.1fs' % (self._total, delay))
+            yield gen.sleep(delay)
+
+        while self._queue:
+            yield self._bucket.acquire()
+            _, _, path = heapq.heappop(self._queue)
+            self._queued.discard(path)
+            try:
+                self._arm(path)
+            except Exception:
+                log.exception('Could not register a watch on %s' % path)
+            self._armed += 1
+
+        log.info('Registered %d watches in %.1fs' % (
+            self._armed, time.time() - self._began))
+        self._draining = False
+
+    def status(self):
+        """Returns a dict describing the progress of the registrations."""
+        return {
+            'pending': len(self._queue),
+            'armed': self._armed,
+            'total': self._total,
+            'began': self._began,
+        }
@@ -0,0 +1,212 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Monitoring paths on several Zookeeper ensembles from one process.
+
+Every path is monitored on the default ensemble (--zookeeper) unless its
+config names another one:
+
+    /services/foo:
+      children: 1
+      ensemble: east
+
+Each ensemble gets a connection (and so a Kazoo callback thread) of its own,
+and a Monitor of its own with its own watches, payload reads, reconciliation
+and resync passes. A slow or disconnected ensemble only holds up its own
+paths. The Monitors share the Dispatcher, the path index and the HTTP
+server, which talk to all of them through one MonitorGroup.
+"""
+
+import logging
+import re
+
+import nd_service_registry
+
+from zk_monitor import monitor
+
+log = logging.getLogger(__name__)
+
+# Name of the ensemble supplied with --zookeeper
+DEFAULT = 'default'
+
+
+def connect(name, **kwargs):
+    """Returns a Service Registry connected to one ensemble.
+
+    KazooServiceRegistry is a singleton: every instantiation returns the one
+    instance stored on its class. A subclass of our own per ensemble gets an
+    instance (and Zookeeper connection) of its own.
+
+    args:
+        name: Name of the ensemble.
+        kwargs: Arguments for KazooServiceRegistry (server, timeout, ...).
+    """
+    cls = type('KazooServiceRegistry_%s' % re.sub(r'\W', '_', name),
+               (nd_service_registry.KazooServiceRegistry,),
+               {'_instance': None, '_initialized': False})
+    return cls(**kwargs)
+
+
+def parse(specs):
+    """Parse --ensemble settings.
+
+    args:
+        specs: List of 'name=servers' strings.
+
+    returns:
+        A dict of {name: servers}
+
+    raises:
+        monitor.InvalidConfigException: If a setting is malformed.
+    """
+    ensembles = {}
+    for spec in specs or []:
+        name, _, servers = spec.partition('=')
+        name, servers = name.strip(), servers.strip()
+        if not name or not servers or name == DEFAULT or name in ensembles:
+            raise monitor.InvalidConfigException(
+                'Invalid ensemble setting: %s' % spec)
+        ensembles[name] = servers
+    return ensembles
+
+
+def ensemble(config):
+    """Returns the name of the ensemble a path config belongs to."""
+    if isinstance(config, dict):
+        return config.get('ensemble') or DEFAULT
+    return DEFAULT
+
+
+def split(paths, names):
+    """Split the path configs up per ensemble.
+
+    args:
+        paths: Dict of all path configs.
+        names: The names of the known ensembles.
+
+    returns:
+        A dict of {ensemble name: dict of path configs}.
+
+    raises:
+        monitor.InvalidConfigException: If a path names an unknown ensemble.
+    """
+    split = dict((name, {}) for name in names)
+    for path, config in paths.iteritems():
+        name = ensemble(config)
+        if name not in split:
+            raise monitor.InvalidConfigException(
+                '%s uses unknown ensemble %s' % (path, name))
+        split[name][path] = config
+    return split
+
+
+class MonitorGroup(object):
+    """One Monitor per ensemble, behaving like a single Monitor."""
+
+    def __init__(self, monitors):
+        """
+        args:
+            monitors: Dict of {ensemble name: monitor.Monitor}.
+        """
+        self._monitors = monitors
+
+    def _owner(self, path):
+        """Returns the Monitor of a path, or None if it is not monitored."""
+        for mon in self._monitors.itervalues():
+            if path in mon:
+                return mon
+        return None
+
+    def get_path(self, path):
+        mon = self._owner(path)
+        if mon is None:
+            raise KeyError(path)
+        return mon.get_path(path)
+
+    def set_path(self, path, config):
+        """Monitor a path on the ensemble its config names.
+
+        A path moved to another ensemble is removed from its old one first:
+        removing it drops its priority and state, which all ensembles share.
+        """
+        name = ensemble(config)
+        if name not in self._monitors:
+            raise monitor.InvalidConfigException(
+                'Unknown ensemble: %s' % name)
+
+        owner = self._owner(path)
+        target = self._monitors[name]
+        if owner is None or owner is target:
+            return target.set_path(path, config)
+
+        # Do not lose the path to an invalid config
+        target.validate(config)
+
+        owner.remove_path(path)
+        target.set_path(path, config)
+        return False
+
+    def remove_path(self, path):
+        mon = self._owner(path)
+        return mon.remove_path(path) if mon is not None else False
+
+    def start_watching(self):
+        for mon in self._monitors.itervalues():
+            mon.start_watching()
+
+    def probe(self, path, callback):
+        """Probes watch the default ensemble, home of the workspace."""
+        self._monitors[DEFAULT].probe(path, callback)
+
+    def unprobe(self, path):
+        self._monitors[DEFAULT].unprobe(path)
+
+    def history(self, path, since=None, points=None):
+        mon = self._owner(path)
+        if mon is None:
+            return None
+        return mon.history(path, since=since, points=points)
+
+    def health(self):
+        """Returns the combined health of all ensembles.
+
+        We are only connected and warm if every ensemble is.
+        """
+        health = {'connected': True, 'warm': True, 'watching': True,
+                  'paths': 0, 'events': 0, 'changes': 0}
+        for mon in self._monitors.itervalues():
+            part = mon.health()
+            for flag in ('connected', 'warm', 'watching'):
+                health[flag] = health[flag] and part[flag]
+            for count in ('paths', 'events', 'changes'):
+                health[count] += part[count]
+        return health
+
+    def compliance(self):
+        compliance = {}
+        for mon in self._monitors.itervalues():
+            compliance.update(mon.compliance())
+        return compliance
+
+    def status(self):
+        """Returns the compliance of all paths, and a section per ensemble.
+        """
+        status = {'compliance': {}, 'ensembles': {}}
+        for name, mon in self._monitors.iteritems():
+            part = mon.status()
+            status['compliance'].update(part.pop('compliance'))
+            health = mon.health()
+            part.update(connected=health['connected'], paths=health['paths'])
+            status['ensembles'][name] = part
+        return status
@@ -0,0 +1,136 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Bounded per-path history of evaluations.
+
+Every evaluation of a path appends (timestamp, child count, state) to a fixed
+size ring buffer for that path. The buffers are backed by typed arrays, so a
+path costs a fixed 13 bytes per entry no matter how long zk_monitor runs.
+"""
+
+import array
+import bisect
+
+from zk_monitor.monitor import states
+
+# Default number of entries kept per path
+SIZE = 360
+
+# States are stored as small integers. Higher codes are "worse", which is
+# what downsampling uses to pick the state of a bucket.
+STATES = (states.UNKNOWN, states.OK, states.ANOMALY, states.ERROR)
+CODES = dict((state, code) for code, state in enumerate(STATES))
+
+
+class History(object):
+    """Ring buffer of (timestamp, count, state) entries for one path."""
+
+    __slots__ = ('_times', '_counts', '_states', '_size', '_next', '_length')
+
+    def __init__(self, size=SIZE):
+        self._size = size
+        self._times = array.array('d', [0.0]) * size
+        self._counts = array.array('i', [0]) * size
+        self._states = array.array('b', [0]) * size
+        self._next = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, timestamp, count, state):
+        """Add an entry, overwriting the oldest one if the buffer is full.
+
+        args:
+            timestamp: Time of the evaluation.
+            count: Number of children (None if unknown).
+            state: monitor.states value.
+        """
+        slot = self._next
+        self._times[slot] = timestamp
+        self._counts[slot] = -1 if count is None else count
+        self._states[slot] = CODES.get(state, 0)
+        self._next = (slot + 1) % self._size
+        if self._length < self._size:
+            self._length += 1
+
+    def _ordered(self, array_):
+        """Returns the contents of an array from oldest to newest."""
+        if self._length < self._size:
+            return array_[:self._length]
+        return array_[self._next:] + array_[:self._next]
+
+    def series(self, since=None, points=None):
+        """Returns the history as a list of [timestamp, count, state] entries.
+
+        args:
+            since: Only return entries newer than this timestamp.
+            points: Downsample to at most this many entries. Each returned
+                    entry then covers a run of consecutive entries, and
+                    carries the time of the last of them, the lowest count
+                    and the worst state seen.
+
+        returns:
+            A list of [timestamp, count, state] lists, oldest first. Unknown
+            counts are None.
+        """
+        times = self._ordered(self._times)
+        counts = self._ordered(self._counts)
+        codes = self._ordered(self._states)
+
+        start = 0
+        if since is not None:
+            start = bisect.bisect_right(times, since)
+
+        total = len(times) - start
+        if not points or total <= points:
+            return [[times[i], None if counts[i] < 0 else counts[i],
+                     STATES[codes[i]]] for i in xrange(start, len(times))]
+
+        series = []
+        for bucket in xrange(points):
+            first = start + bucket * total / points
+            last = start + (bucket + 1) * total / points
+            known = [c for c in counts[first:last] if c >= 0]
+            series.append([times[last - 1],
+                           min(known) if known else None,
+                           STATES[max(codes[first:last])]])
+        return series
+
+
+class HistoryStore(object):
+    """History objects for all paths, created on first use."""
+
+    def __init__(self, size=SIZE):
+        """
+        args:
+            size: Number of entries kept per path.
+        """
+        self._size = size
+        self._histories = {}
+
+    def record(self, path, timestamp, count, state):
+        """Append an entry to the history of a path."""
+        history = self._histories.get(path)
+        if history is None:
+            history = self._histories.setdefault(path, History(self._size))
+        history.append(timestamp, count, state)
+
+    def get(self, path):
+        """Returns the History of a path, or None if it has none yet."""
+        return self._histories.get(path)
+
+    def forget(self, path):
+        """Drop the history of a path."""
+        self._histories.pop(path, None)
@@ -0,0 +1,111 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Runtime state records for monitored paths.
+
+The user supplied path configuration is never written to. Everything that
+zk_monitor learns about a path while running (its compliance state, child
+count, alerting progress, etc) lives in a single PathState record, and all of
+the records live in one PathIndex that is shared by the Monitor and the
+Dispatcher.
+"""
+
+from zk_monitor.monitor import states
+
+
+class PathState(object):
+    """Compact runtime record for a single monitored path.
+
+    Monitor owned attributes:
+        state: monitor.states value from the last evaluation.
+        reason: String explaining `state`.
+        count: Number of children seen at the last evaluation.
+        updated: Timestamp of the last evaluation.
+        changed: Timestamp of the last change of `state`.
+
+    Dispatcher owned attributes:
+        alert_state: monitor.states value the Dispatcher was last updated with.
+        message: String explaining `alert_state`.
+        next_action: alerts.actions value.
+        alerted: Timestamp of the last alert sent for this path.
+    """
+
+    __slots__ = ('path', 'state', 'reason', 'count', 'updated', 'changed',
+                 'alert_state', 'message', 'next_action', 'alerted')
+
+    def __init__(self, path):
+        self.path = path
+        self.state = states.UNKNOWN
+        self.reason = None
+        self.count = None
+        self.updated = None
+        self.changed = None
+        self.alert_state = states.UNKNOWN
+        self.message = False
+        self.next_action = None
+        self.alerted = None
+
+    def __repr__(self):
+        return '<PathState %s: %s>' % (self.path, self.state)
+
+    def update(self, **kwargs):
+        """Set any number of attributes at once.
+
+        raises:
+            AttributeError: If an unknown attribute is supplied.
+        """
+        for key, value in kwargs.iteritems():
+            setattr(self, key, value)
+
+    def to_dict(self):
+        """Returns the record as a JSON-friendly dict."""
+        return dict((key, getattr(self, key)) for key in self.__slots__)
+
+
+class PathIndex(object):
+    """Index of PathState records keyed by path."""
+
+    def __init__(self):
+        self._records = {}
+
+    def __contains__(self, path):
+        return path in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, path):
+        """Get the record for a path, creating it if it does not exist yet.
+
+        args:
+            path: String of the zk path.
+
+        returns:
+            PathState object
+        """
+        try:
+            return self._records[path]
+        except KeyError:
+            return self._records.setdefault(path, PathState(path))
+
+    def remove(self, path):
+        """Drop the record for a path, if there is one."""
+        self._records.pop(path, None)
+
+    def records(self):
+        """Returns a list of all PathState records."""
+        return self._records.values()
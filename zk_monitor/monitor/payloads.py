@@ -0,0 +1,122 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Version-keyed cache of child znode payloads.
+
+The Service Registry only tells us the names of the children of a path. Rules
+that look at what the children registered (host, port, health flags, ...)
+need the data of every child, so this cache fetches it -- but only for paths
+that have such rules, and only for children whose data actually changed.
+
+Every cached payload is stored alongside the mzxid of the znode it came from.
+On a refresh, new children are read right away, while known children are
+first checked with a cheap exists() call and only re-read if their mzxid
+moved. All Zookeeper calls go through one semaphore, so a large membership
+change never floods the ensemble with requests.
+"""
+
+import logging
+
+from nd_service_registry import funcs
+from tornado import gen
+from tornado import locks
+
+from zk_monitor import utils
+
+log = logging.getLogger(__name__)
+
+# Default maximum number of in-flight Zookeeper requests
+CONCURRENCY = 10
+
+
+class PayloadCache(object):
+    """Caches the decoded data of the children of monitored paths."""
+
+    def __init__(self, ndsr, concurrency=CONCURRENCY):
+        """Initialize the cache.
+
+        args:
+            ndsr: A KazooServiceRegistry object
+            concurrency: Maximum number of in-flight Zookeeper requests.
+        """
+        self._ndsr = ndsr
+        self._semaphore = locks.Semaphore(concurrency)
+
+        # {path: {child: payload}} and {path: {child: mzxid}}
+        self._payloads = {}
+        self._versions = {}
+
+    def get(self, path):
+        """Returns the cached {child: payload} dict for a path.
+
+        No Zookeeper calls are made. Children that have not been fetched yet
+        are simply missing from the dict.
+        """
+        return self._payloads.get(path, {})
+
+    def forget(self, path):
+        """Drop everything cached for a path."""
+        self._payloads.pop(path, None)
+        self._versions.pop(path, None)
+
+    @gen.coroutine
+    def refresh(self, path, children):
+        """Bring the cached payloads of a path up to date.
+
+        args:
+            path: The parent path.
+            children: List of the current child names of the path.
+        """
+        payloads = self._payloads.setdefault(path, {})
+        versions = self._versions.setdefault(path, {})
+
+        # Forget about any children that have gone away
+        for child in set(payloads) - set(children):
+            del payloads[child]
+            versions.pop(child, None)
+
+        yield [self._refresh_child(path, child, payloads, versions)
+               for child in children]
+
+    @gen.coroutine
+    def _refresh_child(self, path, child, payloads, versions):
+        """Re-read the payload of a single child if it has changed."""
+        child_path = '%s/%s' % (path, child)
+
+        with (yield self._semaphore.acquire()):
+            zk = self._ndsr._zk
+            try:
+                # Known children are only re-read if their mzxid moved
+                if child in versions:
+                    stat = yield utils.kazooFuture(zk.exists_async,
+                                                   child_path)
+                    if stat is not None and stat.mzxid == versions[child]:
+                        raise gen.Return()
+
+                data, stat = yield utils.kazooFuture(zk.get_async,
+                                                     child_path)
+            except gen.Return:
+                raise
+            except Exception, e:
+                # Most likely the child went away in the meantime. The next
+                # membership change will clean it up.
+                log.debug('Could not read %s: %s' % (child_path, e))
+                payloads.pop(child, None)
+                versions.pop(child, None)
+                raise gen.Return()
+
+        log.debug('Fetched payload of %s (mzxid %s)' %
+                  (child_path, stat.mzxid))
+        payloads[child] = funcs.decode(data)
+        versions[child] = stat.mzxid
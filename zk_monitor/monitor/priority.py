@@ -0,0 +1,177 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Path priorities.
+
+Not every path is equally important: when zk_monitor is saturated (after a
+reconnect, or during a large outage) the payment service should be looked at
+and alerted on before a dev sandbox. Every path can set a priority class:
+
+    /services/payments:
+      children: 3
+      priority: critical
+
+Paths without a priority of their own inherit the one of their closest
+ancestor in the configuration, so a single entry covers a whole subtree.
+Priorities are resolved once, when the configuration is loaded.
+"""
+
+import heapq
+import itertools
+import posixpath
+
+from tornado import concurrent
+
+# Named priority classes. Plain integers are accepted as well; higher values
+# go first.
+CLASSES = {
+    'critical': 30,
+    'high': 20,
+    'normal': 10,
+    'low': 0,
+}
+DEFAULT = CLASSES['normal']
+
+
+class InvalidPriorityException(Exception):
+    """Raised when a priority setting can not be understood."""
+
+
+def parse(value):
+    """Returns the numeric priority of a priority setting.
+
+    args:
+        value: A priority class name (see CLASSES) or an integer.
+
+    raises:
+        InvalidPriorityException: If the value is neither.
+    """
+    if isinstance(value, bool):
+        raise InvalidPriorityException('Invalid priority: %s' % value)
+    if isinstance(value, (int, long)):
+        return value
+    if isinstance(value, basestring) and value.lower() in CLASSES:
+        return CLASSES[value.lower()]
+    raise InvalidPriorityException(
+        'Invalid priority: %s (use one of %s, or a number)' % (
+            value, ', '.join(sorted(CLASSES, key=CLASSES.get))))
+
+
+class Priorities(object):
+    """The resolved priority of every configured path."""
+
+    def __init__(self, config):
+        """Resolve the priorities of all paths.
+
+        args:
+            config: Dict of path configurations, as loaded from YAML.
+
+        raises:
+            InvalidPriorityException: If any priority setting is invalid.
+        """
+        self._explicit = {}
+        for path, settings in (config or {}).iteritems():
+            if isinstance(settings, dict) and 'priority' in settings:
+                self._explicit[path] = parse(settings['priority'])
+
+        self._priorities = {}
+        for path in config or {}:
+            self._priorities[path] = self._inherit(path, self._explicit)
+
+    @staticmethod
+    def _inherit(path, explicit):
+        """Returns the priority of a path, or of its closest ancestor."""
+        while path:
+            if path in explicit:
+                return explicit[path]
+            parent = posixpath.dirname(path.rstrip('/'))
+            if parent == path:
+                break
+            path = parent
+        return DEFAULT
+
+    def get(self, path):
+        """Returns the priority of a path (DEFAULT if it is not configured).
+        """
+        return self._priorities.get(path, DEFAULT)
+
+    def set(self, path, settings):
+        """Resolve the priority of a path added or changed at runtime.
+
+        Configured paths below it that inherit their priority are resolved
+        again as well.
+
+        args:
+            path: The path.
+            settings: Its configuration dict (or None).
+
+        raises:
+            InvalidPriorityException: If its priority setting is invalid.
+        """
+        if isinstance(settings, dict) and 'priority' in settings:
+            self._explicit[path] = parse(settings['priority'])
+        else:
+            self._explicit.pop(path, None)
+        self._priorities[path] = self._inherit(path, self._explicit)
+        self._reinherit(path)
+
+    def remove(self, path):
+        """Forget about a path that is no longer monitored."""
+        self._priorities.pop(path, None)
+        if self._explicit.pop(path, None) is not None:
+            self._reinherit(path)
+
+    def _reinherit(self, path):
+        """Resolve the priorities of the configured paths below a path."""
+        prefix = path.rstrip('/') + '/'
+        for other in self._priorities:
+            if other.startswith(prefix):
+                self._priorities[other] = self._inherit(other, self._explicit)
+
+
+class PrioritySemaphore(object):
+    """A semaphore that lets its highest priority waiter through first."""
+
+    def __init__(self, value):
+        """
+        args:
+            value: Number of holders allowed at once.
+        """
+        self._value = value
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def acquire(self, priority=DEFAULT):
+        """Returns a Future that resolves once the semaphore is acquired.
+
+        args:
+            priority: Higher priorities are let through first; equal ones in
+                      the order they asked.
+        """
+        future = concurrent.Future()
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            future.set_result(None)
+        else:
+            heapq.heappush(
+                self._waiters, (-priority, next(self._sequence), future))
+        return future
+
+    def release(self):
+        """Release the semaphore, handing it to the next waiter if any."""
+        if self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            future.set_result(None)
+        else:
+            self._value += 1
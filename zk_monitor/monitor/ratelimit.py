@@ -0,0 +1,67 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Token bucket rate limiting for background Zookeeper work.
+
+Background jobs (like the reconciliation sweep) walk every monitored path.
+Rather than doing so as fast as possible, and loading the ensemble in
+spikes, they take a token from a bucket for every request. The bucket
+refills at a fixed rate, so the load they put on the ensemble is smooth.
+"""
+
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+class TokenBucket(object):
+    """Hands out tokens at a fixed rate, with a limited burst."""
+
+    def __init__(self, rate, burst=None):
+        """Initialize the bucket (full).
+
+        args:
+            rate: Tokens added per second.
+            burst: Maximum number of tokens saved up (def: rate, at least 1).
+        """
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self._tokens = self.burst
+        self._stamp = time.time()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def consume(self):
+        """Take a token if one is available.
+
+        returns:
+            True if a token was taken, False otherwise.
+        """
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    @gen.coroutine
+    def acquire(self):
+        """Wait for a token, and take it."""
+        while not self.consume():
+            wait = (1 - self._tokens) / self.rate
+            yield gen.Task(IOLoop.current().add_timeout, time.time() + wait)
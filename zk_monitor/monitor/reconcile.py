@@ -0,0 +1,208 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Periodic reconciliation of monitored paths against Zookeeper.
+
+Zookeeper watches are one-shot. If re-registering one is missed (say, around
+a reconnect), the Service Registry silently keeps serving the last known
+children of the path, and its compliance never changes again.
+
+The Reconciler walks all monitored paths in the background, reading the live
+children of each of them and comparing their number against:
+
+  * the children cached by the Service Registry watcher of the path. If
+    those disagree (or there is no working watcher at all), the watch is
+    re-armed.
+  * the child count the Monitor last evaluated. If that disagrees, the path
+    is re-evaluated.
+
+A disagreement is only acted on if it is still there after a short grace
+period, so that an update that simply has not arrived yet is not mistaken
+for drift. The sweep is paced by a token bucket and a concurrency cap, so
+the load it puts on the ensemble is smooth and predictable.
+"""
+
+import logging
+import time
+
+from kazoo import exceptions
+from nd_service_registry.watcher import DummyWatcher
+from tornado import gen
+from tornado import locks
+from tornado.ioloop import IOLoop
+
+from zk_monitor import utils
+from zk_monitor.monitor import ratelimit
+
+log = logging.getLogger(__name__)
+
+# Defaults: sweep every 5 minutes, at no more than 20 paths per second with
+# at most 5 in flight, and give late updates a second to arrive.
+INTERVAL = 300
+RATE = 20
+CONCURRENCY = 5
+GRACE = 1
+
+# Kinds of drift
+WATCH = 'watch'
+STATE = 'state'
+
+
+class Reconciler(object):
+    """Background sweep that catches paths whose watch went missing."""
+
+    def __init__(self, ndsr, paths, index, rearm, reevaluate,
+                 interval=INTERVAL, rate=RATE, concurrency=CONCURRENCY,
+                 grace=GRACE):
+        """Initialize the reconciler.
+
+        args:
+            ndsr: A KazooServiceRegistry object
+            paths: List of the monitored paths.
+            index: pathstate.PathIndex with the last evaluated child counts.
+            rearm: Function called with a path whose watch must be re-armed.
+            reevaluate: Function called with a path that must be evaluated.
+            interval: Seconds between the end of a sweep and the next one.
+            rate: Maximum number of paths checked per second.
+            concurrency: Maximum number of paths checked at once.
+            grace: Seconds to wait before re-checking a disagreement.
+        """
+        self._ndsr = ndsr
+        self._paths = paths
+        self._index = index
+        self._rearm = rearm
+        self._reevaluate = reevaluate
+        self._interval = interval
+        self._grace = grace
+
+        self._bucket = ratelimit.TokenBucket(rate)
+        self._semaphore = locks.Semaphore(concurrency)
+        self._running = False
+
+        self._stats = {
+            'sweeps': 0,
+            'checked': 0,
+            'drift': {WATCH: 0, STATE: 0},
+            'last_sweep': None,
+        }
+
+    def start(self):
+        """Begin sweeping in the background."""
+        if not self._running:
+            self._running = True
+            IOLoop.current().add_callback(self._run)
+
+    def stop(self):
+        """Stop sweeping once the current sweep is done."""
+        self._running = False
+
+    @gen.coroutine
+    def _run(self):
+        while self._running:
+            yield gen.Task(IOLoop.current().add_timeout,
+                           time.time() + self._interval)
+            if not self._running:
+                break
+            try:
+                yield self.sweep()
+            except Exception:
+                log.exception('Reconciliation sweep failed')
+
+    @gen.coroutine
+    def sweep(self):
+        """Check every monitored path once.
+
+        returns:
+            A dict of {path: kind of drift} for the paths that drifted.
+        """
+        if not self._ndsr.get_state():
+            log.debug('Not connected, skipping reconciliation sweep')
+            raise gen.Return({})
+
+        began = time.time()
+        drifted = {}
+        checks = []
+        for path in list(self._paths):
+            yield self._bucket.acquire()
+            yield self._semaphore.acquire()
+            checks.append(self._check(path, drifted))
+        yield checks
+
+        self._stats['sweeps'] += 1
+        self._stats['checked'] += len(checks)
+        self._stats['last_sweep'] = {
+            'time': began,
+            'duration': time.time() - began,
+            'checked': len(checks),
+            'drifted': sorted(drifted),
+        }
+        if drifted:
+            log.warning('Reconciliation found %d drifted paths: %s' % (
+                len(drifted), ', '.join(sorted(drifted))))
+        raise gen.Return(drifted)
+
+    @gen.coroutine
+    def _check(self, path, drifted):
+        """Compare one path against Zookeeper, and fix it if it drifted."""
+        try:
+            drift = yield self._compare(path)
+            if drift is not None:
+                # It could just be an update that's on its way.
+                yield gen.Task(IOLoop.current().add_timeout,
+                               time.time() + self._grace)
+                drift = yield self._compare(path)
+        except Exception, e:
+            log.debug('Could not reconcile %s: %s' % (path, e))
+            raise gen.Return()
+        finally:
+            self._semaphore.release()
+
+        if drift is None:
+            raise gen.Return()
+
+        drifted[path] = drift
+        self._stats['drift'][drift] += 1
+        if drift == WATCH:
+            log.warning('Watch on %s drifted, re-arming it' % path)
+            self._rearm(path)
+        else:
+            log.warning('State of %s drifted, re-evaluating it' % path)
+            self._reevaluate(path)
+
+    @gen.coroutine
+    def _compare(self, path):
+        """Returns the kind of drift of a path, or None."""
+        try:
+            children = yield utils.kazooFuture(
+                self._ndsr._zk.get_children_async, path)
+        except exceptions.NoNodeError:
+            children = []
+        live = len(children)
+
+        watcher = self._ndsr._watchers.get(path)
+        if watcher is None or isinstance(watcher, DummyWatcher):
+            raise gen.Return(WATCH)
+        if len(watcher.get()['children'] or []) != live:
+            raise gen.Return(WATCH)
+
+        # Paths without rules are never evaluated, and have no count.
+        count = self._index.get(path).count
+        if count is not None and count != live:
+            raise gen.Return(STATE)
+
+        raise gen.Return(None)
+
+    def status(self):
+        """Returns a dict with the sweep and drift counters."""
+        return self._stats
@@ -0,0 +1,651 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Compiled compliance rules for monitored paths.
+
+A path config is parsed exactly once (when the config is loaded) into a
+RuleSet of small Rule objects. Evaluating a path is then just a matter of
+handing a Sample to RuleSet.check(), with no config parsing or key lookups
+involved.
+
+The 'children' setting accepts either a plain integer (the minimum number of
+children, as always), or a dict combining any of these checks:
+
+    /services/foo:
+      children:
+        min: 3             # at least 3 children
+        max: 20            # no more than 20 children
+        peak_percent: 50   # at least 50% of the highest count seen ...
+        peak_window: 86400 # ... over the last 24 hours (the default)
+        drop_percent: 40   # no drop of more than 40% ...
+        drop_window: 60    # ... within 60 seconds (the default)
+
+The 'payload' setting checks the data that the children registered with:
+
+    /services/foo:
+      payload:
+        match:             # children whose data has all of these values ...
+          healthy: true
+        min: 3             # ... must number at least 3
+        unique: port       # no two children may share a port (or a list)
+
+The 'max_age' setting alerts on znodes that have not been modified for too
+long, like heartbeats written by cron jobs. It takes the number of seconds,
+or a dict to age the znode by its creation time instead:
+
+    /jobs/foo/last_run:
+      max_age: 900         # modified within the last 15 minutes
+
+    /jobs/bar/lock:
+      max_age:
+        seconds: 3600
+        since: ctime       # created within the last hour
+
+The 'metrics' setting checks the values a Zookeeper server reports about
+itself, and so only applies to servers (see zk_monitor.monitor.servers).
+Numbers take a range, anything else a list of allowed values:
+
+    zk://zk1.example.com:2181:
+      metrics:
+        zk_outstanding_requests:
+          max: 10
+        zk_avg_latency:
+          max: 50
+        zk_server_state:
+          in: [leader, follower]
+"""
+
+import collections
+import logging
+
+log = logging.getLogger(__name__)
+
+# Default time window for the 'peak_percent' check
+PEAK_WINDOW = 86400
+
+# Number of buckets the 'peak_window' is split into
+PEAK_BUCKETS = 24
+
+# Default time window for the 'drop_percent' check
+DROP_WINDOW = 60
+
+
+class InvalidRuleException(Exception):
+    """Raised when a rule config can not be compiled."""
+
+
+def duration(seconds):
+    """Returns a short human readable string for a number of seconds.
+
+    eg: 90 -> '90s', 900 -> '15m', 86400 -> '24h'
+    """
+    seconds = int(seconds)
+    if seconds >= 3600 and not seconds % 3600:
+        return '%sh' % (seconds / 3600)
+    if seconds >= 60 and not seconds % 60:
+        return '%sm' % (seconds / 60)
+    return '%ss' % seconds
+
+
+class Sample(object):
+    """Everything a rule may look at for one evaluation of a path."""
+
+    __slots__ = ('count', 'time', 'payloads', 'stat', 'metrics', 'record')
+
+    def __init__(self, count, time, payloads=None, stat=None, metrics=None,
+                 record=True):
+        """
+        args:
+            count: Number of children of the path.
+            time: Timestamp of the sample.
+            payloads: {child: decoded data} for the children of the path,
+                      only supplied if the RuleSet needs_payloads.
+            stat: ZnodeStat of the path, None if it does not exist.
+            metrics: {name: value} reported by a Zookeeper server, only
+                     supplied when checking servers.
+            record: Whether rules that keep a history (eg. RapidDrop)
+                    remember the sample. False to check a sample without
+                    affecting any later check.
+        """
+        self.count = count
+        self.time = time
+        self.payloads = payloads
+        self.stat = stat
+        self.metrics = metrics
+        self.record = record
+
+
+class Rule(object):
+    """Base class for a single compiled check."""
+
+    __slots__ = ()
+
+    # Whether the rule looks at Sample.payloads
+    needs_payloads = False
+
+    # Whether the rule can change its verdict as time passes, without the
+    # path itself changing. See deadline().
+    timed = False
+
+    def check(self, sample):
+        """Checks a sample against this rule.
+
+        args:
+            sample: Sample object
+
+        returns:
+            None if the sample passes, otherwise a string with the reason.
+        """
+        raise NotImplementedError()
+
+    def deadline(self, sample):
+        """Returns the time at which the verdict on a sample may change.
+
+        ie. when a passing sample would start failing (or the other way
+        around) without the path itself changing. Only meaningful for `timed`
+        rules. None if there is no such time.
+        """
+        return None
+
+
+class MinChildren(Rule):
+    """Requires at least `minimum` children."""
+
+    __slots__ = ('minimum',)
+
+    def __init__(self, minimum):
+        self.minimum = minimum
+
+    def check(self, sample):
+        if sample.count < self.minimum:
+            return ('%s children is less than minimum %s' %
+                    (sample.count, self.minimum))
+
+
+class MaxChildren(Rule):
+    """Allows at most `maximum` children."""
+
+    __slots__ = ('maximum',)
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+
+    def check(self, sample):
+        if sample.count > self.maximum:
+            return ('%s children is more than maximum %s' %
+                    (sample.count, self.maximum))
+
+
+class PercentOfPeak(Rule):
+    """Requires at least `percent` of the highest count seen in `window`.
+
+    The window is split into PEAK_BUCKETS buckets that each remember the
+    highest count seen during their slice of time, so the memory used and the
+    cost of a check do not depend on how often the path changes.
+    """
+
+    __slots__ = ('percent', 'window', '_width', '_peaks', '_epochs')
+
+    timed = True
+
+    def __init__(self, percent, window=PEAK_WINDOW):
+        self.percent = percent
+        self.window = window
+        self._width = float(window) / PEAK_BUCKETS
+        self._peaks = [0] * PEAK_BUCKETS
+        self._epochs = [None] * PEAK_BUCKETS
+
+    def _record(self, count, now, record=True):
+        """Record a count and return the peak over the window."""
+        epoch = int(now / self._width)
+        oldest = epoch - PEAK_BUCKETS
+        if not record:
+            return max([count] + [peak for peak, bucket_epoch
+                                  in zip(self._peaks, self._epochs)
+                                  if bucket_epoch is not None and
+                                  bucket_epoch > oldest])
+
+        slot = epoch % PEAK_BUCKETS
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._peaks[slot] = count
+        elif count > self._peaks[slot]:
+            self._peaks[slot] = count
+
+        return max(peak for peak, bucket_epoch
+                   in zip(self._peaks, self._epochs)
+                   if bucket_epoch is not None and bucket_epoch > oldest)
+
+    def check(self, sample):
+        peak = self._record(sample.count, sample.time, sample.record)
+        if sample.count * 100 < peak * self.percent:
+            return ('%s children is less than %s%% of the %s peak (%s)' %
+                    (sample.count, self.percent, duration(self.window), peak))
+
+    def deadline(self, sample):
+        # While failing, the verdict may change once the bucket holding the
+        # current peak ages out of the window.
+        oldest = int(sample.time / self._width) - PEAK_BUCKETS
+        live = [(peak, bucket_epoch) for peak, bucket_epoch
+                in zip(self._peaks, self._epochs)
+                if bucket_epoch is not None and bucket_epoch > oldest]
+        if not live:
+            return None
+        peak, bucket_epoch = max(live)
+        if sample.count * 100 < peak * self.percent:
+            return (bucket_epoch + PEAK_BUCKETS) * self._width
+
+
+class RapidDrop(Rule):
+    """Fails if the count dropped more than `percent` within `window` seconds.
+
+    The highest count of the window is tracked with a monotonic queue: counts
+    are kept in decreasing order and anything that can never be the maximum
+    again is dropped as soon as a higher count arrives. The front of the queue
+    is always the window's maximum, so every check is amortized O(1).
+    """
+
+    __slots__ = ('percent', 'window', '_queue')
+
+    timed = True
+
+    def __init__(self, percent, window):
+        self.percent = percent
+        self.window = window
+        self._queue = collections.deque()
+
+    def _record(self, count, now, record=True):
+        """Record a count and return the (time, count) maximum of the window.
+
+        A count is in the window for `window` seconds; at its deadline it
+        is gone.
+        """
+        queue = self._queue
+        oldest = now - self.window
+        if not record:
+            for entry in queue:
+                if entry[0] > oldest:
+                    return entry if entry[1] > count else (now, count)
+            return (now, count)
+
+        while queue and queue[0][0] <= oldest:
+            queue.popleft()
+        while queue and queue[-1][1] <= count:
+            queue.pop()
+        queue.append((now, count))
+        return queue[0]
+
+    def check(self, sample):
+        peak = self._record(sample.count, sample.time, sample.record)[1]
+        dropped = peak - sample.count
+        if dropped * 100 > peak * self.percent:
+            return ('children dropped by %s (%s%%) from %s to %s within %s' %
+                    (dropped, dropped * 100 / peak, peak, sample.count,
+                     duration(self.window)))
+
+    def deadline(self, sample):
+        # While failing, the verdict may change once the current maximum ages
+        # out of the window.
+        if not self._queue:
+            return None
+        peak_time, peak = self._queue[0]
+        if (peak - sample.count) * 100 > peak * self.percent:
+            return peak_time + self.window
+
+
+class MinMatching(Rule):
+    """Requires at least `minimum` children whose data matches `match`."""
+
+    __slots__ = ('match', 'minimum', 'description')
+
+    needs_payloads = True
+
+    def __init__(self, match, minimum):
+        self.match = tuple(sorted(match.items()))
+        self.minimum = minimum
+        self.description = ', '.join(
+            '%s=%s' % (key, value) for key, value in self.match)
+
+    def _matches(self, payload):
+        if not isinstance(payload, dict):
+            return False
+        for key, value in self.match:
+            if payload.get(key) != value:
+                return False
+        return True
+
+    def check(self, sample):
+        matching = len([payload for payload in sample.payloads.itervalues()
+                        if self._matches(payload)])
+        if matching < self.minimum:
+            return ('%s children with %s is less than minimum %s' %
+                    (matching, self.description, self.minimum))
+
+
+class UniqueValue(Rule):
+    """Requires that no two children registered the same value for `key`."""
+
+    __slots__ = ('key',)
+
+    needs_payloads = True
+
+    def __init__(self, key):
+        self.key = key
+
+    def check(self, sample):
+        owners = {}
+        for child, payload in sample.payloads.iteritems():
+            if not isinstance(payload, dict) or self.key not in payload:
+                continue
+            owners.setdefault(payload[self.key], []).append(child)
+
+        duplicates = sorted((value, sorted(children))
+                            for value, children in owners.iteritems()
+                            if len(children) > 1)
+        if duplicates:
+            return ('children share %s: %s' % (self.key, '; '.join(
+                '%s (%s)' % (value, ', '.join(children))
+                for value, children in duplicates)))
+
+
+class MaxAge(Rule):
+    """Requires the znode to have been modified (or created) recently."""
+
+    __slots__ = ('seconds', 'since')
+
+    timed = True
+
+    def __init__(self, seconds, since='mtime'):
+        self.seconds = seconds
+        self.since = since
+
+    def _stamp(self, stat):
+        """Returns the mtime (or ctime) of the znode in seconds."""
+        if self.since == 'ctime':
+            return stat.ctime / 1000.0
+        return stat.mtime / 1000.0
+
+    def check(self, sample):
+        if sample.stat is None:
+            return 'path does not exist'
+
+        # At the deadline itself the path is stale: the deadline is not in
+        # the future any more, so nothing would check it again.
+        age = sample.time - self._stamp(sample.stat)
+        if age >= self.seconds:
+            return ('%s %ss ago, more than max age %s' % (
+                'created' if self.since == 'ctime' else 'last modified',
+                int(age), duration(self.seconds)))
+
+    def deadline(self, sample):
+        if sample.stat is None:
+            return None
+        return self._stamp(sample.stat) + self.seconds
+
+
+class MetricRange(Rule):
+    """Requires a numeric server metric to stay within a range."""
+
+    __slots__ = ('name', 'minimum', 'maximum')
+
+    def __init__(self, name, minimum=None, maximum=None):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def check(self, sample):
+        value = (sample.metrics or {}).get(self.name)
+        if isinstance(value, bool) or not isinstance(value, (int, long,
+                                                             float)):
+            return '%s is not reported' % self.name
+        if self.minimum is not None and value < self.minimum:
+            return '%s %s is less than minimum %s' % (
+                self.name, value, self.minimum)
+        if self.maximum is not None and value > self.maximum:
+            return '%s %s is more than maximum %s' % (
+                self.name, value, self.maximum)
+
+
+class MetricIn(Rule):
+    """Requires a server metric to have one of a list of values."""
+
+    __slots__ = ('name', 'values')
+
+    def __init__(self, name, values):
+        self.name = name
+        self.values = tuple(values)
+
+    def check(self, sample):
+        value = (sample.metrics or {}).get(self.name)
+        if value is None:
+            return '%s is not reported' % self.name
+        if value not in self.values:
+            return '%s %s is not one of %s' % (
+                self.name, value, ', '.join(str(v) for v in self.values))
+
+
+class RuleSet(object):
+    """All of the compiled rules for a single path."""
+
+    __slots__ = ('rules', 'needs_payloads', 'timed')
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.needs_payloads = any(rule.needs_payloads for rule in self.rules)
+        self.timed = tuple(rule for rule in self.rules if rule.timed)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def check(self, sample):
+        """Checks a sample against every rule.
+
+        args:
+            sample: Sample object
+
+        returns:
+            A list of reasons for every failed rule. Empty if all pass.
+        """
+        return [reason for reason in
+                [rule.check(sample) for rule in self.rules]
+                if reason is not None]
+
+    def deadline(self, sample):
+        """Returns the earliest future time a timed rule may change verdict.
+
+        args:
+            sample: Sample object
+
+        returns:
+            A timestamp, or None if no timed rule has a future deadline.
+        """
+        deadlines = [deadline for deadline in
+                     [rule.deadline(sample) for rule in self.timed]
+                     if deadline is not None and deadline > sample.time]
+        return min(deadlines) if deadlines else None
+
+
+def _number(name, value, minimum=0, maximum=None, types=(int,)):
+    """Validate a numeric rule setting."""
+    if isinstance(value, bool) or not isinstance(value, types):
+        raise InvalidRuleException('Invalid %s setting: %s' % (name, value))
+    if value < minimum or (maximum is not None and value > maximum):
+        raise InvalidRuleException('Invalid %s setting: %s' % (name, value))
+    return value
+
+
+def _compile_children(setting):
+    """Compile the 'children' setting into a list of Rule objects."""
+    # Plain integers are a minimum, as they have always been
+    if not isinstance(setting, dict):
+        return [MinChildren(_number('children', setting))]
+
+    unknown = set(setting) - set(['min', 'max', 'peak_percent', 'peak_window',
+                                  'drop_percent', 'drop_window'])
+    if unknown:
+        raise InvalidRuleException(
+            'Unknown children settings: %s' % ', '.join(sorted(unknown)))
+
+    compiled = []
+    if 'min' in setting:
+        compiled.append(MinChildren(_number('min', setting['min'])))
+    if 'max' in setting:
+        compiled.append(MaxChildren(_number('max', setting['max'])))
+        if 'min' in setting and setting['min'] > setting['max']:
+            raise InvalidRuleException(
+                'Invalid children range: min %s is more than max %s' %
+                (setting['min'], setting['max']))
+    if 'peak_percent' in setting:
+        percent = _number('peak_percent', setting['peak_percent'],
+                          minimum=1, maximum=100, types=(int, float))
+        window = _number('peak_window',
+                         setting.get('peak_window', PEAK_WINDOW),
+                         minimum=PEAK_BUCKETS, types=(int, float))
+        compiled.append(PercentOfPeak(percent, window))
+    elif 'peak_window' in setting:
+        raise InvalidRuleException('peak_window requires peak_percent')
+    if 'drop_percent' in setting:
+        percent = _number('drop_percent', setting['drop_percent'],
+                          minimum=1, maximum=99, types=(int, float))
+        window = _number('drop_window',
+                         setting.get('drop_window', DROP_WINDOW),
+                         minimum=1, types=(int, float))
+        compiled.append(RapidDrop(percent, window))
+    elif 'drop_window' in setting:
+        raise InvalidRuleException('drop_window requires drop_percent')
+
+    return compiled
+
+
+def _compile_payload(setting):
+    """Compile the 'payload' setting into a list of Rule objects."""
+    if not isinstance(setting, dict):
+        raise InvalidRuleException('Invalid payload setting: %s' % setting)
+
+    unknown = set(setting) - set(['match', 'min', 'unique'])
+    if unknown:
+        raise InvalidRuleException(
+            'Unknown payload settings: %s' % ', '.join(sorted(unknown)))
+
+    compiled = []
+    if 'match' in setting or 'min' in setting:
+        match = setting.get('match')
+        if not match or not isinstance(match, dict):
+            raise InvalidRuleException('Invalid payload match: %s' % match)
+        compiled.append(MinMatching(match, _number('min', setting.get('min'))))
+
+    if 'unique' in setting:
+        keys = setting['unique']
+        if not isinstance(keys, list):
+            keys = [keys]
+        for key in keys:
+            if not key or not isinstance(key, basestring):
+                raise InvalidRuleException(
+                    'Invalid payload unique key: %s' % key)
+            compiled.append(UniqueValue(key))
+
+    return compiled
+
+
+def _compile_max_age(setting):
+    """Compile the 'max_age' setting into a list of Rule objects."""
+    if not isinstance(setting, dict):
+        setting = {'seconds': setting}
+
+    unknown = set(setting) - set(['seconds', 'since'])
+    if unknown:
+        raise InvalidRuleException(
+            'Unknown max_age settings: %s' % ', '.join(sorted(unknown)))
+
+    since = setting.get('since', 'mtime')
+    if since not in ('mtime', 'ctime'):
+        raise InvalidRuleException('Invalid max_age since: %s' % since)
+
+    seconds = _number('max_age', setting.get('seconds'), minimum=1,
+                      types=(int, float))
+    return [MaxAge(seconds, since)]
+
+
+def _compile_metrics(setting):
+    """Compile the 'metrics' setting into a list of Rule objects."""
+    if not setting or not isinstance(setting, dict):
+        raise InvalidRuleException('Invalid metrics setting: %s' % setting)
+
+    compiled = []
+    for name, checks in sorted(setting.iteritems()):
+        if not isinstance(checks, dict) or not checks:
+            raise InvalidRuleException(
+                'Invalid %s setting: %s' % (name, checks))
+
+        unknown = set(checks) - set(['min', 'max', 'in'])
+        if unknown:
+            raise InvalidRuleException('Unknown %s settings: %s' % (
+                name, ', '.join(sorted(unknown))))
+
+        if 'min' in checks or 'max' in checks:
+            minimum = checks.get('min')
+            maximum = checks.get('max')
+            for key, value in (('min', minimum), ('max', maximum)):
+                if value is not None:
+                    _number('%s %s' % (name, key), value,
+                            minimum=float('-inf'), types=(int, float))
+            if None not in (minimum, maximum) and minimum > maximum:
+                raise InvalidRuleException(
+                    'Invalid %s range: min %s is more than max %s' %
+                    (name, minimum, maximum))
+            compiled.append(MetricRange(name, minimum, maximum))
+
+        if 'in' in checks:
+            values = checks['in']
+            if not isinstance(values, list):
+                values = [values]
+            if not values:
+                raise InvalidRuleException('Invalid %s in: %s' % (
+                    name, checks['in']))
+            compiled.append(MetricIn(name, values))
+
+    return compiled
+
+
+def compile(config):
+    """Compile a path config into a RuleSet.
+
+    args:
+        config: A dict with the path settings. eg. { 'children': 1, }
+
+    returns:
+        A RuleSet, or None if the config has no rules at all.
+
+    raises:
+        InvalidRuleException: If any of the rule settings are invalid.
+    """
+    if not isinstance(config, dict):
+        return None
+
+    compiled = []
+    if 'children' in config:
+        compiled.extend(_compile_children(config['children']))
+    if 'payload' in config:
+        compiled.extend(_compile_payload(config['payload']))
+    if 'max_age' in config:
+        compiled.extend(_compile_max_age(config['max_age']))
+    if 'metrics' in config:
+        compiled.extend(_compile_metrics(config['metrics']))
+
+    if not compiled:
+        return None
+
+    log.debug('Compiled rules: %s' % [
+        rule.__class__.__name__ for rule in compiled])
+    return RuleSet(compiled)
@@ -0,0 +1,124 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Central deadline scheduler.
+
+Instead of every time-based rule running its own polling loop, each of them
+hands its next deadline to a single DeadlineScheduler. The scheduler keeps the
+deadlines in a heap and only ever has one IOLoop timeout armed (for the
+earliest deadline), so thousands of idle deadlines cost nothing but memory.
+"""
+
+import heapq
+import logging
+import threading
+
+from tornado.ioloop import IOLoop
+
+log = logging.getLogger(__name__)
+
+
+class DeadlineScheduler(object):
+    """Calls back with a key once the deadline scheduled for it has passed."""
+
+    def __init__(self, callback, io_loop=None):
+        """Initialize the scheduler.
+
+        args:
+            callback: Function called with the key of every expired deadline.
+            io_loop: IOLoop to run on (def: IOLoop.current()).
+        """
+        self._callback = callback
+        self._io_loop = io_loop or IOLoop.current()
+
+        # Heap of (deadline, key). Entries that were rescheduled or cancelled
+        # are left in the heap and skipped once they surface; _deadlines is
+        # the source of truth.
+        self._heap = []
+        self._deadlines = {}
+
+        # schedule() may be called from the Kazoo threads
+        self._lock = threading.Lock()
+
+        self._timeout = None
+        self._armed = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key, deadline):
+        """Schedule (or move) the deadline for a key.
+
+        args:
+            key: Hashable identifier handed back to the callback.
+            deadline: Timestamp at which the callback should fire.
+        """
+        with self._lock:
+            if self._deadlines.get(key) == deadline:
+                return
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, key))
+
+            # Don't let superseded entries pile up in the heap
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._heap = [(d, k) for k, d in self._deadlines.iteritems()]
+                heapq.heapify(self._heap)
+
+        self._io_loop.add_callback(self._arm)
+
+    def cancel(self, key):
+        """Forget about the deadline for a key, if there is one."""
+        with self._lock:
+            self._deadlines.pop(key, None)
+
+    def _arm(self):
+        """Make sure the one IOLoop timeout matches the earliest deadline."""
+        with self._lock:
+            heap = self._heap
+            while heap and self._deadlines.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+            earliest = heap[0][0] if heap else None
+
+        if earliest == self._armed:
+            return
+
+        if self._timeout is not None:
+            self._io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+        self._armed = earliest
+        if earliest is not None:
+            self._timeout = self._io_loop.add_timeout(earliest, self._fire)
+
+    def _fire(self):
+        """Run the callback for every deadline that has passed."""
+        self._timeout = None
+        self._armed = None
+
+        now = self._io_loop.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, key = heapq.heappop(self._heap)
+                if self._deadlines.get(key) == deadline:
+                    del self._deadlines[key]
+                    due.append(key)
+
+        for key in due:
+            try:
+                self._callback(key)
+            except Exception:
+                log.exception('Deadline callback for %s failed' % key)
+
+        self._arm()
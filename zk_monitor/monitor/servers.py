@@ -0,0 +1,337 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Health of the Zookeeper servers themselves.
+
+Watching znodes tells us nothing about the ensemble serving them: requests
+piling up, latency, the number of znodes and watches, or a member that fell
+out of the quorum. Servers to check are listed in the path config, keyed by
+a zk:// address instead of a path:
+
+    zk://zk1.example.com:2181:
+      metrics:
+        zk_outstanding_requests:
+          max: 10
+        zk_server_state:
+          in: [leader, follower]
+      alerter:
+        email: ops@example.com
+
+Every server is asked for its `mntr` four letter word on a timer, falling
+back to `srvr` when `mntr` is not whitelisted (or not known to the server).
+All servers are polled at once, each with a timeout, so a hung server never
+delays the others. The values are checked by the same rules engine as paths
+(see rules.py), and state changes are handed to the Dispatcher under the
+zk:// address. A server that does not answer is in the Error state.
+"""
+
+import logging
+import time
+
+from tornado import gen
+from tornado import ioloop
+from tornado import iostream
+from tornado import locks
+from tornado import tcpclient
+
+from zk_monitor import monitor
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import rules
+from zk_monitor.monitor import states
+
+log = logging.getLogger(__name__)
+
+# Prefix of the server entries of the path config, and their default port
+PREFIX = 'zk://'
+PORT = 2181
+
+# Defaults: poll every 30 seconds, give each server 5 seconds to answer, and
+# talk to no more than 10 servers at once.
+INTERVAL = 30
+TIMEOUT = 5
+CONCURRENCY = 10
+
+# Largest four letter word response we read
+MAX_RESPONSE = 1024 * 1024
+
+# `srvr` lines, and the `mntr` names their values are reported under
+SRVR_KEYS = {
+    'Received': 'zk_packets_received',
+    'Sent': 'zk_packets_sent',
+    'Connections': 'zk_num_alive_connections',
+    'Outstanding': 'zk_outstanding_requests',
+    'Zxid': 'zk_zxid',
+    'Mode': 'zk_server_state',
+    'Node count': 'zk_znode_count',
+}
+SRVR_LATENCY = ('zk_min_latency', 'zk_avg_latency', 'zk_max_latency')
+
+
+def split(paths):
+    """Separate the server entries of a path config from the paths.
+
+    args:
+        paths: Dict of the whole path config.
+
+    returns:
+        A (paths, servers) tuple of dicts.
+    """
+    znodes, servers = {}, {}
+    for key, config in paths.iteritems():
+        if key.startswith(PREFIX):
+            servers[key] = config
+        else:
+            znodes[key] = config
+    return znodes, servers
+
+
+def address(key):
+    """Returns the (host, port) of a zk://host[:port] server entry."""
+    host, _, port = key[len(PREFIX):].rstrip('/').rpartition(':')
+    if not host:
+        return port, PORT
+    return host, int(port)
+
+
+def _value(text):
+    """Returns a reported value as a number, if it is one."""
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parseMntr(text):
+    """Parse a `mntr` response into a dict of {name: value}.
+
+    Servers that refuse the command answer with a sentence instead, which
+    yields an empty dict.
+    """
+    metrics = {}
+    for line in text.splitlines():
+        name, tab, value = line.partition('\t')
+        if tab and name.startswith('zk_'):
+            metrics[name] = _value(value.strip())
+    return metrics
+
+
+def parseSrvr(text):
+    """Parse a `srvr` response into a dict of {mntr name: value}."""
+    metrics = {}
+    for line in text.splitlines():
+        label, colon, value = line.partition(':')
+        if not colon:
+            continue
+        label, value = label.strip(), value.strip()
+        if label == 'Latency min/avg/max':
+            metrics.update(zip(SRVR_LATENCY,
+                               [_value(v) for v in value.split('/')]))
+        elif label == 'Zxid':
+            metrics[SRVR_KEYS[label]] = int(value, 16)
+        elif label in SRVR_KEYS:
+            metrics[SRVR_KEYS[label]] = _value(value)
+    return metrics
+
+
+@gen.coroutine
+def fourLetterWord(host, port, command, timeout=TIMEOUT):
+    """Send a four letter word to a server and return its response.
+
+    args:
+        host: Server name or address.
+        port: Client port of the server.
+        command: The four letter word, eg. 'mntr'.
+        timeout: Seconds the whole exchange may take.
+
+    raises:
+        gen.TimeoutError: If the server did not answer in time.
+        IOError: If the server could not be reached.
+    """
+    deadline = ioloop.IOLoop.current().time() + timeout
+    quiet = (iostream.StreamClosedError, IOError)
+
+    connecting = tcpclient.TCPClient().connect(
+        host, port, max_buffer_size=MAX_RESPONSE)
+    try:
+        stream = yield gen.with_timeout(deadline, connecting,
+                                        quiet_exceptions=quiet)
+    except gen.TimeoutError:
+        # Do not leave the connection behind if it shows up after all
+        connecting.add_done_callback(
+            lambda f: f.exception() or f.result().close())
+        raise
+
+    try:
+        yield stream.write(command)
+        response = yield gen.with_timeout(
+            deadline, stream.read_until_close(), quiet_exceptions=quiet)
+    finally:
+        stream.close()
+    raise gen.Return(response)
+
+
+class ServerMonitor(object):
+    """Polls the health of Zookeeper servers, and dispatches their state."""
+
+    def __init__(self, dispatcher, servers, index=None, interval=INTERVAL,
+                 timeout=TIMEOUT, concurrency=CONCURRENCY, statsd=None):
+        """
+        args:
+            dispatcher: alerts.dispatcher.Dispatcher object.
+            servers: Dict of {zk://host:port: config}.
+            index: pathstate.PathIndex shared with the Dispatcher. A private
+                   one is created if not supplied.
+            interval: Seconds between polls.
+            timeout: Seconds each server may take to answer.
+            concurrency: Maximum number of servers polled at once.
+            statsd: statsd.StatsD to report the numeric metrics to.
+
+        raises:
+            monitor.InvalidConfigException: If any server config is invalid.
+        """
+        self._dispatcher = dispatcher
+        self._servers = servers
+        self._index = index if index is not None else pathstate.PathIndex()
+        self._interval = interval
+        self._timeout = timeout
+        self._statsd = statsd
+        self._semaphore = locks.Semaphore(concurrency)
+        self._timer = None
+        self._busy = False
+
+        self._rules = {}
+        for key, config in servers.iteritems():
+            try:
+                self._rules[key] = rules.compile(config)
+            except rules.InvalidRuleException, e:
+                raise monitor.InvalidConfigException('%s: %s' % (key, e))
+
+        # {key: (metrics dict, timestamp)} of the last answer of every server
+        self._metrics = {}
+
+    def start(self):
+        """Begin polling on the IOLoop."""
+        self._timer = ioloop.PeriodicCallback(
+            self.poll, self._interval * 1000)
+        self._timer.start()
+        ioloop.IOLoop.current().add_callback(self.poll)
+
+    def stop(self):
+        """Stop polling."""
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    @gen.coroutine
+    def poll(self):
+        """Poll every server at once, and dispatch any change of state."""
+        if self._busy:
+            return
+        self._busy = True
+        try:
+            yield [self._check(key) for key in sorted(self._servers)]
+        finally:
+            self._busy = False
+
+    @gen.coroutine
+    def fetch(self, host, port):
+        """Returns the metrics of a single server.
+
+        raises:
+            IOError, gen.TimeoutError: If the server did not answer.
+            ValueError: If it answered, but not with any metrics.
+        """
+        response = yield fourLetterWord(host, port, 'mntr', self._timeout)
+        metrics = parseMntr(response)
+        if not metrics:
+            response = yield fourLetterWord(host, port, 'srvr',
+                                            self._timeout)
+            metrics = parseSrvr(response)
+        if not metrics:
+            raise ValueError(response.strip() or 'empty response')
+        raise gen.Return(metrics)
+
+    @gen.coroutine
+    def _check(self, key):
+        """Poll and evaluate a single server."""
+        host, port = address(key)
+        with (yield self._semaphore.acquire()):
+            try:
+                metrics = yield self.fetch(host, port)
+            except Exception, e:
+                log.warning('Could not poll %s: %s' % (key, e))
+                self._update(key, states.ERROR,
+                             'Server is not responding: %s' % (
+                                 str(e) or e.__class__.__name__))
+                return
+
+        now = time.time()
+        self._metrics[key] = (metrics, now)
+        if self._statsd:
+            for name, value in metrics.iteritems():
+                if isinstance(value, (int, long, float)):
+                    self._statsd.gauge('server.%s' % name, value,
+                                       tags={'server': '%s:%s' % (host, port)})
+
+        ruleset = self._rules.get(key)
+        if ruleset is None:
+            self._update(key, states.UNKNOWN,
+                         'No information is available about this server.')
+            return
+
+        reasons = ruleset.check(rules.Sample(None, now, metrics=metrics))
+        if reasons:
+            self._update(key, states.ERROR, '; '.join(reasons))
+        else:
+            self._update(key, states.OK, 'All checks pass.')
+
+    def _update(self, key, new_state, reason):
+        """Record the state of a server, and tell the Dispatcher if it moved.
+
+        Unlike paths, servers are evaluated on every poll; only actual
+        changes of state are dispatched, so a failing server does not alert
+        again on every poll.
+        """
+        record = self._index.get(key)
+        old_state = record.state
+        now = time.time()
+        if new_state != old_state:
+            record.changed = now
+        record.update(state=new_state, reason=reason, updated=now)
+
+        if new_state == old_state or \
+                (old_state == states.UNKNOWN and new_state == states.OK):
+            return
+
+        log.info('Server %s changed from %s to %s' % (
+            key, old_state, new_state))
+        ioloop.IOLoop.current().add_callback(
+            self._dispatcher.update,
+            path=key, state=new_state, reason=reason)
+
+    def status(self):
+        """Returns the state and last reported metrics of every server."""
+        status = {}
+        for key in self._servers:
+            record = self._index.get(key)
+            metrics, polled = self._metrics.get(key, (None, None))
+            status[key] = {
+                'state': record.state,
+                'message': record.reason,
+                'polled': polled,
+                'metrics': metrics,
+            }
+        return status
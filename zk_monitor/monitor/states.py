@@ -14,3 +14,4 @@
 UNKNOWN = 'Unknown'
 ERROR = 'Error'
 OK = 'OK'
+ANOMALY = 'Anomaly'
@@ -0,0 +1,155 @@
+import time
+
+import mock
+from tornado import testing
+from tornado.testing import unittest
+
+from zk_monitor.monitor import anomaly
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import states
+
+
+@unittest.skipIf(anomaly.numpy is None, 'numpy is not installed')
+class TestAnomalyDetector(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestAnomalyDetector, self).setUp()
+        self.index = pathstate.PathIndex()
+        self.dispatcher = mock.Mock()
+        self.paths = ['/a', '/b']
+        for path in self.paths:
+            self.index.get(path).update(count=10, state=states.OK)
+
+    def _detector(self, **kwargs):
+        return anomaly.AnomalyDetector(
+            self.paths, self.index, self.dispatcher,
+            samples=5, min_samples=3, threshold=3, **kwargs)
+
+    def _updates(self):
+        """Run the queued dispatcher callbacks, return their kwargs."""
+        self.io_loop.add_callback(self.stop)
+        self.wait()
+        return [c[1] for c in self.dispatcher.update.call_args_list]
+
+    def testNoBaselineYet(self):
+        detector = self._detector()
+        detector.sample()
+        self.index.get('/a').count = 0
+        detector.sample()
+
+        # Only two samples, no verdict yet
+        self.assertEquals([], self._updates())
+        self.assertEquals([], detector.status()['anomalous'])
+
+    def testRaiseAndClear(self):
+        detector = self._detector()
+        for i in range(3):
+            detector.sample()
+
+        self.index.get('/a').count = 2
+        zscores = detector.sample()
+        self.assertTrue(zscores[0] < -3)
+        self.assertEquals(0, zscores[1])
+
+        updates = self._updates()
+        self.assertEquals(1, len(updates))
+        self.assertEquals('/a', updates[0]['path'])
+        self.assertEquals(states.ANOMALY, updates[0]['state'])
+        self.assertTrue('below its baseline of 10.0' in updates[0]['reason'])
+        self.assertEquals(['/a'], detector.status()['anomalous'])
+
+        # Back to normal
+        self.index.get('/a').count = 10
+        detector.sample()
+        updates = self._updates()
+        self.assertEquals(2, len(updates))
+        self.assertEquals(states.OK, updates[1]['state'])
+        self.assertEquals([], detector.status()['anomalous'])
+
+    def testBaselineAdapts(self):
+        detector = self._detector()
+        for i in range(3):
+            detector.sample()
+
+        self.index.get('/a').count = 2
+        detector.sample()
+        self.assertEquals(['/a'], detector.status()['anomalous'])
+
+        # The new count becomes part of the baseline, and once it is no
+        # longer an outlier the anomaly clears by itself.
+        for i in range(5):
+            detector.sample()
+        self.assertEquals([], detector.status()['anomalous'])
+        self.assertEquals([states.ANOMALY, states.OK],
+                          [u['state'] for u in self._updates()])
+
+    def testErrorPathsAreLeftAlone(self):
+        detector = self._detector()
+        for i in range(3):
+            detector.sample()
+
+        self.index.get('/b').update(count=0, state=states.ERROR)
+        detector.sample()
+        self.assertEquals([], self._updates())
+
+    def testRaisedOnceBackToOK(self):
+        detector = anomaly.AnomalyDetector(
+            self.paths, self.index, self.dispatcher,
+            samples=30, min_samples=3, threshold=3)
+        for i in range(20):
+            detector.sample()
+
+        # Anomalous while in Error: nothing yet ...
+        self.index.get('/a').update(count=2, state=states.ERROR)
+        detector.sample()
+        self.assertEquals([], self._updates())
+        self.assertEquals([], detector.status()['anomalous'])
+
+        # ... but once the rules are happy again, it still is an anomaly
+        self.index.get('/a').state = states.OK
+        detector.sample()
+        self.assertEquals([states.ANOMALY],
+                          [u['state'] for u in self._updates()])
+
+    def testSetAndRemovePath(self):
+        detector = self._detector()
+        for i in range(3):
+            detector.sample()
+
+        self.index.get('/0').update(count=5, state=states.OK)
+        detector.set_path('/0')
+        detector.set_path('/0')
+        self.assertEquals(3, detector.status()['paths'])
+
+        # The new path needs a baseline of its own
+        for i in range(3):
+            detector.sample()
+        self.index.get('/0').count = 50
+        self.index.get('/a').count = 2
+        detector.sample()
+        self.assertEquals(['/0', '/a'], detector.status()['anomalous'])
+
+        detector.remove_path('/0')
+        detector.remove_path('/x')
+        self.assertEquals(['/a'], detector.status()['anomalous'])
+        self.assertEquals(2, detector.status()['paths'])
+
+    def testUnknownCounts(self):
+        self.index.get('/b').count = None
+        detector = self._detector()
+        for i in range(4):
+            detector.sample()
+        self.assertEquals([], self._updates())
+
+    def testFleetSize(self):
+        paths = ['/p/%d' % i for i in xrange(50000)]
+        index = pathstate.PathIndex()
+        for i, path in enumerate(paths):
+            index.get(path).update(count=i % 100, state=states.OK)
+
+        detector = anomaly.AnomalyDetector(paths, index, self.dispatcher)
+        for i in range(anomaly.SAMPLES):
+            detector.sample()
+
+        begin = time.time()
+        detector.sample()
+        self.assertTrue(time.time() - begin < 1)
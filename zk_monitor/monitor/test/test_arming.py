@@ -0,0 +1,66 @@
+import time
+
+from tornado import gen
+from tornado import testing
+
+from zk_monitor.monitor import arming
+
+
+class TestWatchArmer(testing.AsyncTestCase):
+    @gen.coroutine
+    def sleep(self, seconds):
+        yield gen.Task(self.io_loop.add_timeout, time.time() + seconds)
+
+    @testing.gen_test
+    def testPriorityOrder(self):
+        armed = []
+        armer = arming.WatchArmer(armed.append, rate=1000, jitter=0)
+        armer.add('/low')
+        armer.add('/high', priority=10)
+        armer.add('/also_low')
+        armer.add('/high')
+        self.assertEquals(3, len(armer))
+        self.assertEquals(
+            {'pending': 3, 'armed': 0, 'total': 3,
+             'began': armer.status()['began']}, armer.status())
+
+        yield self.sleep(0.05)
+        self.assertEquals(['/high', '/low', '/also_low'], armed)
+        self.assertEquals(0, armer.status()['pending'])
+        self.assertEquals(3, armer.status()['armed'])
+
+    @testing.gen_test
+    def testRateAndJitter(self):
+        armed = []
+        armer = arming.WatchArmer(armed.append, rate=100, jitter=0.05)
+        for i in range(110):
+            armer.add('/%d' % i)
+
+        # Nothing happens before the jitter, then the burst goes out ...
+        yield self.sleep(0.06)
+        self.assertTrue(100 <= len(armed) < 110)
+
+        # ... and the rest at the rate of the bucket
+        yield self.sleep(0.15)
+        self.assertEquals(110, len(armed))
+
+    @testing.gen_test
+    def testWithoutJitter(self):
+        armed = []
+        armer = arming.WatchArmer(armed.append, rate=100, jitter=5)
+        armer.add('/admin', jitter=False)
+        yield self.sleep(0.02)
+        self.assertEquals(['/admin'], armed)
+
+    @testing.gen_test
+    def testFailuresDoNotStop(self):
+        def arm(path):
+            if path == '/bad':
+                raise Exception('boom')
+            armed.append(path)
+        armed = []
+        armer = arming.WatchArmer(arm, rate=1000, jitter=0)
+        armer.add('/bad')
+        armer.add('/good')
+        yield self.sleep(0.02)
+        self.assertEquals(['/good'], armed)
@@ -0,0 +1,134 @@
+import mock
+
+import nd_service_registry
+from tornado import testing
+from tornado.testing import unittest
+
+from zk_monitor import monitor
+from zk_monitor.monitor import ensembles
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import priority
+
+
+class TestConfig(unittest.TestCase):
+    def testParse(self):
+        self.assertEquals({'east': 'zk1:2181,zk2:2181', 'west': 'zk3:2181'},
+                          ensembles.parse(['east=zk1:2181,zk2:2181',
+                                           ' west = zk3:2181']))
+        self.assertEquals({}, ensembles.parse(None))
+        for invalid in (['east'], ['=zk1'], ['default=zk1'],
+                        ['east=zk1', 'east=zk2']):
+            self.assertRaises(monitor.InvalidConfigException,
+                              ensembles.parse, invalid)
+
+    def testSplit(self):
+        paths = {'/a': None, '/b': {'children': 1},
+                 '/c': {'ensemble': 'east'}}
+        self.assertEquals(
+            {'default': {'/a': None, '/b': {'children': 1}},
+             'east': {'/c': {'ensemble': 'east'}}},
+            ensembles.split(paths, ['default', 'east']))
+        self.assertRaises(monitor.InvalidConfigException,
+                          ensembles.split, paths, ['default'])
+
+    @mock.patch.object(nd_service_registry.KazooServiceRegistry, '__init__')
+    def testConnect(self, init_mock):
+        init_mock.return_value = None
+        east = ensembles.connect('east', server='zk1:2181')
+        west = ensembles.connect('west', server='zk2:2181')
+
+        # Each ensemble gets a registry of its own, not the singleton
+        self.assertFalse(east is west)
+        self.assertTrue(
+            isinstance(east, nd_service_registry.KazooServiceRegistry))
+        self.assertEquals(None,
+                          nd_service_registry.KazooServiceRegistry._instance)
+        init_mock.assert_called_with(server='zk2:2181')
+
+
+class TestMonitorGroup(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestMonitorGroup, self).setUp()
+        self.disp = mock.MagicMock(name='Dispatcher')
+        self.ndsrs = {}
+        monitors = {}
+        for name, paths in (('default', {'/a': {'children': 1}}),
+                            ('east', {'/b': {'children': 1,
+                                             'ensemble': 'east'}})):
+            ndsr = mock.MagicMock(name=name)
+            ndsr._watchers = {}
+            ndsr.get.return_value = {
+                'data': None, 'stat': None, 'children': ['x']}
+            self.ndsrs[name] = ndsr
+            monitors[name] = monitor.Monitor(
+                self.disp, ndsr, mock.MagicMock(), paths)
+        self.monitors = monitors
+        self.group = ensembles.MonitorGroup(monitors)
+
+    def testWatchesPerEnsemble(self):
+        self.ndsrs['default'].get.assert_called_once_with(
+            '/a', callback=self.monitors['default']._pathUpdateCallback)
+        self.ndsrs['east'].get.assert_called_once_with(
+            '/b', callback=self.monitors['east']._pathUpdateCallback)
+
+    def testStatus(self):
+        status = self.group.status()
+        self.assertEquals(['/a', '/b'], sorted(status['compliance']))
+        self.assertEquals('OK', status['compliance']['/b']['state'])
+        self.assertEquals(1, status['ensembles']['east']['paths'])
+        self.assertEquals({'/b': {'children': 1, 'ensemble': 'east'}},
+                          {'/b': self.group.get_path('/b')})
+        self.assertRaises(KeyError, self.group.get_path, '/c')
+
+    def testHealth(self):
+        for name, path in (('default', '/a'), ('east', '/b')):
+            self.monitors[name]._pathUpdateCallback({'path': path})
+        health = self.group.health()
+        self.assertTrue(health['warm'])
+        self.assertEquals(2, health['paths'])
+
+        # One disconnected ensemble is enough to not be ready
+        self.monitors['east']._stateListener(False)
+        self.assertFalse(self.group.health()['connected'])
+
+    def testSetPath(self):
+        self.assertTrue(self.group.set_path('/c', {'ensemble': 'east'}))
+        self.assertTrue('/c' in self.monitors['east'])
+
+        # Moving a path to another ensemble
+        self.assertFalse(self.group.set_path('/c', {'children': 1}))
+        self.assertTrue('/c' in self.monitors['default'])
+        self.assertFalse('/c' in self.monitors['east'])
+
+        self.assertRaises(monitor.InvalidConfigException,
+                          self.group.set_path, '/c', {'ensemble': 'north'})
+
+        self.assertTrue(self.group.remove_path('/c'))
+        self.assertFalse(self.group.remove_path('/c'))
+        self.assertEquals(None, self.group.history('/c'))
+
+    def testMoveKeepsSharedState(self):
+        # As in runserver, the ensembles share their priorities and index
+        shared = priority.Priorities({})
+        index = pathstate.PathIndex()
+        monitors = {}
+        for name in ('default', 'east'):
+            ndsr = mock.MagicMock(name=name)
+            ndsr._watchers = {}
+            ndsr.get.return_value = {
+                'data': None, 'stat': None, 'children': ['x']}
+            monitors[name] = monitor.Monitor(
+                self.disp, ndsr, mock.MagicMock(), {}, index=index,
+                priorities=shared)
+        group = ensembles.MonitorGroup(monitors)
+
+        group.set_path('/c', {'children': 1, 'priority': 'critical',
+                              'ensemble': 'east'})
+        self.assertFalse(group.set_path('/c', {'children': 1,
+                                               'priority': 'critical'}))
+        self.assertEquals(priority.CLASSES['critical'], shared.get('/c'))
+
+        # An invalid config leaves the path where it was
+        self.assertRaises(monitor.InvalidConfigException, group.set_path,
+                          '/c', {'priority': 'urgent', 'ensemble': 'east'})
+        self.assertTrue('/c' in monitors['default'])
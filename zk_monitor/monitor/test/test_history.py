@@ -0,0 +1,55 @@
+from tornado.testing import unittest
+
+from zk_monitor.monitor import history
+
+
+class TestHistory(unittest.TestCase):
+    def testAppend(self):
+        h = history.History(size=3)
+        self.assertEquals(0, len(h))
+        self.assertEquals([], h.series())
+
+        h.append(1.0, 5, 'OK')
+        h.append(2.0, None, 'Unknown')
+        self.assertEquals(2, len(h))
+        self.assertEquals([[1.0, 5, 'OK'], [2.0, None, 'Unknown']],
+                          h.series())
+
+    def testWrapAround(self):
+        h = history.History(size=3)
+        for i in range(5):
+            h.append(float(i), i, 'OK')
+
+        # Memory is bounded, only the newest entries are kept
+        self.assertEquals(3, len(h))
+        self.assertEquals([[2.0, 2, 'OK'], [3.0, 3, 'OK'], [4.0, 4, 'OK']],
+                          h.series())
+        self.assertEquals([[4.0, 4, 'OK']], h.series(since=3.0))
+
+    def testDownsample(self):
+        h = history.History(size=10)
+        for i in range(10):
+            h.append(float(i), 10 - i, 'Error' if i == 2 else 'OK')
+
+        # Each point has the last time, the lowest count and the worst state
+        # of the entries it covers.
+        self.assertEquals(
+            [[4.0, 6, 'Error'], [9.0, 1, 'OK']], h.series(points=2))
+        self.assertEquals(
+            [[7.0, 3, 'OK'], [9.0, 1, 'OK']], h.series(since=5.0, points=2))
+        self.assertEquals(10, len(h.series(points=50)))
+
+
+class TestHistoryStore(unittest.TestCase):
+    def testRecord(self):
+        store = history.HistoryStore(size=2)
+        self.assertEquals(None, store.get('/foo'))
+
+        store.record('/foo', 1.0, 3, 'OK')
+        store.record('/foo', 2.0, 2, 'Error')
+        store.record('/foo', 3.0, 1, 'Error')
+        self.assertEquals([[2.0, 2, 'Error'], [3.0, 1, 'Error']],
+                          store.get('/foo').series())
+
+        store.forget('/foo')
+        self.assertEquals(None, store.get('/foo'))
@@ -0,0 +1,51 @@
+from tornado.testing import unittest
+
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import states
+
+
+class TestPathState(unittest.TestCase):
+    def testDefaults(self):
+        record = pathstate.PathState('/foo')
+        self.assertEquals(record.path, '/foo')
+        self.assertEquals(record.state, states.UNKNOWN)
+        self.assertEquals(record.alert_state, states.UNKNOWN)
+        self.assertEquals(record.next_action, None)
+
+    def testUpdate(self):
+        record = pathstate.PathState('/foo')
+        record.update(state=states.OK, count=3)
+        self.assertEquals(record.state, states.OK)
+        self.assertEquals(record.count, 3)
+
+        # Records are slotted, so typos can't silently add new attributes
+        self.assertRaises(AttributeError, record.update, stat=states.OK)
+
+    def testToDict(self):
+        record = pathstate.PathState('/foo')
+        record.count = 2
+        data = record.to_dict()
+        self.assertEquals(data['path'], '/foo')
+        self.assertEquals(data['count'], 2)
+        self.assertEquals(sorted(data.keys()),
+                          sorted(pathstate.PathState.__slots__))
+
+
+class TestPathIndex(unittest.TestCase):
+    def testGet(self):
+        index = pathstate.PathIndex()
+        self.assertFalse('/foo' in index)
+
+        record = index.get('/foo')
+        self.assertTrue('/foo' in index)
+        self.assertTrue(index.get('/foo') is record)
+        self.assertEquals(len(index), 1)
+        self.assertEquals(list(index), ['/foo'])
+        self.assertEquals(index.records(), [record])
+
+    def testRemove(self):
+        index = pathstate.PathIndex()
+        index.get('/foo')
+        index.remove('/foo')
+        index.remove('/bar')
+        self.assertEquals(len(index), 0)
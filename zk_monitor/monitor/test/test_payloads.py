@@ -0,0 +1,121 @@
+import mock
+
+from kazoo.exceptions import NoNodeError
+from kazoo.protocol.states import ZnodeStat
+from tornado import testing
+
+from zk_monitor.monitor import payloads
+
+
+def stat(mzxid):
+    return ZnodeStat(czxid=1, mzxid=mzxid, ctime=0, mtime=0, version=0,
+                     cversion=0, aversion=0, ephemeralOwner=0, dataLength=0,
+                     numChildren=0, pzxid=0)
+
+
+class FakeResult(object):
+    """Mimics a completed Kazoo IAsyncResult."""
+
+    def __init__(self, value=None, exc=None):
+        self._value = value
+        self._exc = exc
+
+    def get(self):
+        if self._exc:
+            raise self._exc
+        return self._value
+
+    def rawlink(self, callback):
+        callback(self)
+
+
+class FakeZookeeper(object):
+    def __init__(self, nodes):
+        # {path: (data, mzxid)}
+        self.nodes = nodes
+        self.calls = []
+
+    def exists_async(self, path):
+        self.calls.append(('exists', path))
+        if path not in self.nodes:
+            return FakeResult(None)
+        return FakeResult(stat(self.nodes[path][1]))
+
+    def get_async(self, path):
+        self.calls.append(('get', path))
+        if path not in self.nodes:
+            return FakeResult(exc=NoNodeError())
+        data, mzxid = self.nodes[path]
+        return FakeResult((data, stat(mzxid)))
+
+
+class TestPayloadCache(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestPayloadCache, self).setUp()
+        self.zk = FakeZookeeper({
+            '/foo/a': ('{"port": 1}', 10),
+            '/foo/b': ('{"port": 2}', 20)})
+        self.ndsr = mock.MagicMock()
+        self.ndsr._zk = self.zk
+        self.cache = payloads.PayloadCache(self.ndsr)
+
+    @testing.gen_test
+    def testRefresh(self):
+        self.assertEquals({}, self.cache.get('/foo'))
+
+        # New children are read right away
+        yield self.cache.refresh('/foo', ['a', 'b'])
+        self.assertEquals({'a': {'port': 1}, 'b': {'port': 2}},
+                          self.cache.get('/foo'))
+        self.assertEquals(
+            sorted(self.zk.calls), [('get', '/foo/a'), ('get', '/foo/b')])
+
+        # Unchanged children only cost an exists() call
+        self.zk.calls = []
+        self.zk.nodes['/foo/b'] = ('{"port": 3}', 21)
+        yield self.cache.refresh('/foo', ['a', 'b'])
+        self.assertEquals({'a': {'port': 1}, 'b': {'port': 3}},
+                          self.cache.get('/foo'))
+        self.assertEquals(sorted(self.zk.calls), [
+            ('exists', '/foo/a'), ('exists', '/foo/b'), ('get', '/foo/b')])
+
+        # Children that went away are dropped without any calls
+        self.zk.calls = []
+        yield self.cache.refresh('/foo', ['a'])
+        self.assertEquals({'a': {'port': 1}}, self.cache.get('/foo'))
+        self.assertEquals(self.zk.calls, [('exists', '/foo/a')])
+
+    @testing.gen_test
+    def testRefreshMissingChild(self):
+        yield self.cache.refresh('/foo', ['a', 'gone'])
+        self.assertEquals({'a': {'port': 1}}, self.cache.get('/foo'))
+
+    @testing.gen_test
+    def testConcurrency(self):
+        in_flight = []
+        peak = []
+        io_loop = self.io_loop
+
+        class SlowResult(FakeResult):
+            def rawlink(self, callback):
+                in_flight.append(self)
+                peak.append(len(in_flight))
+
+                def finish():
+                    in_flight.remove(self)
+                    callback(self)
+                io_loop.add_callback(finish)
+
+        self.zk.get_async = lambda path: SlowResult(('{}', stat(1)))
+        cache = payloads.PayloadCache(self.ndsr, concurrency=2)
+        yield cache.refresh('/foo', ['c%s' % i for i in range(10)])
+
+        self.assertEquals(10, len(cache.get('/foo')))
+        self.assertEquals(2, max(peak))
+
+    def testForget(self):
+        self.cache._payloads['/foo'] = {'a': {}}
+        self.cache._versions['/foo'] = {'a': 1}
+        self.cache.forget('/foo')
+        self.assertEquals({}, self.cache.get('/foo'))
+        self.assertFalse('/foo' in self.cache._versions)
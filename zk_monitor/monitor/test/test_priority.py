@@ -0,0 +1,75 @@
+from tornado import testing
+from tornado.testing import unittest
+
+from zk_monitor.monitor import priority
+
+
+class TestPriorities(unittest.TestCase):
+    def testParse(self):
+        self.assertEquals(30, priority.parse('critical'))
+        self.assertEquals(30, priority.parse('Critical'))
+        self.assertEquals(0, priority.parse('low'))
+        self.assertEquals(15, priority.parse(15))
+        self.assertRaises(priority.InvalidPriorityException,
+                          priority.parse, 'urgent')
+        self.assertRaises(priority.InvalidPriorityException,
+                          priority.parse, True)
+        self.assertRaises(priority.InvalidPriorityException,
+                          priority.parse, None)
+
+    def testInherit(self):
+        p = priority.Priorities({
+            '/services/payments': {'priority': 'critical'},
+            '/services/payments/api': {'children': 3},
+            '/services/payments/api/canary': {'priority': 'low'},
+            '/services/payments/api/canary/x': None,
+            '/sandbox': {'children': 1}})
+        self.assertEquals(30, p.get('/services/payments/api'))
+        self.assertEquals(0, p.get('/services/payments/api/canary/x'))
+        self.assertEquals(priority.DEFAULT, p.get('/sandbox'))
+        self.assertEquals(priority.DEFAULT, p.get('/not/configured'))
+
+    def testInvalid(self):
+        self.assertRaises(priority.InvalidPriorityException,
+                          priority.Priorities, {'/a': {'priority': 'x'}})
+
+    def testSetAndRemove(self):
+        p = priority.Priorities({
+            '/services/payments/api': {'children': 3},
+            '/sandbox': None})
+        self.assertEquals(priority.DEFAULT, p.get('/services/payments/api'))
+
+        # Configured paths below a new one inherit its priority
+        p.set('/services/payments', {'priority': 'critical'})
+        self.assertEquals(30, p.get('/services/payments'))
+        self.assertEquals(30, p.get('/services/payments/api'))
+        self.assertEquals(priority.DEFAULT, p.get('/sandbox'))
+
+        p.remove('/services/payments')
+        self.assertEquals(priority.DEFAULT, p.get('/services/payments/api'))
+
+        self.assertRaises(priority.InvalidPriorityException,
+                          p.set, '/sandbox', {'priority': 'x'})
+
+
+class TestPrioritySemaphore(testing.AsyncTestCase):
+    def testOrder(self):
+        sem = priority.PrioritySemaphore(1)
+        first = sem.acquire()
+        self.assertTrue(first.done())
+
+        order = []
+        for name, prio in (('low', 0), ('high', 20), ('normal', 10),
+                           ('high2', 20)):
+            sem.acquire(prio).add_done_callback(
+                lambda f, name=name: order.append(name))
+
+        for i in range(4):
+            sem.release()
+            self.io_loop.add_callback(self.stop)
+            self.wait()
+        self.assertEquals(['high', 'high2', 'normal', 'low'], order)
+
+        # All released, the next one goes right through
+        sem.release()
+        self.assertTrue(sem.acquire().done())
@@ -0,0 +1,25 @@
+import time
+
+from tornado import testing
+
+from zk_monitor.monitor import ratelimit
+
+
+class TestTokenBucket(testing.AsyncTestCase):
+    def testConsume(self):
+        bucket = ratelimit.TokenBucket(rate=1, burst=2)
+        self.assertTrue(bucket.consume())
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+
+    @testing.gen_test
+    def testAcquire(self):
+        bucket = ratelimit.TokenBucket(rate=50)
+        for i in range(50):
+            yield bucket.acquire()
+
+        # The burst is used up, further tokens come at the rate
+        began = time.time()
+        for i in range(5):
+            yield bucket.acquire()
+        self.assertTrue(time.time() - began >= 0.07)
@@ -0,0 +1,113 @@
+import mock
+
+from kazoo.exceptions import NoNodeError
+from nd_service_registry.watcher import DummyWatcher
+from tornado import testing
+
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import reconcile
+
+
+class FakeResult(object):
+    """Mimics a completed Kazoo IAsyncResult."""
+
+    def __init__(self, value=None, exc=None):
+        self._value = value
+        self._exc = exc
+
+    def get(self):
+        if self._exc:
+            raise self._exc
+        return self._value
+
+    def rawlink(self, callback):
+        callback(self)
+
+
+class FakeZookeeper(object):
+    def __init__(self, children):
+        self.children = children
+        self.calls = 0
+
+    def get_children_async(self, path):
+        self.calls += 1
+        if path not in self.children:
+            return FakeResult(exc=NoNodeError())
+        return FakeResult(self.children[path])
+
+
+def watcher(children):
+    w = mock.Mock()
+    w.get.return_value = {'children': children}
+    return w
+
+
+class TestReconciler(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestReconciler, self).setUp()
+        self.ndsr = mock.MagicMock()
+        self.ndsr.get_state.return_value = True
+        self.ndsr._zk = FakeZookeeper({
+            '/ok': ['a', 'b'],
+            '/stale_watch': ['a', 'b'],
+            '/stale_state': ['a'],
+            '/no_watch': ['a']})
+        self.ndsr._watchers = {
+            '/ok': watcher(['a', 'b']),
+            '/stale_watch': watcher(['a']),
+            '/stale_state': watcher(['a']),
+            '/no_watch': DummyWatcher('/no_watch', {
+                'data': None, 'stat': None, 'children': []}),
+            '/gone': watcher([])}
+
+        self.index = pathstate.PathIndex()
+        self.index.get('/ok').count = 2
+        self.index.get('/stale_watch').count = 1
+        self.index.get('/stale_state').count = 3
+        self.index.get('/gone').count = 0
+
+        self.rearm = mock.Mock()
+        self.reevaluate = mock.Mock()
+        self.reconciler = reconcile.Reconciler(
+            self.ndsr, ['/ok', '/stale_watch', '/stale_state', '/no_watch',
+                        '/gone'],
+            self.index, self.rearm, self.reevaluate,
+            rate=1000, concurrency=2, grace=0.01)
+
+    @testing.gen_test
+    def testSweep(self):
+        drifted = yield self.reconciler.sweep()
+        self.assertEquals({'/stale_watch': 'watch',
+                           '/stale_state': 'state',
+                           '/no_watch': 'watch'}, drifted)
+        self.assertEquals(
+            ['/no_watch', '/stale_watch'],
+            sorted(c[0][0] for c in self.rearm.call_args_list))
+        self.reevaluate.assert_called_once_with('/stale_state')
+
+        status = self.reconciler.status()
+        self.assertEquals(1, status['sweeps'])
+        self.assertEquals(5, status['checked'])
+        self.assertEquals({'watch': 2, 'state': 1}, status['drift'])
+        self.assertEquals(5, status['last_sweep']['checked'])
+
+        # Drift is only acted on after it was confirmed once more
+        self.assertEquals(5 + 3 * 1, self.ndsr._zk.calls)
+
+    @testing.gen_test
+    def testTransientDrift(self):
+        # The update arrives within the grace period
+        def update():
+            self.ndsr._watchers['/stale_watch'] = watcher(['a', 'b'])
+            self.index.get('/stale_watch').count = 2
+        self.io_loop.call_later(0.005, update)
+
+        drifted = yield self.reconciler.sweep()
+        self.assertFalse('/stale_watch' in drifted)
+
+    @testing.gen_test
+    def testDisconnected(self):
+        self.ndsr.get_state.return_value = False
+        drifted = yield self.reconciler.sweep()
+        self.assertEquals({}, drifted)
+        self.assertEquals(0, self.ndsr._zk.calls)
@@ -0,0 +1,261 @@
+from kazoo.protocol.states import ZnodeStat
+from tornado.testing import unittest
+
+from zk_monitor.monitor import rules
+
+
+class TestRules(unittest.TestCase):
+    def testDuration(self):
+        self.assertEquals('90s', rules.duration(90))
+        self.assertEquals('15m', rules.duration(900))
+        self.assertEquals('24h', rules.duration(86400))
+
+    def testMinChildren(self):
+        rule = rules.MinChildren(2)
+        self.assertEquals(None, rule.check(rules.Sample(2, 0)))
+        self.assertEquals('1 children is less than minimum 2',
+                          rule.check(rules.Sample(1, 0)))
+
+    def testMaxChildren(self):
+        rule = rules.MaxChildren(2)
+        self.assertEquals(None, rule.check(rules.Sample(2, 0)))
+        self.assertEquals('3 children is more than maximum 2',
+                          rule.check(rules.Sample(3, 0)))
+
+    def testPercentOfPeak(self):
+        rule = rules.PercentOfPeak(50, window=240)
+
+        self.assertEquals(None, rule.check(rules.Sample(10, 0)))
+        self.assertEquals(None, rule.check(rules.Sample(5, 30)))
+        self.assertEquals('4 children is less than 50% of the 4m peak (10)',
+                          rule.check(rules.Sample(4, 60)))
+
+        # Once the peak has aged out of the window it no longer counts
+        self.assertEquals(None, rule.check(rules.Sample(4, 250)))
+
+    def testPercentOfPeakDeadline(self):
+        rule = rules.PercentOfPeak(50, window=240)
+        self.assertTrue(rule.timed)
+
+        rule.check(rules.Sample(10, 5))
+        self.assertEquals(None, rule.deadline(rules.Sample(10, 5)))
+
+        # Failing because of the peak in the 0-10s bucket, which expires
+        # once the window moved past it
+        self.assertTrue(rule.check(rules.Sample(4, 30)))
+        self.assertEquals(240, rule.deadline(rules.Sample(4, 30)))
+
+        # At the deadline the verdict clears without any new count
+        self.assertEquals(None, rule.check(rules.Sample(4, 240)))
+        self.assertEquals(None, rule.deadline(rules.Sample(4, 240)))
+
+    def testRapidDrop(self):
+        rule = rules.RapidDrop(40, 60)
+
+        self.assertEquals(None, rule.check(rules.Sample(100, 0)))
+        self.assertEquals(None, rule.check(rules.Sample(200, 10)))
+        self.assertEquals(None, rule.check(rules.Sample(150, 20)))
+        self.assertEquals(None, rule.deadline(rules.Sample(150, 20)))
+
+        # Dropping more than 40% of the window's maximum fails ...
+        self.assertEquals(
+            'children dropped by 140 (70%) from 200 to 60 within 1m',
+            rule.check(rules.Sample(60, 30)))
+
+        # ... until the maximum ages out of the window
+        self.assertEquals(70, rule.deadline(rules.Sample(60, 30)))
+        self.assertEquals(
+            'children dropped by 90 (60%) from 150 to 60 within 1m',
+            rule.check(rules.Sample(60, 71)))
+        self.assertEquals(None, rule.check(rules.Sample(60, 81)))
+
+        # The queue only keeps counts that can still be the maximum
+        self.assertEquals([(81, 60)], list(rule._queue))
+
+        # A count leaves the window right at its deadline
+        rule = rules.RapidDrop(40, 60)
+        rule.check(rules.Sample(100, 0))
+        self.assertEquals(60, rule.deadline(rules.Sample(10, 0)))
+        self.assertTrue(rule.check(rules.Sample(10, 30)))
+        self.assertEquals(None, rule.check(rules.Sample(10, 60)))
+
+    def testCheckWithoutRecording(self):
+        for rule in (rules.RapidDrop(40, 60), rules.PercentOfPeak(50, 60)):
+            self.assertEquals(None, rule.check(rules.Sample(100, 0)))
+
+            # Checks that are not recorded still see the history ...
+            self.assertTrue(rule.check(rules.Sample(10, 5, record=False)))
+            # ... but do not add to it
+            self.assertEquals(None,
+                              rule.check(rules.Sample(500, 6, record=False)))
+            self.assertEquals(None, rule.check(rules.Sample(100, 7)))
+
+    def testMinMatching(self):
+        rule = rules.MinMatching({'healthy': True}, 2)
+        payloads = {'a': {'healthy': True}, 'b': {'healthy': False},
+                    'c': None, 'd': {'healthy': True, 'port': 1}}
+        self.assertEquals(None, rule.check(rules.Sample(4, 0, payloads)))
+
+        del payloads['d']
+        self.assertEquals(
+            '1 children with healthy=True is less than minimum 2',
+            rule.check(rules.Sample(3, 0, payloads)))
+
+    def testUniqueValue(self):
+        rule = rules.UniqueValue('port')
+        payloads = {'a': {'port': 1}, 'b': {'port': 2}, 'c': {}, 'd': None}
+        self.assertEquals(None, rule.check(rules.Sample(4, 0, payloads)))
+
+        payloads['c'] = {'port': 1}
+        payloads['e'] = {'port': 2}
+        self.assertEquals('children share port: 1 (a, c); 2 (b, e)',
+                          rule.check(rules.Sample(5, 0, payloads)))
+
+    def testMaxAge(self):
+        rule = rules.MaxAge(900)
+        stat = ZnodeStat(czxid=1, mzxid=1, ctime=0, mtime=100000, version=0,
+                         cversion=0, aversion=0, ephemeralOwner=0,
+                         dataLength=0, numChildren=0, pzxid=0)
+
+        self.assertEquals(None, rule.check(rules.Sample(0, 999, stat=stat)))
+        self.assertEquals(1000,
+                          rule.deadline(rules.Sample(0, 999, stat=stat)))
+
+        # A deadline timer firing right on time sees a stale path
+        self.assertEquals('last modified 900s ago, more than max age 15m',
+                          rule.check(rules.Sample(0, 1000, stat=stat)))
+        self.assertEquals('last modified 1100s ago, more than max age 15m',
+                          rule.check(rules.Sample(0, 1200, stat=stat)))
+
+        self.assertEquals('path does not exist',
+                          rule.check(rules.Sample(0, 1000)))
+        self.assertEquals(None, rule.deadline(rules.Sample(0, 1000)))
+
+        rule = rules.MaxAge(60, since='ctime')
+        self.assertEquals('created 100s ago, more than max age 1m',
+                          rule.check(rules.Sample(0, 100, stat=stat)))
+
+        # The RuleSet only hands out deadlines that are still ahead
+        ruleset = rules.RuleSet([rules.MinChildren(1), rules.MaxAge(900)])
+        self.assertEquals(1000, ruleset.deadline(
+            rules.Sample(1, 500, stat=stat)))
+        self.assertEquals(None, ruleset.deadline(
+            rules.Sample(1, 1200, stat=stat)))
+
+    def testRuleSet(self):
+        ruleset = rules.RuleSet([rules.MinChildren(2), rules.MaxChildren(4)])
+        self.assertEquals(2, len(ruleset))
+        self.assertEquals([], ruleset.check(rules.Sample(3, 0)))
+        self.assertEquals(['5 children is more than maximum 4'],
+                          ruleset.check(rules.Sample(5, 0)))
+
+    def testCompile(self):
+        self.assertEquals(None, rules.compile(None))
+        self.assertEquals(None, rules.compile({}))
+        self.assertEquals(None, rules.compile({'alerter': {}}))
+
+        ruleset = rules.compile({'children': 1})
+        self.assertEquals([rules.MinChildren],
+                          [r.__class__ for r in ruleset.rules])
+
+        ruleset = rules.compile({'children': {
+            'min': 1, 'max': 5, 'peak_percent': 50, 'peak_window': 3600,
+            'drop_percent': 40}})
+        self.assertEquals(
+            [rules.MinChildren, rules.MaxChildren, rules.PercentOfPeak,
+             rules.RapidDrop],
+            [r.__class__ for r in ruleset.rules])
+        self.assertEquals(3600, ruleset.rules[2].window)
+        self.assertEquals(rules.DROP_WINDOW, ruleset.rules[3].window)
+        self.assertFalse(ruleset.needs_payloads)
+        self.assertEquals([rules.PercentOfPeak, rules.RapidDrop],
+                          [r.__class__ for r in ruleset.timed])
+
+        ruleset = rules.compile({'children': 1, 'payload': {
+            'match': {'healthy': True}, 'min': 3, 'unique': ['host', 'port']}})
+        self.assertEquals(
+            [rules.MinChildren, rules.MinMatching, rules.UniqueValue,
+             rules.UniqueValue],
+            [r.__class__ for r in ruleset.rules])
+        self.assertTrue(ruleset.needs_payloads)
+        self.assertFalse(ruleset.timed)
+
+        ruleset = rules.compile({'max_age': 900})
+        self.assertEquals([rules.MaxAge], [r.__class__ for r in ruleset.timed])
+        self.assertEquals('mtime', ruleset.rules[0].since)
+        ruleset = rules.compile({'max_age': {'seconds': 60, 'since': 'ctime'}})
+        self.assertEquals('ctime', ruleset.rules[0].since)
+
+    def testMetricRange(self):
+        rule = rules.MetricRange('zk_outstanding_requests', maximum=10)
+        self.assertEquals(None, rule.check(rules.Sample(
+            None, 0, metrics={'zk_outstanding_requests': 10})))
+        self.assertEquals(
+            'zk_outstanding_requests 11 is more than maximum 10',
+            rule.check(rules.Sample(
+                None, 0, metrics={'zk_outstanding_requests': 11})))
+        self.assertEquals('zk_outstanding_requests is not reported',
+                          rule.check(rules.Sample(None, 0, metrics={})))
+
+        rule = rules.MetricRange('zk_followers', minimum=2)
+        self.assertEquals('zk_followers 1 is less than minimum 2',
+                          rule.check(rules.Sample(
+                              None, 0, metrics={'zk_followers': 1})))
+
+    def testMetricIn(self):
+        rule = rules.MetricIn('zk_server_state', ['leader', 'follower'])
+        self.assertEquals(None, rule.check(rules.Sample(
+            None, 0, metrics={'zk_server_state': 'leader'})))
+        self.assertEquals(
+            'zk_server_state standalone is not one of leader, follower',
+            rule.check(rules.Sample(
+                None, 0, metrics={'zk_server_state': 'standalone'})))
+
+        # Paths never carry any metrics
+        self.assertEquals('zk_server_state is not reported',
+                          rule.check(rules.Sample(3, 0)))
+
+    def testCompileMetrics(self):
+        ruleset = rules.compile({'metrics': {
+            'zk_avg_latency': {'min': 0, 'max': 50.5},
+            'zk_server_state': {'in': 'leader'}}})
+        self.assertEquals([rules.MetricRange, rules.MetricIn],
+                          [r.__class__ for r in ruleset.rules])
+        self.assertEquals(50.5, ruleset.rules[0].maximum)
+        self.assertEquals(('leader',), ruleset.rules[1].values)
+
+    def testCompileInvalid(self):
+        invalid = [
+            {'children': 'one'},
+            {'children': None},
+            {'children': True},
+            {'children': -1},
+            {'children': {'min': 'one'}},
+            {'children': {'minimum': 1}},
+            {'children': {'min': 5, 'max': 1}},
+            {'children': {'peak_percent': 0}},
+            {'children': {'peak_percent': 101}},
+            {'children': {'peak_window': 60}},
+            {'children': {'peak_percent': 50, 'peak_window': 1}},
+            {'children': {'drop_percent': 100}},
+            {'children': {'drop_window': 60}},
+            {'payload': 'healthy'},
+            {'payload': {'min': 3}},
+            {'payload': {'match': {'healthy': True}}},
+            {'payload': {'match': 'healthy', 'min': 3}},
+            {'payload': {'unique': ['port', None]}},
+            {'payload': {'health': True}},
+            {'max_age': 0},
+            {'max_age': 'soon'},
+            {'max_age': {'seconds': 60, 'since': 'atime'}},
+            {'max_age': {'minutes': 5}},
+            {'metrics': 'zk_avg_latency'},
+            {'metrics': {'zk_avg_latency': 50}},
+            {'metrics': {'zk_avg_latency': {'maximum': 50}}},
+            {'metrics': {'zk_avg_latency': {'max': 'high'}}},
+            {'metrics': {'zk_avg_latency': {'min': 5, 'max': 1}}},
+            {'metrics': {'zk_server_state': {'in': []}}},
+        ]
+        for config in invalid:
+            self.assertRaises(rules.InvalidRuleException,
+                              rules.compile, config)
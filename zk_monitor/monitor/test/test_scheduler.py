@@ -0,0 +1,72 @@
+import time
+
+from tornado import gen
+from tornado import testing
+
+from zk_monitor.monitor import scheduler
+
+
+class TestDeadlineScheduler(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestDeadlineScheduler, self).setUp()
+        self.fired = []
+        self.scheduler = scheduler.DeadlineScheduler(self.fired.append)
+
+    @gen.coroutine
+    def sleep(self, seconds):
+        # add_timeout is an "engine" function, so it has to be called as a Task
+        yield gen.Task(self.io_loop.add_timeout, time.time() + seconds)
+
+    @testing.gen_test
+    def testSchedule(self):
+        now = time.time()
+        self.scheduler.schedule('/late', now + 0.1)
+        self.scheduler.schedule('/early', now + 0.02)
+        self.assertEquals(2, len(self.scheduler))
+
+        yield self.sleep(0.05)
+        self.assertEquals(['/early'], self.fired)
+
+        yield self.sleep(0.1)
+        self.assertEquals(['/early', '/late'], self.fired)
+        self.assertEquals(0, len(self.scheduler))
+        self.assertEquals(None, self.scheduler._timeout)
+
+    @testing.gen_test
+    def testReschedule(self):
+        now = time.time()
+        self.scheduler.schedule('/foo', now + 0.02)
+        self.scheduler.schedule('/foo', now + 0.08)
+
+        # Only the latest deadline for a key counts
+        yield self.sleep(0.05)
+        self.assertEquals([], self.fired)
+        yield self.sleep(0.05)
+        self.assertEquals(['/foo'], self.fired)
+
+    @testing.gen_test
+    def testCancel(self):
+        self.scheduler.schedule('/foo', time.time() + 0.02)
+        self.scheduler.cancel('/foo')
+        self.scheduler.cancel('/bar')
+
+        yield self.sleep(0.05)
+        self.assertEquals([], self.fired)
+
+    @testing.gen_test
+    def testCallbackErrors(self):
+        def callback(key):
+            self.fired.append(key)
+            raise Exception('unit test')
+        self.scheduler._callback = callback
+
+        now = time.time()
+        self.scheduler.schedule('/foo', now + 0.01)
+        self.scheduler.schedule('/bar', now + 0.01)
+        yield self.sleep(0.05)
+        self.assertEquals(['/bar', '/foo'], sorted(self.fired))
+
+    def testCompaction(self):
+        for deadline in range(200):
+            self.scheduler.schedule('/foo', time.time() + 100 + deadline)
+        self.assertTrue(len(self.scheduler._heap) < 100)
@@ -0,0 +1,159 @@
+import mock
+
+from tornado import gen
+from tornado import tcpserver
+from tornado import testing
+from tornado.testing import unittest
+
+from zk_monitor import monitor
+from zk_monitor.monitor import servers
+from zk_monitor.monitor import states
+
+MNTR = ('zk_version\t3.4.6-1569965, built on 02/20/2014 09:09 GMT\n'
+        'zk_avg_latency\t2\n'
+        'zk_outstanding_requests\t%d\n'
+        'zk_server_state\tleader\n'
+        'zk_znode_count\t1034\n')
+
+SRVR = ('Zookeeper version: 3.5.7-f0fdd52973d373ffd9c86b81d99842dc2c7f660e\n'
+        'Latency min/avg/max: 0/1.5/340\n'
+        'Received: 8170\n'
+        'Sent: 8169\n'
+        'Connections: 3\n'
+        'Outstanding: 0\n'
+        'Zxid: 0x10000002c\n'
+        'Mode: follower\n'
+        'Node count: 1034\n')
+
+NOT_WHITELISTED = 'mntr is not executed because it is not in the whitelist.\n'
+
+
+class FakeZookeeperServer(tcpserver.TCPServer):
+    """Answers four letter words like a Zookeeper server would."""
+
+    def __init__(self, responses):
+        super(FakeZookeeperServer, self).__init__()
+        self.responses = responses
+        self.commands = []
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        command = yield stream.read_bytes(4)
+        self.commands.append(command)
+        response = self.responses.get(command, '')
+        if response is None:
+            # Hang until the client gives up
+            yield stream.read_until_close()
+            return
+        yield stream.write(response)
+        stream.close()
+
+
+class TestParsing(unittest.TestCase):
+    def testAddress(self):
+        self.assertEquals(('zk1', 2182), servers.address('zk://zk1:2182'))
+        self.assertEquals(('zk1', 2181), servers.address('zk://zk1'))
+
+    def testSplit(self):
+        paths, checks = servers.split({'/foo': None, 'zk://zk1:2181': {}})
+        self.assertEquals({'/foo': None}, paths)
+        self.assertEquals({'zk://zk1:2181': {}}, checks)
+
+    def testMntr(self):
+        metrics = servers.parseMntr(MNTR % 7)
+        self.assertEquals(7, metrics['zk_outstanding_requests'])
+        self.assertEquals('leader', metrics['zk_server_state'])
+        self.assertEquals({}, servers.parseMntr(NOT_WHITELISTED))
+
+    def testSrvr(self):
+        metrics = servers.parseSrvr(SRVR)
+        self.assertEquals(1.5, metrics['zk_avg_latency'])
+        self.assertEquals(340, metrics['zk_max_latency'])
+        self.assertEquals(0x10000002c, metrics['zk_zxid'])
+        self.assertEquals('follower', metrics['zk_server_state'])
+        self.assertEquals(1034, metrics['zk_znode_count'])
+
+
+class TestServerMonitor(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestServerMonitor, self).setUp()
+        self.dispatcher = mock.MagicMock(name='Dispatcher')
+        self.fake = FakeZookeeperServer({'mntr': MNTR % 0})
+        sock, port = testing.bind_unused_port()
+        self.fake.add_socket(sock)
+        self.key = 'zk://127.0.0.1:%d' % port
+
+    def tearDown(self):
+        self.fake.stop()
+        super(TestServerMonitor, self).tearDown()
+
+    def _monitor(self, config, **kwargs):
+        return servers.ServerMonitor(self.dispatcher, {self.key: config},
+                                     **kwargs)
+
+    def testInvalidConfig(self):
+        self.assertRaises(monitor.InvalidConfigException, self._monitor,
+                          {'metrics': {'zk_avg_latency': {'max': 'x'}}})
+
+    @testing.gen_test
+    def testPoll(self):
+        sm = self._monitor(
+            {'metrics': {'zk_outstanding_requests': {'max': 10}}})
+        yield sm.poll()
+
+        status = sm.status()[self.key]
+        self.assertEquals(states.OK, status['state'])
+        self.assertEquals(1034, status['metrics']['zk_znode_count'])
+
+        # Unknown -> OK is not worth a dispatch, OK -> Error is
+        yield gen.moment
+        self.assertFalse(self.dispatcher.update.called)
+
+        self.fake.responses['mntr'] = MNTR % 50
+        yield sm.poll()
+        yield gen.moment
+        self.dispatcher.update.assert_called_once_with(
+            path=self.key, state=states.ERROR,
+            reason='zk_outstanding_requests 50 is more than maximum 10')
+
+        # A server that stays in Error is not dispatched again
+        yield sm.poll()
+        yield gen.moment
+        self.assertEquals(1, self.dispatcher.update.call_count)
+
+    @testing.gen_test
+    def testSrvrFallback(self):
+        self.fake.responses = {'mntr': NOT_WHITELISTED, 'srvr': SRVR}
+        sm = self._monitor({'metrics': {'zk_server_state': {'in': 'leader'}}})
+        yield sm.poll()
+
+        self.assertEquals(['mntr', 'srvr'], self.fake.commands)
+        status = sm.status()[self.key]
+        self.assertEquals(states.ERROR, status['state'])
+        self.assertEquals(
+            'zk_server_state follower is not one of leader', status['message'])
+
+    @testing.gen_test
+    def testTimeout(self):
+        self.fake.responses['mntr'] = None
+        sm = self._monitor(None, timeout=0.1)
+        yield sm.poll()
+
+        status = sm.status()[self.key]
+        self.assertEquals(states.ERROR, status['state'])
+        self.assertTrue(status['message'].startswith(
+            'Server is not responding'))
+        self.assertEquals(None, status['metrics'])
+
+    @testing.gen_test
+    def testUnreachable(self):
+        self.fake.stop()
+        sm = self._monitor(None)
+        yield sm.poll()
+        self.assertEquals(states.ERROR, sm.status()[self.key]['state'])
+
+    @testing.gen_test
+    def testNoRules(self):
+        sm = self._monitor(None)
+        yield sm.poll()
+        self.assertEquals(states.UNKNOWN, sm.status()[self.key]['state'])
@@ -17,16 +17,32 @@ Main entry-point script for zk_mnonitor.
 """
 
 from tornado import ioloop
+import functools
 import logging
 import nd_service_registry
 import optparse
+import os
+import socket
 import yaml
 
+from zk_monitor import canary
 from zk_monitor import cluster
+from zk_monitor import heartbeat
+from zk_monitor import instrument
+from zk_monitor import snapshot
+from zk_monitor import statsd
 from zk_monitor import monitor
 from zk_monitor import utils
+from zk_monitor.alerts import correlation
+from zk_monitor.alerts import dependencies
 from zk_monitor.alerts import dispatcher
+from zk_monitor.monitor import anomaly
+from zk_monitor.monitor import ensembles
+from zk_monitor.monitor import pathstate
+from zk_monitor.monitor import priority
+from zk_monitor.monitor import servers
 from zk_monitor.version import __version__ as VERSION
+from zk_monitor.web import aggregate
 from zk_monitor.web import app
 
 log = logging.getLogger(__name__)
@@ -45,6 +61,16 @@ parser.set_defaults(verbose=True)
 parser.add_option('-z', '--zookeeper', dest='zookeeper',
                   default='localhost:2181',
                   help='Zookeeper Server (def: localhost:2181)')
+parser.add_option('--ensemble', dest='ensembles', action='append',
+                  default=[],
+                  help='Another Zookeeper ensemble to monitor paths on, as '
+                       'NAME=SERVERS (ie, east=zk-east:2181). Paths select '
+                       'it with their "ensemble" setting. May be repeated.')
+parser.add_option('--operation_depth', dest='operation_depth',
+                  default='2',
+                  help='Number of path components Zookeeper operations are '
+                       'grouped by in /operations (def: 2, 0 disables the '
+                       'instrumentation)')
 parser.add_option('--zookeeper_user', dest='zookeeper_user',
                   default=None,
                   help='Zookeeper ACL Username')
@@ -66,20 +92,143 @@ parser.add_option('--cluster_prefix', dest='cluster_prefix',
 parser.add_option('-f', '--file', dest='file',
                   default=None,
                   help='Path to YAML file with znodes to monitor.')
+parser.add_option('--coalesce_window', dest='coalesce_window',
+                  default='0.25',
+                  help='Seconds to collapse bursts of updates to a path into '
+                       'one evaluation (def: 0.25)')
+parser.add_option('--payload_concurrency', dest='payload_concurrency',
+                  default='10',
+                  help='Max concurrent reads of child data for payload '
+                       'rules (def: 10)')
+parser.add_option('--history_size', dest='history_size',
+                  default='360',
+                  help='Number of evaluations remembered per path for '
+                       '/history (def: 360)')
+parser.add_option('--reconcile_interval', dest='reconcile_interval',
+                  default='300',
+                  help='Seconds between sweeps comparing all paths against '
+                       'Zookeeper to catch missed watches (def: 300, 0 '
+                       'disables)')
+parser.add_option('--reconcile_rate', dest='reconcile_rate',
+                  default='20',
+                  help='Max paths checked per second by a sweep (def: 20)')
+parser.add_option('--reconcile_concurrency', dest='reconcile_concurrency',
+                  default='5',
+                  help='Max paths checked at once by a sweep (def: 5)')
+parser.add_option('--watch_rate', dest='watch_rate',
+                  default='200',
+                  help='Max watches registered per second, highest priority '
+                       'paths first (def: 200, 0 registers all at once)')
+parser.add_option('--watch_jitter', dest='watch_jitter',
+                  default='5',
+                  help='Max random delay in seconds before registering '
+                       'watches (def: 5)')
+parser.add_option('--anomaly_interval', dest='anomaly_interval',
+                  default='0',
+                  help='Seconds between fleet-wide child count anomaly '
+                       'samples. Requires numpy. (def: 0, disabled)')
+parser.add_option('--anomaly_zscore', dest='anomaly_zscore',
+                  default='4',
+                  help='Standard deviations from its baseline at which a '
+                       'path is flagged as an anomaly (def: 4)')
+parser.add_option('--correlation_window', dest='correlation_window',
+                  default='0',
+                  help='Seconds within which paths going bad together are '
+                       'alerted as one mass event (def: 0, disabled)')
+parser.add_option('--correlation_paths', dest='correlation_paths',
+                  default='10',
+                  help='Number of paths going bad that makes a mass event '
+                       '(def: 10)')
+parser.add_option('--correlation_percent', dest='correlation_percent',
+                  default='0',
+                  help='Percentage of all paths going bad that makes a mass '
+                       'event (def: 0, only --correlation_paths counts)')
+parser.add_option('--server_interval', dest='server_interval',
+                  default='30',
+                  help='Seconds between polls of the zk:// servers listed in '
+                       'the --file config (def: 30)')
+parser.add_option('--server_timeout', dest='server_timeout',
+                  default='5',
+                  help='Max seconds each server may take to answer a poll '
+                       '(def: 5)')
+parser.add_option('--canary_interval', dest='canary_interval',
+                  default='0',
+                  help='Seconds between canary markers written to time the '
+                       'end-to-end watch latency (def: 0, disabled)')
+parser.add_option('--canary_threshold', dest='canary_threshold',
+                  default='5',
+                  help='Seconds of watch latency at which the canary alerts '
+                       '(def: 5)')
+parser.add_option('--infer_dependencies', dest='infer_dependencies',
+                  action='store_true', default=False,
+                  help='Suppress the alerts of paths whose closest monitored '
+                       'ancestor is in the Error state')
+parser.add_option('--dependency_settle', dest='dependency_settle',
+                  default='5',
+                  help='Seconds a path with dependencies waits for them to '
+                       'report a failure before alerting (def: 5)')
 
 # Web Server Config Settings
 parser.add_option('-p', '--port', dest='port', default='8080',
                   help='Port to listen to (def: 8080)')
+parser.add_option('--snapshot_interval', dest='snapshot_interval',
+                  default='10',
+                  help='Seconds between compliance snapshots published by '
+                       'the alerting agent and read by the others (def: 10, '
+                       '0 disables)')
+parser.add_option('--thin', dest='thin', action='store_true', default=False,
+                  help='Watch no paths until this agent is the alerting '
+                       'one; serve /status from its snapshots until then')
+parser.add_option('--endpoint', dest='endpoint', default=None,
+                  help='Base URL other agents reach our HTTP interface at '
+                       '(def: http://<fqdn>:<port>)')
+parser.add_option('--announce_interval', dest='announce_interval',
+                  default='30',
+                  help='Seconds between refreshes of our agent registration '
+                       'in Zookeeper (def: 30, min: 5)')
+parser.add_option('--peer_timeout', dest='peer_timeout', default='2',
+                  help='Max seconds to wait for each agent queried by '
+                       '/cluster/status (def: 2)')
+parser.add_option('--admin_token', dest='admin_token', default=None,
+                  help='Token required by the /admin API to add, remove or '
+                       'change monitored paths at runtime (def: None, the '
+                       'API is disabled)')
+parser.add_option('--admin_writeback', dest='admin_writeback',
+                  action='store_true', default=False,
+                  help='Write path changes made through the /admin API back '
+                       'to the --file config')
+parser.add_option('--statsd', dest='statsd', default=None,
+                  help='HOST:PORT of a StatsD server to send metrics to '
+                       '(def: None, disabled)')
+parser.add_option('--statsd_prefix', dest='statsd_prefix',
+                  default='zk_monitor',
+                  help='Prefix of all StatsD metric names (def: zk_monitor)')
+parser.add_option('--statsd_interval', dest='statsd_interval', default='10',
+                  help='Seconds between batches of StatsD metrics (def: 10)')
+parser.add_option('--dogstatsd', dest='dogstatsd', action='store_true',
+                  default=False,
+                  help='Send StatsD metric tags in the DogStatsD format '
+                       'instead of appending them to the metric names')
 parser.add_option('-l', '--level', dest="level", default='warn',
                   help='Set logging level (INFO|WARN|DEBUG|ERROR)')
 parser.add_option('-s', '--syslog', dest='syslog',
                   default=None,
                   help='Log to syslog. Supply facility name. (ie "local0")')
+parser.add_option('--log_format', dest='log_format', default='text',
+                  help='Write log records as plain text or as one JSON '
+                       'document each (text|json, def: text)')
+parser.add_option('--log_sample', dest='log_sample', default='0',
+                  help='Maximum log records per second and logger, errors '
+                       'excluded (def: 0, keep all)')
+parser.add_option('--log_queue', dest='log_queue', default='10000',
+                  help='Log records queued for the logging thread before '
+                       'new ones are dropped (def: 10000, 0 logs '
+                       'synchronously)')
 
 (options, args) = parser.parse_args()
 
 
-def getRootLogger(level, syslog):
+def getRootLogger(level, syslog, log_format='text', sample=0, queue_size=0):
     """Configures our Python stdlib Root Logger"""
     # Convert the supplied log level string
     # into a valid log level constant
@@ -87,7 +236,9 @@ def getRootLogger(level, syslog):
     level_constant = utils.strToClass(level_string)
 
     # Set up the logger now
-    return utils.setupLogger(level=level_constant, syslog=syslog)
+    return utils.setupLogger(level=level_constant, syslog=syslog,
+                             structured=(log_format == 'json'),
+                             sample=sample, queue_size=queue_size)
 
 
 def getPathList(path):
@@ -115,13 +266,30 @@ def getPathList(path):
     return paths
 
 
+def savePathList(path, paths):
+    """Writes a dictionary of config values back to a YAML file.
+
+    The file is replaced atomically, so a crash never leaves a half written
+    config behind. Comments in the original file are not preserved.
+
+    args:
+        path: String value with path to the YAML file to write.
+        paths: The dictionary of config values.
+    """
+    tmp = '%s.tmp' % path
+    with open(tmp, 'w') as f:
+        yaml.safe_dump(paths, f, default_flow_style=False)
+    os.rename(tmp, path)
+
+
 # TODO: Refactor this main() class so its more testable
 def main():
     # Set up logging
-    getRootLogger(options.level, options.syslog)
+    getRootLogger(options.level, options.syslog, options.log_format,
+                  int(options.log_sample), int(options.log_queue))
     logging.getLogger('nd_service_registry.shims').setLevel(logging.WARNING)
 
-    log.info('Connecting to zookeeper via \'%s\'' % options.zookeeper)
+    log.info('Connecting to zookeeper via \'%s\'', options.zookeeper)
     # Prep the config objects required to start up our web service
     sr = nd_service_registry.KazooServiceRegistry(
         server=options.zookeeper,
@@ -129,26 +297,173 @@ def main():
         timeout=1,
         lazy=True)
 
+    # Optionally send metrics to StatsD, in batches
+    exporter = None
+    if options.statsd:
+        exporter = statsd.StatsD(
+            options.statsd, prefix=options.statsd_prefix,
+            interval=float(options.statsd_interval), tags=options.dogstatsd)
+        exporter.start()
+
+    # Count and time everything we ask of Zookeeper
+    operations = None
+    if int(options.operation_depth):
+        operations = instrument.OperationStats(
+            depth=int(options.operation_depth), statsd=exporter)
+        sr = instrument.Registry(sr, operations)
+
     # Load up our cluster configuration state engine. This object provides
     # access to a store cluster-wide configuration settings and state
     # within Zookeeper itself.
     workspace = '%s/%s' % (options.cluster_prefix, options.cluster_name)
     cs = cluster.State(sr, workspace)
 
-    log.info('Parsing paths to watch from \'%s\'' % options.file)
+    log.info('Parsing paths to watch from \'%s\'', options.file)
     paths = getPathList(options.file)
+
+    # The runtime state of every path is kept in one index that both the
+    # Monitor and the Dispatcher work on.
+    index = pathstate.PathIndex()
+
+    # ... and so are the priorities of the paths
+    priorities = priority.Priorities(paths)
+
+    # Optionally collapse paths going bad together into one alert
+    correlator = None
+    if float(options.correlation_window):
+        correlator = correlation.Correlator(
+            window=float(options.correlation_window),
+            paths=int(options.correlation_paths),
+            percent=float(options.correlation_percent),
+            total=len(paths))
+
     # May instantiate this here instead of inside of Monitor
     dis = dispatcher.Dispatcher(
         cluster_state=cs,
-        config=paths)
-
-    # Kick off our main monitoring object
-    mon = monitor.Monitor(dis, sr, cs, paths)
+        config=paths,
+        index=index,
+        correlator=correlator,
+        dependencies=dependencies.Dependencies(
+            paths, infer=options.infer_dependencies,
+            settle=float(options.dependency_settle)),
+        priorities=priorities,
+        statsd=exporter)
+
+    # Kick off our main monitoring object. Thin agents leave the watching to
+    # the alerting agent, and take over once they become it.
+    thin = options.thin and bool(float(options.snapshot_interval))
+    if options.thin and not thin:
+        log.error('--thin requires --snapshot_interval, ignoring it')
+    newMonitor = functools.partial(
+        monitor.Monitor, dis,
+        coalesce_window=float(options.coalesce_window),
+        index=index,
+        payload_concurrency=int(options.payload_concurrency),
+        history_size=int(options.history_size),
+        reconcile_interval=float(options.reconcile_interval),
+        reconcile_rate=float(options.reconcile_rate),
+        reconcile_concurrency=int(options.reconcile_concurrency),
+        watch_rate=float(options.watch_rate),
+        watch_jitter=float(options.watch_jitter),
+        priorities=priorities,
+        watch=not thin,
+        statsd=exporter)
+
+    # Paths on other ensembles get a connection and Monitor of their own
+    registries = {ensembles.DEFAULT: sr}
+    for name, hosts in ensembles.parse(options.ensembles).iteritems():
+        log.info('Connecting to zookeeper ensemble %s via \'%s\'',
+                 name, hosts)
+        registries[name] = ensembles.connect(
+            name, server=hosts, readonly=False, timeout=1, lazy=True)
+        if operations:
+            registries[name] = instrument.Registry(
+                registries[name], operations)
+    znodes, server_checks = servers.split(paths)
+    znodes.pop(canary.KEY, None)
+    by_ensemble = ensembles.split(znodes, registries)
+    if len(registries) > 1:
+        mon = ensembles.MonitorGroup(dict(
+            (name, newMonitor(registries[name], cs, ensemble_paths))
+            for name, ensemble_paths in by_ensemble.iteritems()))
+    else:
+        mon = newMonitor(sr, cs, znodes)
+
+    # The zk:// entries of the config are Zookeeper servers to poll
+    server_monitor = None
+    if server_checks:
+        server_monitor = servers.ServerMonitor(
+            dis, server_checks, index=index,
+            interval=float(options.server_interval),
+            timeout=float(options.server_timeout),
+            statsd=exporter)
+        server_monitor.start()
+
+    # Share the state of all paths from the alerting agent with the others
+    snapshots = None
+    if float(options.snapshot_interval):
+        snapshots = snapshot.Snapshots(
+            cs, mon, dis, interval=float(options.snapshot_interval),
+            thin=thin)
+        snapshots.start()
+
+    # Optionally time how long a change takes to reach us
+    watch_canary = None
+    if float(options.canary_interval):
+        watch_canary = canary.Canary(
+            cs, mon, dis, index=index,
+            interval=float(options.canary_interval),
+            threshold=float(options.canary_threshold),
+            statsd=exporter)
+        watch_canary.start()
+
+    # Optionally look for outliers across all paths at once
+    detector = None
+    if float(options.anomaly_interval):
+        try:
+            detector = anomaly.AnomalyDetector(
+                znodes.keys(), index, dis,
+                interval=float(options.anomaly_interval),
+                threshold=float(options.anomaly_zscore))
+            detector.start()
+        except anomaly.AnomalyException, e:
+            log.error('Anomaly detection disabled: %s', e)
+
+    # Keep track of whether the IOLoop is still responsive
+    beat = heartbeat.Heartbeat()
+    beat.start()
 
     # Build the HTTP service listening to the port supplied
-    server = app.getApplication(sr, mon, dis)
+    save_config = None
+    if options.admin_writeback and options.file:
+        save_config = functools.partial(savePathList, options.file, paths)
+    aggregator = aggregate.Aggregator(cs, int(options.port),
+                                      timeout=float(options.peer_timeout))
+    server = app.getApplication(sr, mon, dis, heartbeat=beat,
+                                admin_token=options.admin_token,
+                                save_config=save_config,
+                                aggregator=aggregator,
+                                snapshots=snapshots,
+                                servers=server_monitor,
+                                canary=watch_canary,
+                                operation_stats=operations,
+                                anomalies=detector)
     server.listen(int(options.port))
-    ioloop.IOLoop.instance().start()
+
+    # Tell the other agents where to find us, and how busy we are
+    endpoint = options.endpoint or 'http://%s:%s' % (
+        socket.getfqdn(), options.port)
+    announcer = cluster.Announcer(
+        cs, mon, endpoint, heartbeat=beat,
+        interval=float(options.announce_interval))
+    announcer.start()
+
+    try:
+        ioloop.IOLoop.instance().start()
+    finally:
+        announcer.stop()
+        if exporter:
+            exporter.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,227 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Compliance snapshots shared through the cluster workspace.
+
+Only the agent holding the alerter lock acts on the state of the paths, yet
+every agent evaluates all of them to serve /status. Instead, the lock holder
+publishes the state of every path (as of its last evaluation) whenever it
+changes, and the other agents (followers) serve /status from that.
+
+A snapshot is compact JSON, compressed with zlib and split into chunks that
+stay well below the Zookeeper node size limit. A small JSON header next to
+them carries the version, the number of chunks and a checksum; followers only
+poll the header, and fetch the chunks when its version moves.
+
+In thin mode, followers do not watch any paths at all until they get hold of
+the alerter lock.
+"""
+
+import json
+import logging
+import time
+import zlib
+
+from kazoo import exceptions
+from tornado import gen
+from tornado import ioloop
+
+log = logging.getLogger(__name__)
+
+# Version of the snapshot format, maximum size of a chunk (Zookeeper refuses
+# nodes over 1MB), and default seconds between publications/polls.
+FORMAT = 1
+CHUNK_SIZE = 512 * 1024
+INTERVAL = 10
+
+
+class SnapshotException(Exception):
+    """Raised when a snapshot can not be decoded."""
+
+
+def encode(compliance, **meta):
+    """Encode the state of all paths into a snapshot.
+
+    args:
+        compliance: Dict of {path: (state, reason)}.
+        meta: Additional header fields (eg. version, time, publisher).
+
+    returns:
+        A (header dict, list of chunk strings) tuple.
+    """
+    body = json.dumps({'format': FORMAT, 'compliance': compliance},
+                      separators=(',', ':'))
+    data = zlib.compress(body)
+    chunks = [data[i:i + CHUNK_SIZE] for i in xrange(0, len(data), CHUNK_SIZE)]
+
+    header = dict(meta)
+    header.update({
+        'format': FORMAT,
+        'paths': len(compliance),
+        'chunks': len(chunks),
+        'size': len(data),
+        'crc': zlib.crc32(data) & 0xffffffff,
+    })
+    return header, chunks
+
+
+def decode(header, chunks):
+    """Decode a snapshot back into the /status compliance format.
+
+    returns:
+        A dict of {path: {'state': state, 'message': reason}}.
+
+    raises:
+        SnapshotException: If the snapshot is incomplete, corrupt or of an
+                           unknown format.
+    """
+    if header.get('format') != FORMAT:
+        raise SnapshotException('Unknown format: %s' % header.get('format'))
+
+    data = ''.join(chunks)
+    if len(data) != header['size'] or \
+            zlib.crc32(data) & 0xffffffff != header['crc']:
+        raise SnapshotException('Checksum mismatch')
+
+    body = json.loads(zlib.decompress(data))
+    return dict((path, {'state': state, 'message': reason})
+                for path, (state, reason) in body['compliance'].iteritems())
+
+
+class Snapshots(object):
+    """Publishes snapshots while holding the alerter lock, follows otherwise.
+    """
+
+    def __init__(self, cluster_state, monitor, dispatcher, interval=INTERVAL,
+                 thin=False):
+        """
+        args:
+            cluster_state: cluster.State object to publish/read through.
+            monitor: monitor.Monitor to take the state of the paths from.
+            dispatcher: alerts.dispatcher.Dispatcher, to tell whether we hold
+                        the alerter lock.
+            interval: Seconds between publications (or polls).
+            thin: The monitor does not watch anything yet, and should only
+                  start doing so once we hold the alerter lock.
+        """
+        self._cs = cluster_state
+        self._monitor = monitor
+        self._dispatcher = dispatcher
+        self._interval = interval
+        self._thin = thin
+        self._timer = None
+        self._busy = False
+
+        # Monitor change count and version of the last snapshot we published
+        self._published = None
+        self._version = 0
+
+        # Header and decoded compliance of the last snapshot we read
+        self.header = None
+        self._compliance = None
+
+    def start(self):
+        self._timer = ioloop.PeriodicCallback(
+            self.tick, self._interval * 1000)
+        self._timer.start()
+        ioloop.IOLoop.current().add_callback(self.tick)
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    @gen.coroutine
+    def tick(self):
+        """Publish or follow, depending on whether we hold the lock."""
+        if self._busy:
+            return
+        self._busy = True
+        try:
+            if self._dispatcher.alerting():
+                yield self.publish()
+            else:
+                self._published = None
+                yield self.follow()
+        except Exception:
+            log.exception('Could not exchange the compliance snapshot')
+        finally:
+            self._busy = False
+
+    @gen.coroutine
+    def publish(self):
+        """Publish a snapshot if anything changed since the last one."""
+        if self._thin:
+            self._monitor.start_watching()
+
+        health = self._monitor.health()
+        if not (health['connected'] and health['warm']):
+            # A half evaluated snapshot would mislead the followers
+            return
+        if health['changes'] == self._published:
+            return
+
+        # Versions are milliseconds, but two snapshots published within the
+        # same one must still differ for the followers to read the second.
+        now = time.time()
+        version = max(int(now * 1000), self._version + 1)
+        header, chunks = encode(
+            self._monitor.compliance(), version=version, time=now,
+            publisher=self._cs.name)
+        yield self._cs.putSnapshot(header, chunks)
+        self._published = health['changes']
+        self._version = version
+        self.header, self._compliance = None, None
+        log.debug('Published snapshot %s of %d paths in %d chunks' % (
+            header['version'], header['paths'], header['chunks']))
+
+    @gen.coroutine
+    def follow(self):
+        """Read the published snapshot if its version moved."""
+        header = yield self._cs.getSnapshotHeader()
+        if header is None or (self.header and
+                              header['version'] == self.header['version']):
+            return
+
+        try:
+            chunks = yield self._cs.getSnapshotChunks(header)
+        except exceptions.NoNodeError:
+            # The lock holder replaced the snapshot after we read its header
+            log.debug('Snapshot %s was replaced while reading it, retrying '
+                      'on the next tick' % header['version'])
+            return
+        self._compliance = decode(header, chunks)
+        self.header = header
+        log.debug('Read snapshot %s of %d paths' % (
+            header['version'], header['paths']))
+
+    def following(self):
+        """Returns the /status monitor section from the last snapshot read.
+
+        returns:
+            None if we hold the alerter lock or have no snapshot yet,
+            otherwise a dict with the 'compliance' of all paths and a
+            'snapshot' section describing where it came from.
+        """
+        if self._compliance is None or self._dispatcher.alerting():
+            return None
+        return {
+            'compliance': self._compliance,
+            'snapshot': {
+                'version': self.header['version'],
+                'publisher': self.header['publisher'],
+                'time': self.header['time'],
+                'age': round(time.time() - self.header['time'], 1),
+            },
+        }
@@ -0,0 +1,218 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Batched StatsD (or DogStatsD) metrics exporter.
+
+Metrics are not sent as they happen. Counters are summed, only the latest
+value of a gauge is kept, and timings are collected (up to a limit per
+metric, sampled beyond that) in memory. Every interval all of it is written
+out as newline separated metrics packed into as few UDP datagrams as fit,
+so a change of 10k paths costs a few hundred packets per interval, not 10k
+packets as it happens.
+
+Sending never blocks: the socket is non-blocking and a datagram that can not
+be sent is dropped. Tags are sent in the DogStatsD format if enabled, and
+otherwise appended to the metric name:
+
+    DogStatsD: zk_monitor.path.children:3|g|#path:/services/foo
+    StatsD:    zk_monitor.path.children.services_foo:3|g
+"""
+
+import logging
+import random
+import re
+import socket
+import threading
+
+from tornado import ioloop
+
+log = logging.getLogger(__name__)
+
+# Defaults: metric name prefix, seconds between flushes, the largest
+# datagram sent (fits a 1500 byte MTU with room for the headers), and the
+# number of timings kept per metric and interval.
+PREFIX = 'zk_monitor'
+INTERVAL = 10
+PACKET_SIZE = 1432
+TIMINGS = 1000
+
+
+def _name(value):
+    """Returns a value usable as part of a plain StatsD metric name."""
+    return re.sub(r'[^\w\-]+', '_', str(value).strip('/')) or '_'
+
+
+def _tag(value):
+    """Returns a value usable as a DogStatsD tag value."""
+    return re.sub(r'[|,#:\s]+', '_', str(value))
+
+
+def _format(value):
+    return '%d' % value if value == int(value) else '%g' % value
+
+
+class StatsD(object):
+    """Aggregates metrics in memory and sends them out in batches."""
+
+    def __init__(self, address, prefix=PREFIX, interval=INTERVAL,
+                 tags=False, packet_size=PACKET_SIZE, timings=TIMINGS):
+        """
+        args:
+            address: 'host:port' of the StatsD server.
+            prefix: Prefix of every metric name.
+            interval: Seconds between flushes.
+            tags: Send tags in the DogStatsD format, instead of appending
+                  them to the metric names.
+            packet_size: Maximum size of a datagram.
+            timings: Maximum number of timings kept per metric between
+                     flushes; beyond that they are sampled.
+        """
+        host, _, port = address.rpartition(':')
+        self._address = (host or address, int(port) if host else 8125)
+        self._prefix = prefix.rstrip('.') + '.' if prefix else ''
+        self._interval = interval
+        self._tags = tags
+        self._packet_size = packet_size
+        self._timings_size = timings
+        self._socket = None
+        self._timer = None
+
+        # Metrics are recorded from the Kazoo threads as well
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+
+    def _key(self, name, tags):
+        """Returns the (metric name, tag suffix) a metric is kept under."""
+        name = self._prefix + name
+        if not tags:
+            return name, ''
+        if self._tags:
+            return name, '|#' + ','.join(
+                '%s:%s' % (key, _tag(value))
+                for key, value in sorted(tags.iteritems()))
+        return '.'.join([name] + [_name(value) for _, value in
+                                  sorted(tags.iteritems())]), ''
+
+    def incr(self, name, value=1, tags=None):
+        """Add to a counter."""
+        key = self._key(name, tags)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, tags=None):
+        """Set a gauge; only the latest value of an interval is sent."""
+        key = self._key(name, tags)
+        with self._lock:
+            self._gauges[key] = value
+
+    def timing(self, name, seconds, tags=None):
+        """Record a duration.
+
+        Once `timings` of a metric were recorded within an interval, a
+        random sample of them is kept (and sent with its sample rate).
+        """
+        key = self._key(name, tags)
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                timing = self._timings[key] = [0, []]
+            timing[0] += 1
+            values = timing[1]
+            if len(values) < self._timings_size:
+                values.append(seconds)
+            else:
+                slot = random.randint(0, timing[0] - 1)
+                if slot < self._timings_size:
+                    values[slot] = seconds
+
+    def lines(self):
+        """Returns (and forgets) everything recorded as StatsD lines."""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            timings, self._timings = self._timings, {}
+
+        lines = []
+        for (name, tags), value in counters.iteritems():
+            lines.append('%s:%s|c%s' % (name, _format(value), tags))
+        for (name, tags), value in gauges.iteritems():
+            lines.append('%s:%s|g%s' % (name, _format(value), tags))
+        for (name, tags), (seen, values) in timings.iteritems():
+            rate = ''
+            if seen > len(values):
+                rate = '|@%g' % (float(len(values)) / seen)
+            for value in values:
+                lines.append('%s:%s|ms%s%s' % (
+                    name, _format(round(value * 1000, 3)), rate, tags))
+        return lines
+
+    def packets(self, lines):
+        """Pack lines into as few datagrams as fit within packet_size."""
+        packets = []
+        current, size = [], 0
+        for line in lines:
+            if current and size + 1 + len(line) > self._packet_size:
+                packets.append('\n'.join(current))
+                current, size = [], 0
+            size += len(line) + (1 if current else 0)
+            current.append(line)
+        if current:
+            packets.append('\n'.join(current))
+        return packets
+
+    def _send(self, packet):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setblocking(0)
+        try:
+            self._socket.sendto(packet, self._address)
+        except socket.error, e:
+            log.debug('Dropped a StatsD packet: %s' % e)
+            return False
+        return True
+
+    def flush(self):
+        """Send everything recorded since the last flush.
+
+        returns:
+            The number of datagrams sent.
+        """
+        sent = 0
+        for packet in self.packets(self.lines()):
+            sent += self._send(packet)
+        return sent
+
+    def start(self):
+        """Begin flushing on the IOLoop.
+
+        The server name is only resolved once, so flushes never wait for
+        DNS.
+        """
+        host, port = self._address
+        try:
+            self._address = (socket.gethostbyname(host), port)
+        except socket.error, e:
+            log.error('Could not resolve StatsD server %s: %s' % (host, e))
+        self._timer = ioloop.PeriodicCallback(
+            self.flush, self._interval * 1000)
+        self._timer.start()
+
+    def stop(self):
+        """Stop flushing, after sending what is left."""
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+        self.flush()
@@ -0,0 +1,104 @@
+import mock
+
+from tornado import gen
+from tornado import testing
+from tornado.testing import unittest
+
+from zk_monitor import canary
+from zk_monitor import monitor
+from zk_monitor.monitor import states
+from zk_monitor.test.helper import mock_tornado
+
+
+class TestHistogram(unittest.TestCase):
+    def testObserve(self):
+        histogram = canary.Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        status = histogram.status()
+        self.assertEquals([[0.1, 2], [1, 3], ['+Inf', 4]], status['buckets'])
+        self.assertEquals(4, status['count'])
+        self.assertEquals(3.65, status['sum'])
+
+
+class TestCanary(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestCanary, self).setUp()
+        self.disp = mock.MagicMock(name='Dispatcher')
+        self.cs = mock.MagicMock(name='State')
+        self.cs.getCanaryPath.return_value = '/zkmon/canary/a'
+        self.cs.putCanary = mock_tornado()
+
+        # The markers come back through a real Monitor
+        self.ndsr = mock.MagicMock()
+        self.ndsr._watchers = {}
+        self.monitor = monitor.Monitor(self.disp, self.ndsr, self.cs, {})
+        self.canary = canary.Canary(self.cs, self.monitor, self.disp,
+                                    threshold=0.5)
+        self.monitor.probe('/zkmon/canary/a', self.canary._received)
+
+    @gen.coroutine
+    def arrive(self, sequence):
+        """Fire the watch of our marker, as the Service Registry would."""
+        self.monitor._pathUpdateCallback({
+            'path': '/zkmon/canary/a', 'data': {'sequence': sequence}})
+        yield gen.moment
+
+    @testing.gen_test
+    def testLatency(self):
+        yield self.canary.send()
+        self.assertEquals(1, self.cs.putCanary._call_count)
+
+        # No new marker while one is in flight
+        yield self.canary.send()
+        self.assertEquals(1, self.cs.putCanary._call_count)
+
+        yield self.arrive(1)
+        status = self.canary.status()
+        self.assertEquals(states.OK, status['state'])
+        self.assertEquals(1, status['latency']['count'])
+        self.assertTrue(status['last'] < 0.5)
+
+        # Markers we are not waiting for are ignored
+        yield self.arrive(1)
+        self.assertEquals(1, self.canary.histogram.count)
+        self.assertFalse(self.disp.update.called)
+
+    @testing.gen_test
+    def testTooSlow(self):
+        yield self.canary.send()
+        self.canary._sent -= 1
+        yield self.arrive(1)
+        yield gen.moment
+        self.assertEquals(states.ERROR, self.canary.status()['state'])
+        self.assertEquals(states.ERROR,
+                          self.disp.update.call_args[1]['state'])
+
+        # Recovers with the next marker in time
+        yield self.canary.send()
+        yield self.arrive(2)
+        yield gen.moment
+        self.assertEquals(states.OK, self.disp.update.call_args[1]['state'])
+
+    @testing.gen_test
+    def testMissing(self):
+        yield self.canary.send()
+        yield gen.Task(self.io_loop.add_timeout, self.io_loop.time() + 0.6)
+
+        status = self.canary.status()
+        self.assertEquals(states.ERROR, status['state'])
+        self.assertEquals(1, status['timeouts'])
+
+        # The watch is registered again, and new markers go out
+        self.assertEquals(2, self.ndsr.get.call_count)
+        yield self.canary.send()
+        self.assertEquals(2, self.cs.putCanary._call_count)
+
+    @testing.gen_test
+    def testWriteFailure(self):
+        self.cs.putCanary = mock_tornado(exc=IOError('Connection lost'))
+        yield self.canary.send()
+        self.assertEquals('Could not write the canary marker: '
+                          'Connection lost', self.canary.status()['message'])
+        self.assertEquals(None, self.canary._sent)
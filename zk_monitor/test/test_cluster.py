@@ -1,14 +1,33 @@
 import mock
 
+from kazoo.exceptions import NoNodeError
+from tornado import testing
 from tornado.testing import unittest
 
 from zk_monitor import cluster
 
 
-class TestState(unittest.TestCase):
+class FakeResult(object):
+    """Mimics a completed Kazoo IAsyncResult."""
+
+    def __init__(self, value=None, exc=None):
+        self._value = value
+        self._exc = exc
+
+    def get(self):
+        if self._exc:
+            raise self._exc
+        return self._value
+
+    def rawlink(self, callback):
+        callback(self)
+
+
+class TestState(testing.AsyncTestCase):
     @mock.patch('platform.node')
     @mock.patch('os.getpid')
     def setUp(self, getpid_mock, node_mock):
+        super(TestState, self).setUp()
         node_mock.return_value = 'unittest'
         getpid_mock.return_value = 123
 
@@ -26,3 +45,99 @@ class TestState(unittest.TestCase):
         self.assertEquals("fake_lock", self.state.getLock('unittest'))
         self.mocked_ndsr.get_lock.assert_called_with(
             '/unittest/locks/unittest', 'unittest-123', wait=0)
+
+    @testing.gen_test
+    def testGetAgents(self):
+        self.mocked_ndsr.get.return_value = {
+            'children': ['a-1', 'b-2', 'c-3']}
+        registrations = {
+            '/unittest/agents/a-1': FakeResult(('{"endpoint": "http://a:1"}',
+                                                None)),
+            '/unittest/agents/b-2': FakeResult(('', None)),
+            '/unittest/agents/c-3': FakeResult(exc=NoNodeError()),
+        }
+        zk = self.mocked_ndsr._zk
+        zk.get_async.side_effect = lambda path: registrations[path]
+
+        agents = yield self.state.getAgents()
+        self.assertEquals({'a-1': {'endpoint': 'http://a:1'}, 'b-2': {}},
+                          agents)
+
+        # Only the agent list is read through the (watching) registry
+        self.mocked_ndsr.get.assert_called_once_with('/unittest/agents')
+
+    @testing.gen_test
+    def testGetAgentsDisconnected(self):
+        self.mocked_ndsr.get.return_value = False
+        agents = yield self.state.getAgents()
+        self.assertEquals({}, agents)
+
+    def testName(self):
+        self.assertEquals('unittest-123', self.state.name)
+
+    def testRegister(self):
+        self.mocked_ndsr.set_node.assert_called_once_with(
+            '/unittest/agents/unittest-123', data=None)
+
+        self.state.register({'paths': 1})
+        self.mocked_ndsr.set_node.assert_called_with(
+            '/unittest/agents/unittest-123', data={'paths': 1})
+
+        self.state.unregister()
+        self.mocked_ndsr.set_node.assert_called_with(
+            '/unittest/agents/unittest-123', state=False)
+
+    @testing.gen_test
+    def testPutCanary(self):
+        zk = self.mocked_ndsr._zk
+        zk.set_async.return_value = FakeResult(exc=NoNodeError())
+        zk.create_async.return_value = FakeResult('/unittest/canary/x')
+
+        yield self.state.putCanary({'sequence': 1})
+        zk.set_async.assert_called_once_with(
+            '/unittest/canary/unittest-123', '{"sequence": 1}')
+        zk.create_async.assert_called_once_with(
+            '/unittest/canary/unittest-123', '{"sequence": 1}',
+            None, True, False, True)
+
+
+class TestAnnouncer(unittest.TestCase):
+    def setUp(self):
+        self.mocked_cs = mock.MagicMock()
+        self.mocked_monitor = mock.MagicMock()
+        self.mocked_monitor.health.return_value = {'paths': 3, 'events': 0}
+        self.heartbeat = mock.MagicMock(lag=0.123)
+        self.announcer = cluster.Announcer(
+            self.mocked_cs, self.mocked_monitor, 'http://zk1:8080',
+            heartbeat=self.heartbeat, interval=1)
+
+    @mock.patch('time.time')
+    def testDescribe(self, time_mock):
+        time_mock.return_value = 100
+        data = self.announcer.describe()
+        self.assertEquals('http://zk1:8080', data['endpoint'])
+        self.assertEquals(3, data['paths'])
+        self.assertEquals(0.12, data['lag'])
+        self.assertEquals(0.0, data['event_rate'])
+
+        # The event rate covers the time since the previous refresh
+        time_mock.return_value = 110
+        self.mocked_monitor.health.return_value = {'paths': 3, 'events': 25}
+        self.assertEquals(2.5, self.announcer.describe()['event_rate'])
+
+    def testAnnounce(self):
+        self.announcer.announce()
+        data = self.mocked_cs.register.call_args[0][0]
+        self.assertEquals(3, data['paths'])
+
+        # Failures are logged, never raised
+        self.mocked_cs.register.side_effect = Exception('boom')
+        self.announcer.announce()
+
+    def testInterval(self):
+        self.assertEquals(cluster.MIN_ANNOUNCE_INTERVAL,
+                          self.announcer._interval)
+
+    def testStop(self):
+        self.announcer.stop()
+        self.mocked_cs.unregister.assert_called_once_with()
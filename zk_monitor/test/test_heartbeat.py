@@ -0,0 +1,36 @@
+import time
+
+from tornado import gen
+from tornado import testing
+
+from zk_monitor import heartbeat
+
+
+class TestHeartbeat(testing.AsyncTestCase):
+
+    @gen.coroutine
+    def sleep(self, seconds):
+        yield gen.Task(self.io_loop.add_timeout, time.time() + seconds)
+
+    @testing.gen_test
+    def testBeat(self):
+        beat = heartbeat.Heartbeat(interval=0.01, stall=1)
+        beat.last = time.time() - 5
+        beat.start()
+        self.assertTrue(beat.alive())
+
+        yield self.sleep(0.05)
+        beat.stop()
+        self.assertTrue(beat.age() < 0.05)
+        self.assertTrue(beat.lag < 1)
+
+    def testStall(self):
+        beat = heartbeat.Heartbeat(interval=1, stall=10)
+        self.assertTrue(beat.alive())
+
+        # A blocked IOLoop stops beating, and is late once it beats again
+        beat.last = time.time() - 12
+        self.assertFalse(beat.alive())
+        beat._beat()
+        self.assertTrue(beat.alive())
+        self.assertTrue(11 <= beat.lag < 12)
@@ -0,0 +1,93 @@
+import mock
+
+from tornado.testing import unittest
+
+from zk_monitor import instrument
+
+
+class TestOperationStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = instrument.OperationStats(depth=2, samples=4)
+
+    def testPrefix(self):
+        self.assertEquals('/services/foo',
+                          self.stats.prefix('/services/foo/web/host-1'))
+        self.assertEquals('/services', self.stats.prefix('/services'))
+        self.assertEquals('/', self.stats.prefix('/'))
+
+    @mock.patch('time.time')
+    def testSummary(self, time_mock):
+        time_mock.return_value = 100
+        for began in (99.9, 99.8, 99.7, 99.6, 99):
+            self.stats.record('get', '/services/foo/web', began)
+        self.stats.record('get', '/services/bar', 99.9, error=True)
+
+        summary = self.stats.summary()
+        foo = summary['get']['/services/foo']
+        self.assertEquals(5, foo['count'])
+        self.assertEquals(0, foo['errors'])
+        self.assertEquals(0.4, foo['mean'])
+
+        # Percentiles only cover the most recent samples
+        self.assertEquals(1.0, foo['max'])
+        self.assertEquals(0.3, foo['p50'])
+        self.assertEquals(1.0, foo['p99'])
+        self.assertEquals(1, summary['get']['/services/bar']['errors'])
+
+    def testPercentile(self):
+        ordered = range(1, 101)
+        self.assertEquals(50, instrument.percentile(ordered, 50))
+        self.assertEquals(99, instrument.percentile(ordered, 99))
+        self.assertEquals(1, instrument.percentile([1], 99))
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.ndsr = mock.MagicMock()
+        self.stats = instrument.OperationStats()
+        self.registry = instrument.Registry(self.ndsr, self.stats)
+
+    def testGet(self):
+        self.ndsr.get.return_value = {'children': ['a']}
+        self.assertEquals({'children': ['a']},
+                          self.registry.get('/services/foo'))
+        self.ndsr.get.assert_called_once_with('/services/foo')
+        self.assertEquals(
+            1, self.stats.summary()['get']['/services/foo']['count'])
+
+    def testWatch(self):
+        callback = mock.MagicMock()
+        self.registry.get('/services/foo', callback=callback)
+        self.registry.get('/services/foo', callback=callback)
+
+        # The same callback is always wrapped by the same function
+        first = self.ndsr.get.call_args_list[0][1]['callback']
+        second = self.ndsr.get.call_args_list[1][1]['callback']
+        self.assertTrue(first is second)
+
+        first({'path': '/services/foo'})
+        callback.assert_called_once_with({'path': '/services/foo'})
+        summary = self.stats.summary()
+        self.assertEquals(2, summary['watch']['/services/foo']['count'])
+        self.assertEquals(1, summary['watch_fire']['/services/foo']['count'])
+
+    def testErrors(self):
+        self.ndsr.set_node.side_effect = IOError()
+        self.assertRaises(IOError, self.registry.set_node, '/zkmon/agents/a',
+                          data={'paths': 1})
+        self.assertEquals(
+            1, self.stats.summary()['set_node']['/zkmon/agents']['errors'])
+
+    def testLock(self):
+        lock = self.registry.get_lock('/zkmon/locks/alerter', 'me', wait=0)
+        self.ndsr.get_lock.assert_called_once_with(
+            '/zkmon/locks/alerter', 'me', wait=0)
+        lock.acquire()
+        lock.status()
+        self.ndsr.get_lock.return_value.acquire.assert_called_once_with()
+        self.assertEquals(
+            2, self.stats.summary()['lock']['/zkmon/locks']['count'])
+
+    def testPassThrough(self):
+        self.assertTrue(self.registry._zk is self.ndsr._zk)
+        self.assertTrue(self.registry._watchers is self.ndsr._watchers)
@@ -1,8 +1,14 @@
 import mock
+import time
 
+from tornado import gen
 from tornado import testing
 
 from zk_monitor import monitor
+from zk_monitor import utils
+from zk_monitor.monitor import priority
+from zk_monitor.monitor import rules
+from zk_monitor.test.helper import tornado_value
 
 import logging
 
@@ -26,10 +32,32 @@ class TestMonitor(testing.AsyncTestCase):
             self.mocked_cs,
             self.paths)
 
+    @gen.coroutine
+    def sleep(self, seconds):
+        # add_timeout is an "engine" function, so it has to be called as a Task
+        yield gen.Task(self.io_loop.add_timeout, time.time() + seconds)
+
     def testInit(self):
         self.mocked_ndsr.get_state.assert_called_with(
             self.monitor._stateListener)
 
+    def testInitWithImmediateStateCallback(self):
+        # The Service Registry calls the listener before get_state() returns
+        ndsr = mock.MagicMock()
+
+        def get_state(callback):
+            callback(True)
+            return True
+        ndsr.get_state.side_effect = get_state
+
+        with mock.patch.object(monitor.IOLoop, 'current') as current:
+            mon = monitor.Monitor(self.mocked_disp, ndsr, self.mocked_cs,
+                                  self.paths)
+        self.assertTrue(mon._state)
+
+        # Being connected from the start is not a reconnect
+        self.assertFalse(current.return_value.add_callback.called)
+
     def testStateListener(self):
         test_state = 'test'
         self.monitor._stateListener(test_state)
@@ -40,11 +68,21 @@ class TestMonitor(testing.AsyncTestCase):
         self.assertEquals(None, self.monitor._validateConfig(None))
         self.assertEquals(None, self.monitor._validateConfig([]))
 
-        # Should return properly if we supply an integer as a config setting
+        # Should return compiled rules if we supply an integer as a config
+        # setting
         config = {'children': 1}
-        self.assertEquals(None, self.monitor._validateConfig(config))
+        ruleset = self.monitor._validateConfig(config)
+        self.assertTrue(isinstance(ruleset, rules.RuleSet))
+        self.assertEquals(1, len(ruleset))
+
+        # ... or a combination of checks
+        config = {'children': {'min': 1, 'max': 3, 'peak_percent': 50}}
+        self.assertEquals(3, len(self.monitor._validateConfig(config)))
 
         # Should raise an exception if we pass in an invalid children setting
+        config = {'children': {'min': 3, 'max': 1}}
+        self.assertRaises(monitor.InvalidConfigException,
+                          self.monitor._validateConfig, config)
         config = {'children': 'should fail'}
         self.assertRaises(monitor.InvalidConfigException,
                           self.monitor._validateConfig, config)
@@ -54,15 +92,17 @@ class TestMonitor(testing.AsyncTestCase):
 
     def testValidatePaths(self):
         # Should return right away if the config is empty
-        self.assertEquals(None, self.monitor._validatePaths(None))
-        self.assertEquals(None, self.monitor._validatePaths([]))
+        self.assertEquals({}, self.monitor._validatePaths(None))
+        self.assertEquals({}, self.monitor._validatePaths([]))
 
         # Should return properly if we supply an integer as a config setting
         config = {
             '/foo': {'children': 1},
             '/bar': {'children': 2},
             '/baz': {}}
-        self.assertEquals(None, self.monitor._validatePaths(config))
+        compiled = self.monitor._validatePaths(config)
+        self.assertEquals(['/bar', '/baz', '/foo'], sorted(compiled))
+        self.assertEquals(None, compiled['/baz'])
 
         # Should raise an exception if we pass in an invalid children setting
         config = {
@@ -81,6 +121,81 @@ class TestMonitor(testing.AsyncTestCase):
         ]
         self.mocked_ndsr.get.assert_has_calls(expected_calls)
 
+    def testRearmWatch(self):
+        self.mocked_ndsr.get.reset_mock()
+
+        with mock.patch.object(utils, 'stopWatcher') as stop:
+            self.monitor._rearmWatch('/foo')
+        stop.assert_called_once_with(self.mocked_ndsr, '/foo')
+        self.mocked_ndsr.get.assert_called_once_with(
+            '/foo', callback=self.monitor._pathUpdateCallback)
+
+    def testRearmWatchNotPaced(self):
+        mon = monitor.Monitor(self.mocked_disp, self.mocked_ndsr,
+                              self.mocked_cs, self.paths, watch_rate=1,
+                              watch_jitter=0)
+        self.mocked_ndsr._watchers = {}
+        self.mocked_ndsr.get.reset_mock()
+
+        # A single missing watch is not queued behind the others
+        mon._rearmWatch('/foo')
+        self.mocked_ndsr.get.assert_called_once_with(
+            '/foo', callback=mon._pathUpdateCallback)
+
+    @testing.gen_test
+    def testSetPathSkipsJitter(self):
+        mon = monitor.Monitor(self.mocked_disp, self.mocked_ndsr,
+                              self.mocked_cs, self.paths, watch_rate=1000,
+                              watch_jitter=0)
+        yield self.sleep(0.01)
+        mon._armer._jitter = 5
+        self.mocked_ndsr.get.reset_mock()
+
+        # An admin-added path does not wait for the random delay
+        mon.set_path('/new', {'children': 1})
+        yield self.sleep(0.01)
+        self.mocked_ndsr.get.assert_called_once_with(
+            '/new', callback=mon._pathUpdateCallback)
+
+    @testing.gen_test
+    def testPacedWatches(self):
+        self.mocked_ndsr.get.reset_mock()
+        self.paths['/bar'] = {'children': 2, 'priority': 'high'}
+        mon = monitor.Monitor(self.mocked_disp, self.mocked_ndsr,
+                              self.mocked_cs, self.paths, watch_rate=1000,
+                              watch_jitter=0)
+        self.assertFalse(self.mocked_ndsr.get.called)
+
+        yield self.sleep(0.01)
+        watched = [c[0][0] for c in self.mocked_ndsr.get.call_args_list]
+        self.assertEquals('/bar', watched[0])
+        self.assertEquals(['/bar', '/baz', '/foo'], sorted(watched))
+        self.assertEquals(3, mon.status()['watches']['armed'])
+
+    @testing.gen_test
+    def testSessionExpiry(self):
+        mon = monitor.Monitor(self.mocked_disp, self.mocked_ndsr,
+                              self.mocked_cs, self.paths, watch_rate=1000,
+                              watch_jitter=0)
+        mon._rearmWatch = mock.Mock()
+        self.mocked_ndsr._watchers = {'/foo': mock.Mock()}
+        self.mocked_ndsr._zk.client_id = (1, 'a')
+        mon._stateListener(True)
+
+        # Same session, nothing to do
+        mon._stateListener(False)
+        mon._stateListener(True)
+        yield self.sleep(0.01)
+        self.assertFalse(mon._rearmWatch.called)
+
+        # New session, the paths without a working watcher are re-armed
+        self.mocked_ndsr._zk.client_id = (2, 'b')
+        mon._stateListener(True)
+        yield self.sleep(0.01)
+        self.assertEquals(
+            ['/bar', '/baz'],
+            sorted(c[0][0] for c in mon._rearmWatch.call_args_list))
+
     @mock.patch('tornado.ioloop.IOLoop.instance')
     def test_add_callback(self, mocked_ioinst):
         mocked_ioinst().add_callback = mock.MagicMock(name='AddCallback')
@@ -118,6 +233,101 @@ class TestMonitor(testing.AsyncTestCase):
 
         self.assertEquals(self.monitor.issue_dispatch_update.call_count, 1)
 
+    @testing.gen_test
+    def testPathUpdateCallbackCoalesced(self):
+        self.monitor._coalesce_window = 0.05
+        self.monitor._evaluatePath = mock.Mock()
+
+        # A burst of updates schedules only a single evaluation ...
+        for count in range(5):
+            children = ['c%s' % i for i in range(count)]
+            self.monitor._pathUpdateCallback(
+                {'path': '/foo', 'children': children})
+        self.monitor._pathUpdateCallback({'path': '/bar', 'children': []})
+        self.assertEquals(self.monitor._evaluatePath.call_count, 0)
+
+        yield self.sleep(0.1)
+
+        # ... with the most recent data for each path.
+        self.assertEquals(self.monitor._evaluatePath.call_count, 2)
+        self.monitor._evaluatePath.assert_has_calls([
+            mock.call({'path': '/foo',
+                       'children': ['c0', 'c1', 'c2', 'c3']}),
+            mock.call({'path': '/bar', 'children': []})], any_order=True)
+        self.assertEquals(self.monitor._pending, {})
+
+        # A new update after the window has closed starts a new window.
+        self.monitor._pathUpdateCallback({'path': '/foo', 'children': []})
+        yield self.sleep(0.1)
+        self.assertEquals(self.monitor._evaluatePath.call_count, 3)
+
+    @testing.gen_test
+    def testPathUpdateCallbackWithPayloadRules(self):
+        self.paths['/qux'] = {'payload': {'match': {'up': True}, 'min': 1}}
+        self.monitor._rules = self.monitor._validatePaths(self.paths)
+        self.mocked_ndsr.get = mock.Mock(return_value={
+            'path': '/qux', 'data': None, 'stat': None, 'children': ['a']})
+        self.monitor._payload_cache.refresh = mock.Mock(
+            side_effect=lambda path, children: tornado_value())
+        self.monitor._payload_cache._payloads['/qux'] = {'a': {'up': False}}
+        self.monitor.issue_dispatch_update = mock.Mock()
+
+        # The payloads are refreshed before the path is evaluated
+        self.monitor._pathUpdateCallback({'path': '/qux'})
+        self.assertEquals(self.monitor.issue_dispatch_update.call_count, 0)
+        yield self.sleep(0.01)
+
+        self.monitor._payload_cache.refresh.assert_called_with('/qux', ['a'])
+        self.monitor.issue_dispatch_update.assert_called_with(
+            '/qux', 'Error', '0 children with up=True is less than minimum 1')
+
+    @testing.gen_test
+    def testMaxAgeDeadline(self):
+        self.paths['/heartbeat'] = {'max_age': 1}
+        self.monitor._rules = self.monitor._validatePaths(self.paths)
+        self.monitor._rules['/heartbeat'].rules[0].seconds = 0.05
+        stat = mock.Mock(mtime=time.time() * 1000)
+        self.mocked_ndsr.get = mock.Mock(return_value={
+            'path': '/heartbeat', 'data': None, 'stat': stat, 'children': []})
+        self.monitor.issue_dispatch_update = mock.Mock()
+
+        # Fresh heartbeat: OK, and a deadline is armed ...
+        self.monitor._pathUpdateCallback({'path': '/heartbeat'})
+        self.assertEquals('OK', self.monitor._path_state('/heartbeat'))
+        self.assertEquals(1, len(self.monitor._deadlines))
+
+        # ... which re-evaluates the path without any update from Zookeeper.
+        yield self.sleep(0.1)
+        self.assertEquals('Error', self.monitor._path_state('/heartbeat'))
+        self.assertEquals(0, len(self.monitor._deadlines))
+        self.assertEquals(self.monitor.issue_dispatch_update.call_count, 1)
+
+    @testing.gen_test
+    def testPercentOfPeakDeadline(self):
+        self.paths['/peak'] = {'children': {'peak_percent': 50}}
+        self.monitor._rules = self.monitor._validatePaths(self.paths)
+        self.monitor._rules['/peak'].rules[0]._width = 0.01
+        registration = {'path': '/peak', 'data': None, 'stat': None,
+                        'children': ['a', 'b', 'c', 'd']}
+        self.mocked_ndsr.get = mock.Mock(return_value=registration)
+        self.monitor.issue_dispatch_update = mock.Mock()
+
+        self.monitor._pathUpdateCallback({'path': '/peak'})
+        self.assertEquals('OK', self.monitor._path_state('/peak'))
+        self.assertEquals(0, len(self.monitor._deadlines))
+
+        # Failing against the peak arms a deadline ...
+        registration['children'] = ['a']
+        self.monitor._pathUpdateCallback({'path': '/peak'})
+        self.assertEquals('Error', self.monitor._path_state('/peak'))
+        self.assertEquals(1, len(self.monitor._deadlines))
+
+        # ... and the path is back to OK once the peak aged out, without
+        # any update from Zookeeper.
+        yield self.sleep(0.4)
+        self.assertEquals('OK', self.monitor._path_state('/peak'))
+        self.assertEquals(0, len(self.monitor._deadlines))
+
     def testVerifyCompliance(self):
         def side_effect(path):
             data = {
@@ -140,6 +350,112 @@ class TestMonitor(testing.AsyncTestCase):
         self.assertEquals(
             'Unknown', self.monitor._get_compliance('/baz')[0])
 
+        # The reason names the failed check
+        self.assertEquals(
+            '1 children is less than minimum 2',
+            self.monitor._get_compliance('/bar')[1])
+        self.assertEquals(1, self.monitor._index.get('/bar').count)
+
+    def testPathStateKeptOutOfConfig(self):
+        self.assertEquals(self.monitor._path_state('/foo'), 'Unknown')
+        self.monitor._path_state('/foo', 'Error')
+        self.assertEquals(self.monitor._path_state('/foo'), 'Error')
+
+        record = self.monitor._index.get('/foo')
+        self.assertEquals(record.state, 'Error')
+        self.assertEquals(record.changed, record.updated)
+
+        # The user supplied config is never written to
+        self.assertEquals(
+            self.paths['/foo'],
+            {'children': 1, 'alerter': {'email': 'unit@test.com'}})
+
+    def testHistory(self):
+        def side_effect(path):
+            return {'data': None, 'stat': None, 'children': ['child1:123']}
+        self.mocked_ndsr.get = side_effect
+        self.monitor.issue_dispatch_update = mock.Mock()
+
+        self.assertEquals(None, self.monitor.history('/unknown'))
+        self.assertEquals([], self.monitor.history('/bar'))
+
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.monitor._pathUpdateCallback({'path': '/bar'})
+
+        self.assertEquals(1, len(self.monitor.history('/foo')))
+        self.assertEquals([1, 'OK'], self.monitor.history('/foo')[0][1:])
+        self.assertEquals([1, 'Error'], self.monitor.history('/bar')[0][1:])
+
+    @testing.gen_test
+    def testConnectionLoss(self):
+        children = {'/foo': ['a'], '/bar': ['a', 'b'], '/baz': []}
+
+        def side_effect(path):
+            return {'data': None, 'stat': None, 'children': children[path]}
+        self.mocked_ndsr.get = side_effect
+        self.monitor.issue_dispatch_update = mock.Mock()
+
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.monitor._pathUpdateCallback({'path': '/bar'})
+        self.assertEquals('OK', self.monitor._path_state('/bar'))
+
+        # Nothing is evaluated while disconnected
+        self.monitor._stateListener(False)
+        children.update({'/foo': [], '/bar': []})
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.assertEquals('OK', self.monitor._path_state('/foo'))
+        self.assertEquals(set(['/foo']), self.monitor._stale)
+
+        # Stale paths are evaluated first, then the failing ones
+        self.monitor._path_state('/baz', 'Error')
+        self.assertEquals(['/foo', '/baz', '/bar'],
+                          self.monitor._resyncOrder(set(['/foo'])))
+
+        # ... unless their priority says otherwise
+        self.monitor._priorities = priority.Priorities(
+            {'/bar': {'priority': 'critical'}})
+        self.assertEquals(['/bar', '/foo', '/baz'],
+                          self.monitor._resyncOrder(set(['/foo'])))
+        self.monitor._priorities = priority.Priorities({})
+
+        # Reconnecting re-evaluates all paths in one pass ...
+        children['/bar'] = ['a', 'b']
+        self.monitor._stateListener(True)
+        yield self.sleep(0.01)
+        self.assertEquals('Error', self.monitor._path_state('/foo'))
+        self.assertEquals(set(), self.monitor._stale)
+        self.assertEquals(None, self.monitor._deferred)
+
+        # ... and only dispatches the paths that ended up changing state
+        self.assertEquals(
+            [mock.call('/baz', 'Unknown',
+                       'No information is available about this path.'),
+             mock.call('/foo', 'Error', '0 children is less than minimum 1')],
+            sorted(self.monitor.issue_dispatch_update.call_args_list))
+
+    @testing.gen_test
+    def testResyncHoldsDispatch(self):
+        def side_effect(path):
+            return {'data': None, 'stat': None, 'children': []}
+        self.mocked_ndsr.get = side_effect
+        self.monitor.issue_dispatch_update = mock.Mock()
+
+        # Updates evaluated while a pass is running are only dispatched
+        # once it is complete.
+        self.monitor._deferred = {}
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.assertEquals('Error', self.monitor._path_state('/foo'))
+        self.assertFalse(self.monitor.issue_dispatch_update.called)
+        self.assertEquals(
+            ('Unknown', 'Error', '0 children is less than minimum 1'),
+            self.monitor._deferred['/foo'])
+
+    def testInvalidPriority(self):
+        self.paths['/foo']['priority'] = 'urgent'
+        self.assertRaises(monitor.InvalidConfigException, monitor.Monitor,
+                          self.mocked_disp, self.mocked_ndsr, self.mocked_cs,
+                          self.paths)
+
     def testDispatchConditions(self):
         self.assertTrue(
             self.monitor._should_update_dispatcher(
@@ -168,3 +484,186 @@ class TestMonitor(testing.AsyncTestCase):
         self.assertEquals('OK', ret_val['compliance']['/foo']['state'])
         self.assertEquals('Error', ret_val['compliance']['/bar']['state'])
         self.assertEquals('Unknown', ret_val['compliance']['/baz']['state'])
+
+    def testHealth(self):
+        def side_effect(path):
+            return {'data': None, 'stat': None, 'children': []}
+        self.mocked_ndsr.get = side_effect
+        self.monitor._stateListener(True)
+
+        # Not warm until every path was evaluated once
+        self.assertEquals(
+            {'connected': True, 'warm': False, 'paths': 3, 'events': 0,
+             'changes': 0, 'watching': True},
+            self.monitor.health())
+        for path in self.paths:
+            self.monitor._pathUpdateCallback({'path': path})
+        self.assertEquals(
+            {'connected': True, 'warm': True, 'paths': 3, 'events': 3,
+             'changes': 3, 'watching': True},
+            self.monitor.health())
+
+        # ... nor during a resync pass
+        self.monitor._deferred = {}
+        self.assertFalse(self.monitor.health()['warm'])
+        self.monitor._deferred = None
+
+        self.monitor._stateListener(False)
+        health = self.monitor.health()
+        self.assertFalse(health['connected'])
+        self.assertTrue(health['warm'])
+
+    def testValidate(self):
+        self.assertTrue('/foo' in self.monitor)
+        self.assertFalse('/new' in self.monitor)
+
+        self.assertEquals(None, self.monitor.validate(None))
+        self.assertEquals(
+            [rules.MinChildren],
+            [r.__class__ for r in self.monitor.validate(
+                {'children': 1, 'priority': 'high'}).rules])
+        self.assertRaises(monitor.InvalidConfigException,
+                          self.monitor.validate, {'children': 'x'})
+        self.assertRaises(monitor.InvalidConfigException,
+                          self.monitor.validate, {'priority': 'urgent'})
+
+    def testSetPath(self):
+        def side_effect(path, callback=None):
+            return {'data': None, 'stat': None, 'children': ['a']}
+        self.mocked_ndsr.get = mock.Mock(side_effect=side_effect)
+        self.monitor.issue_dispatch_update = mock.Mock()
+
+        # A new path gets a watch of its own, and nothing else does
+        self.assertTrue(self.monitor.set_path('/new', {'children': 2}))
+        self.mocked_ndsr.get.assert_called_once_with(
+            '/new', callback=self.monitor._pathUpdateCallback)
+        self.assertFalse(self.monitor.health()['warm'])
+
+        self.monitor._pathUpdateCallback({'path': '/new'})
+        self.assertEquals('Error', self.monitor._path_state('/new'))
+
+        # An update only re-evaluates it
+        self.mocked_ndsr.get.reset_mock()
+        self.assertFalse(self.monitor.set_path('/new', {'children': 1}))
+        self.assertEquals('OK', self.monitor._path_state('/new'))
+        self.assertEquals([mock.call('/new')],
+                          self.mocked_ndsr.get.call_args_list)
+
+        # An invalid config changes nothing
+        self.assertRaises(monitor.InvalidConfigException,
+                          self.monitor.set_path, '/new', {'children': 'x'})
+        self.assertRaises(monitor.InvalidConfigException,
+                          self.monitor.set_path, '/new', {'priority': 'x'})
+        self.assertEquals({'children': 1}, self.paths['/new'])
+
+    def testRemovePath(self):
+        watcher = mock.MagicMock(name='watcher')
+        self.mocked_ndsr._watchers = {'/foo': watcher}
+        self.mocked_ndsr.get = mock.Mock(return_value={
+            'data': None, 'stat': None, 'children': []})
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.assertTrue('/foo' in self.monitor._index)
+
+        self.assertTrue(self.monitor.remove_path('/foo'))
+        self.assertFalse(self.monitor.remove_path('/foo'))
+        watcher.stop.assert_called_once_with()
+        self.assertFalse('/foo' in self.paths)
+        self.assertFalse('/foo' in self.monitor._index)
+        self.assertEquals([], self.monitor.history('/foo') or [])
+
+        # Late watch callbacks are ignored
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.assertFalse('/foo' in self.monitor._index)
+
+    def testCompliance(self):
+        self.mocked_ndsr.get = mock.Mock(return_value={
+            'data': None, 'stat': None, 'children': []})
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.assertEquals(1, self.monitor.health()['changes'])
+
+        # Nothing is evaluated again
+        self.mocked_ndsr.get.reset_mock()
+        compliance = self.monitor.compliance()
+        self.assertFalse(self.mocked_ndsr.get.called)
+        self.assertEquals(('Error', '0 children is less than minimum 1'),
+                          compliance['/foo'])
+        self.assertEquals(('Unknown', None), compliance['/bar'])
+
+        # Unchanged evaluations are not counted as changes
+        self.monitor._pathUpdateCallback({'path': '/foo'})
+        self.assertEquals(1, self.monitor.health()['changes'])
+
+    def testStatusLeavesNoTrace(self):
+        self.monitor.set_path('/drop', {'children': {'drop_percent': 40}})
+        self.mocked_ndsr.get = mock.Mock(return_value={
+            'data': None, 'stat': None, 'children': ['a'] * 10})
+        self.monitor._pathUpdateCallback({'path': '/drop'})
+
+        # The status shows the drop, but it is not remembered ...
+        self.mocked_ndsr.get.return_value['children'] = ['a']
+        status = self.monitor.status()
+        self.assertEquals('Error', status['compliance']['/drop']['state'])
+        self.assertEquals([10], [c for _, c in
+                                 self.monitor._rules['/drop'].rules[0]._queue])
+        # ... and no deadline is armed for it
+        self.assertEquals(0, len(self.monitor._deadlines))
+
+    def testThin(self):
+        self.mocked_ndsr.get.reset_mock()
+        self.mocked_ndsr._watchers = {}
+        mon = monitor.Monitor(self.mocked_disp, self.mocked_ndsr,
+                              self.mocked_cs, self.paths, watch=False)
+        self.assertFalse(self.mocked_ndsr.get.called)
+        self.assertTrue(mon.health()['warm'])
+
+        # Nothing is evaluated (or watched) until asked to
+        mon._pathUpdateCallback({'path': '/foo'})
+        mon._rearmExpired()
+        mon.set_path('/new', {'children': 1})
+        self.assertEquals('Unknown',
+                          mon.status()['compliance']['/foo']['state'])
+        self.assertFalse(self.mocked_ndsr.get.called)
+
+        mon.start_watching()
+        self.assertEquals(
+            ['/bar', '/baz', '/foo', '/new'],
+            sorted(c[0][0] for c in self.mocked_ndsr.get.call_args_list))
+        self.assertFalse(mon.health()['warm'])
+
+    @testing.gen_test
+    def testProbe(self):
+        callback = mock.MagicMock()
+        watcher = mock.MagicMock()
+        self.mocked_ndsr._watchers = {'/zkmon/canary/a': watcher}
+        self.monitor.probe('/zkmon/canary/a', callback)
+        self.mocked_ndsr.get.assert_called_with(
+            '/zkmon/canary/a', callback=self.monitor._pathUpdateCallback)
+
+        # Probed paths are handed over on the IOLoop, not evaluated
+        self.monitor._pathUpdateCallback(
+            {'path': '/zkmon/canary/a', 'data': {'sequence': 1}})
+        self.assertFalse(callback.called)
+        yield gen.moment
+        callback.assert_called_once_with(
+            {'path': '/zkmon/canary/a', 'data': {'sequence': 1}})
+        self.assertFalse('/zkmon/canary/a' in self.monitor.compliance())
+
+        self.monitor.unprobe('/zkmon/canary/a')
+        watcher.stop.assert_called_once_with()
+        self.assertEquals({}, self.mocked_ndsr._watchers)
+
+    def testStatsD(self):
+        exporter = mock.MagicMock(name='StatsD')
+        self.mocked_ndsr.get.return_value = {
+            'path': '/foo', 'stat': None, 'data': None, 'children': ['a']}
+        mon = monitor.Monitor(self.mocked_disp, self.mocked_ndsr,
+                              self.mocked_cs, self.paths, statsd=exporter)
+        exporter.reset_mock()
+
+        mon._pathUpdateCallback({'path': '/foo'})
+        exporter.incr.assert_any_call('monitor.events')
+        exporter.incr.assert_any_call('monitor.evaluations')
+        exporter.incr.assert_any_call('monitor.transitions',
+                                      tags={'state': 'OK'})
+        exporter.gauge.assert_called_once_with('path.children', 1,
+                                               tags={'path': '/foo'})
@@ -1,6 +1,9 @@
 from StringIO import StringIO
 import mock
 import logging
+import os
+import shutil
+import tempfile
 
 from tornado.testing import unittest
 
@@ -35,3 +38,15 @@ class TestRunserver(unittest.TestCase):
     def testGetPathListWithNoneFile(self):
         """Test getPathList() method with default path of None"""
         self.assertEquals({}, runserver.getPathList(None))
+
+    def testSavePathList(self):
+        """Test savePathList() method"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'paths.yaml')
+            paths = {'/foo': {'children': 1}, u'/bar': None}
+            runserver.savePathList(path, paths)
+            self.assertEquals(paths, runserver.getPathList(path))
+            self.assertEquals(['paths.yaml'], os.listdir(tmpdir))
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,199 @@
+import mock
+import posixpath
+
+from kazoo.exceptions import NoNodeError
+from tornado import testing
+from tornado.testing import unittest
+
+from zk_monitor import cluster
+from zk_monitor import snapshot
+
+
+class FakeResult(object):
+    """Mimics a completed Kazoo IAsyncResult."""
+
+    def __init__(self, value=None, exc=None):
+        self._value = value
+        self._exc = exc
+
+    def get(self):
+        if self._exc:
+            raise self._exc
+        return self._value
+
+    def rawlink(self, callback):
+        callback(self)
+
+
+class FakeZookeeper(object):
+    """Just enough of an in-memory Kazoo client for snapshots."""
+
+    def __init__(self):
+        self.nodes = {}
+
+    def create_async(self, path, value='', acl=None, ephemeral=False,
+                     sequence=False, makepath=False):
+        self.nodes[path] = value
+        parent = posixpath.dirname(path)
+        self.nodes.setdefault(parent, '')
+        return FakeResult(path)
+
+    def set_async(self, path, value):
+        if path not in self.nodes:
+            return FakeResult(exc=NoNodeError())
+        self.nodes[path] = value
+        return FakeResult(None)
+
+    def get_async(self, path):
+        if path not in self.nodes:
+            return FakeResult(exc=NoNodeError())
+        return FakeResult((self.nodes[path], None))
+
+    def get_children_async(self, path):
+        prefix = path + '/'
+        return FakeResult([p[len(prefix):] for p in self.nodes
+                           if p.startswith(prefix)])
+
+    def delete_async(self, path):
+        self.nodes.pop(path, None)
+        return FakeResult(True)
+
+
+class TestEncoding(unittest.TestCase):
+    def setUp(self):
+        self.compliance = dict(
+            ('/services/%d' % i, ('OK', 'All checks pass.'))
+            for i in xrange(1000))
+
+    def testRoundTrip(self):
+        header, chunks = snapshot.encode(self.compliance, version=1)
+        self.assertEquals(1, header['version'])
+        self.assertEquals(1000, header['paths'])
+        self.assertEquals(1, len(chunks))
+
+        decoded = snapshot.decode(header, chunks)
+        self.assertEquals({'state': 'OK', 'message': 'All checks pass.'},
+                          decoded['/services/7'])
+
+    @mock.patch.object(snapshot, 'CHUNK_SIZE', 100)
+    def testChunks(self):
+        header, chunks = snapshot.encode(self.compliance)
+        self.assertTrue(len(chunks) > 1)
+        self.assertEquals(len(chunks), header['chunks'])
+        self.assertEquals(1000, len(snapshot.decode(header, chunks)))
+
+        # Missing or mixed up chunks are detected
+        self.assertRaises(snapshot.SnapshotException,
+                          snapshot.decode, header, chunks[:-1])
+        self.assertRaises(snapshot.SnapshotException,
+                          snapshot.decode, header, chunks[::-1])
+
+    def testFormat(self):
+        header, chunks = snapshot.encode(self.compliance)
+        header['format'] = 0
+        self.assertRaises(snapshot.SnapshotException,
+                          snapshot.decode, header, chunks)
+
+
+class TestSnapshots(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestSnapshots, self).setUp()
+        self.ndsr = mock.MagicMock()
+        self.ndsr._zk = FakeZookeeper()
+        self.cs = cluster.State(self.ndsr, '/zkmon')
+
+        self.monitor = mock.MagicMock(name='Monitor')
+        self.monitor.health.return_value = {
+            'connected': True, 'warm': True, 'changes': 1}
+        self.monitor.compliance.return_value = {'/foo': ('Error', 'Boom')}
+
+        self.leader = mock.MagicMock(name='Dispatcher')
+        self.leader.alerting.return_value = True
+        self.follower = mock.MagicMock(name='Dispatcher')
+        self.follower.alerting.return_value = False
+
+    @testing.gen_test
+    def testPublishAndFollow(self):
+        publisher = snapshot.Snapshots(self.cs, self.monitor, self.leader)
+        reader = snapshot.Snapshots(self.cs, mock.MagicMock(), self.follower)
+
+        yield reader.tick()
+        self.assertEquals(None, reader.following())
+
+        yield publisher.tick()
+        yield reader.tick()
+        status = reader.following()
+        self.assertEquals({'/foo': {'state': 'Error', 'message': 'Boom'}},
+                          status['compliance'])
+        self.assertEquals(self.cs.name, status['snapshot']['publisher'])
+
+        # Nothing is published again until something changed ...
+        self.monitor.compliance.reset_mock()
+        yield publisher.tick()
+        self.assertFalse(self.monitor.compliance.called)
+
+        # ... and then old chunks are replaced
+        self.monitor.health.return_value['changes'] = 2
+        self.monitor.compliance.return_value = {'/foo': ('OK', 'Fine')}
+        yield publisher.tick()
+        chunks = [p for p in self.ndsr._zk.nodes
+                  if p.startswith('/zkmon/snapshot/')]
+        self.assertEquals(1, len(chunks))
+
+        yield reader.tick()
+        self.assertEquals('OK',
+                          reader.following()['compliance']['/foo']['state'])
+
+        # The lock holder serves its own status
+        self.assertEquals(None, publisher.following())
+
+    @testing.gen_test
+    def testSnapshotReplacedWhileReading(self):
+        publisher = snapshot.Snapshots(self.cs, self.monitor, self.leader)
+        reader = snapshot.Snapshots(self.cs, mock.MagicMock(), self.follower)
+        yield publisher.tick()
+        yield reader.tick()
+        header = reader.header
+
+        # The chunks of the next version are gone by the time we read them
+        self.monitor.health.return_value['changes'] = 2
+        yield publisher.tick()
+        with mock.patch.object(snapshot.log, 'exception') as exception:
+            with mock.patch.object(self.cs, 'getSnapshotChunks') as chunks:
+                chunks.side_effect = NoNodeError()
+                yield reader.tick()
+        self.assertFalse(exception.called)
+        self.assertEquals(header, reader.header)
+
+        # ... and the next tick picks the new version up
+        yield reader.tick()
+        self.assertNotEquals(header, reader.header)
+
+    @testing.gen_test
+    def testVersionsWithinOneMillisecond(self):
+        publisher = snapshot.Snapshots(self.cs, self.monitor, self.leader)
+        with mock.patch('time.time', return_value=1000.0):
+            yield publisher.tick()
+            self.monitor.health.return_value['changes'] = 2
+            yield publisher.tick()
+        header = yield self.cs.getSnapshotHeader()
+        self.assertEquals(1000001, header['version'])
+
+    @testing.gen_test
+    def testNotWarm(self):
+        self.monitor.health.return_value['warm'] = False
+        publisher = snapshot.Snapshots(self.cs, self.monitor, self.leader)
+        yield publisher.tick()
+        self.assertFalse('/zkmon/snapshot' in self.ndsr._zk.nodes)
+
+    @testing.gen_test
+    def testThin(self):
+        thin = snapshot.Snapshots(self.cs, self.monitor, self.follower,
+                                  thin=True)
+        yield thin.tick()
+        self.assertFalse(self.monitor.start_watching.called)
+
+        # Becoming the lock holder starts the watches
+        self.follower.alerting.return_value = True
+        yield thin.tick()
+        self.monitor.start_watching.assert_called_once_with()
@@ -0,0 +1,73 @@
+import mock
+import socket
+
+from tornado.testing import unittest
+
+from zk_monitor import statsd
+
+
+class TestStatsD(unittest.TestCase):
+    def setUp(self):
+        self.statsd = statsd.StatsD('127.0.0.1:8125', prefix='zkm')
+
+    def testAggregation(self):
+        self.statsd.incr('monitor.events')
+        self.statsd.incr('monitor.events', 2)
+        self.statsd.gauge('path.children', 3, tags={'path': '/services/foo'})
+        self.statsd.gauge('path.children', 4, tags={'path': '/services/foo'})
+        self.statsd.timing('canary.latency', 0.0125)
+
+        self.assertEquals(
+            ['zkm.monitor.events:3|c',
+             'zkm.path.children.services_foo:4|g',
+             'zkm.canary.latency:12.5|ms'],
+            self.statsd.lines())
+
+        # Everything is sent once
+        self.assertEquals([], self.statsd.lines())
+
+    def testDogStatsD(self):
+        dog = statsd.StatsD('127.0.0.1:8125', prefix='zkm', tags=True)
+        dog.gauge('path.children', 3, tags={'path': '/services/foo'})
+        dog.incr('dispatcher.alerts', tags={'state': 'Error',
+                                            'alerter': 'email'})
+        self.assertEquals(
+            sorted(['zkm.path.children:3|g|#path:/services/foo',
+                    'zkm.dispatcher.alerts:1|c|#alerter:email,state:Error']),
+            sorted(dog.lines()))
+
+    def testTimingSamples(self):
+        sampled = statsd.StatsD('127.0.0.1:8125', prefix='', timings=2)
+        for i in xrange(4):
+            sampled.timing('op', 0.001)
+        self.assertEquals(['op:1|ms|@0.5', 'op:1|ms|@0.5'], sampled.lines())
+
+    def testPackets(self):
+        small = statsd.StatsD('127.0.0.1:8125', packet_size=20)
+        self.assertEquals(['aaaaaaaa\nbbbbbbbb', 'cccccccccc'],
+                          small.packets(['aaaaaaaa', 'bbbbbbbb',
+                                         'cccccccccc']))
+
+    def testFlush(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(1)
+        exporter = statsd.StatsD(
+            '127.0.0.1:%d' % receiver.getsockname()[1], prefix='zkm',
+            packet_size=100)
+        for i in xrange(10):
+            exporter.gauge('path.children', i, tags={'path': '/p/%d' % i})
+
+        self.assertEquals(4, exporter.flush())
+        packet = receiver.recv(1500)
+        self.assertEquals(3, len(packet.split('\n')))
+        self.assertTrue(packet.startswith('zkm.path.children.p_'))
+        receiver.close()
+
+    @mock.patch('socket.socket')
+    def testDropped(self, socket_mock):
+        socket_mock.return_value.sendto.side_effect = socket.error(
+            11, 'Resource temporarily unavailable')
+        self.statsd.incr('monitor.events')
+        self.assertEquals(0, self.statsd.flush())
+        socket_mock.return_value.setblocking.assert_called_once_with(0)
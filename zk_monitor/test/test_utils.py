@@ -1,6 +1,12 @@
+import Queue
+import json
 import os
 import logging
+import mock
+import sys
 
+from kazoo import client
+from nd_service_registry import watcher
 from tornado import testing
 from tornado.testing import unittest
 
@@ -27,6 +33,57 @@ class TestUtils(unittest.TestCase):
         self.assertTrue(os.path.exists(path))
 
 
+class TestStopWatcher(unittest.TestCase):
+    def setUp(self):
+        # A real (never started) Kazoo client, whose reads register their
+        # watches the way a connected one does.
+        self.zk = client.KazooClient()
+        stat = mock.Mock(version=1)
+
+        def read(pending, result):
+            def method(path, watch=None):
+                pending[path].add(watch)
+                return result
+            return method
+
+        self.zk.get = mock.Mock(side_effect=read(
+            self.zk._data_watchers, ('', stat)))
+        self.zk.get_children = mock.Mock(side_effect=read(
+            self.zk._child_watchers, ['a']))
+
+        self.watcher = watcher.Watcher(self.zk, '/foo')
+        self.ndsr = mock.Mock(_watchers={'/foo': self.watcher})
+
+    def testStopWatcher(self):
+        self.assertEquals(2, len(self.zk.state_listeners))
+        self.assertEquals(1, len(self.zk._data_watchers['/foo']))
+        self.assertEquals(1, len(self.zk._child_watchers['/foo']))
+
+        self.assertEquals(self.watcher,
+                          utils.stopWatcher(self.ndsr, '/foo'))
+        self.assertEquals({}, self.ndsr._watchers)
+        self.assertFalse(self.watcher.state())
+        self.assertEquals(0, len(self.zk.state_listeners))
+        self.assertEquals(set(), self.zk._data_watchers['/foo'])
+        self.assertEquals(set(), self.zk._child_watchers['/foo'])
+
+        # A watch that fires anyway does not re-arm itself
+        self.zk.get.reset_mock()
+        self.watcher._current_data_watch._get_data()
+        self.assertFalse(self.zk.get.called)
+
+        self.assertEquals(None, utils.stopWatcher(self.ndsr, '/foo'))
+
+    def testUnknownKazoo(self):
+        with mock.patch.object(utils.kazoo_version, '__version__', '3.0.0'):
+            utils.stopWatcher(self.ndsr, '/foo')
+
+        # The watcher is dropped, its Kazoo watches are left to lapse
+        self.assertEquals({}, self.ndsr._watchers)
+        self.assertFalse(self.watcher.state())
+        self.assertEquals(1, len(self.zk._data_watchers['/foo']))
+
+
 class TestSetupLoggerUtils(unittest.TestCase):
     def setUp(self):
         """Clean up before each test"""
@@ -67,3 +124,107 @@ class TestSetupLoggerUtils(unittest.TestCase):
         self.assertEquals(type(logger.handlers[0]),
                           logging.handlers.SysLogHandler)
         self.assertEquals(logger.handlers[0].facility, 'local0')
+
+    def testSetupLoggerWithQueue(self):
+        """Make sure that setupLogger(queue_size=...) logs in the background"""
+        log = logging.getLogger()
+        log.handlers = []
+
+        logger = utils.setupLogger(structured=True, sample=5, queue_size=10)
+        handler = logger.handlers[0]
+        handler.listener.stop()
+        log.handlers = []
+
+        self.assertEquals(type(handler), utils.QueueHandler)
+        self.assertEquals(handler.queue.maxsize, 10)
+        self.assertEquals(type(handler.filters[0]), utils.SamplingFilter)
+        self.assertEquals(type(handler.listener._handler.formatter),
+                          utils.JsonFormatter)
+
+
+class TestLoggingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.writer = logging.handlers.BufferingHandler(100)
+        self.log = logging.getLogger('zk_monitor.test.pipeline')
+        self.log.propagate = False
+        self.log.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        self.log.handlers = []
+
+    def testQueueListener(self):
+        """Records are formatted and written by the listener thread"""
+        handler = utils.QueueHandler(Queue.Queue(10))
+        listener = utils.QueueListener(handler, self.writer)
+        self.log.addHandler(handler)
+        listener.start()
+
+        self.log.debug('Path %s changed', '/foo')
+        listener.stop()
+
+        record = self.writer.buffer[0]
+        self.assertEquals(record.msg, 'Path %s changed')
+        self.assertEquals(record.args, ('/foo',))
+        self.assertEquals(record.getMessage(), 'Path /foo changed')
+
+    def testQueueFull(self):
+        """A full queue drops records instead of blocking, and says so"""
+        handler = utils.QueueHandler(Queue.Queue(1))
+        self.log.addHandler(handler)
+        for i in xrange(3):
+            self.log.info('Record %d', i)
+        self.assertEquals(handler.dropped, 2)
+
+        listener = utils.QueueListener(handler, self.writer)
+        listener.start()
+        listener.stop()
+
+        messages = [r.getMessage() for r in self.writer.buffer]
+        self.assertEquals(messages, ['Record 0',
+                                     'Log queue full, dropped 2 records'])
+
+    def testJsonFormatter(self):
+        """Each record is written as a JSON document"""
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            exc_info = sys.exc_info()
+        record = logging.LogRecord(
+            'zk_monitor.test', logging.ERROR, __file__, 1,
+            'Could not read %s', ('/foo',), exc_info, 'func')
+        record.dropped = 3
+
+        entry = json.loads(utils.JsonFormatter().format(record))
+        self.assertEquals(entry['message'], 'Could not read /foo')
+        self.assertEquals(entry['level'], 'ERROR')
+        self.assertEquals(entry['logger'], 'zk_monitor.test')
+        self.assertEquals(entry['function'], 'func')
+        self.assertEquals(entry['dropped'], 3)
+        self.assertTrue('ValueError: broken' in entry['exception'])
+
+    def testSamplingFilter(self):
+        """Records beyond the rate are dropped, except for errors"""
+        sampler = utils.SamplingFilter(2)
+
+        def record(name, level, created):
+            record = logging.makeLogRecord(
+                {'name': name, 'levelno': level, 'msg': 'x'})
+            record.created = created
+            return record
+
+        kept = [sampler.filter(record('a', logging.DEBUG, 100.5))
+                for i in xrange(5)]
+        self.assertEquals(kept, [True, True, False, False, False])
+
+        # Other loggers and errors are not affected
+        self.assertTrue(sampler.filter(record('b', logging.DEBUG, 100.5)))
+        self.assertTrue(sampler.filter(record('a', logging.ERROR, 100.5)))
+
+        # The next second, the number dropped is passed on
+        first = record('a', logging.DEBUG, 101.1)
+        self.assertTrue(sampler.filter(first))
+        self.assertEquals(first.dropped, 3)
+
+        formatter = utils.Formatter('%(message)s')
+        self.assertEquals(formatter.format(first),
+                          'x [3 similar records dropped]')
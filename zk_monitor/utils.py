@@ -18,8 +18,16 @@ zk_monitor code. getXXXPath(), setupLogging, etc.
 """
 
 from logging import handlers
+import Queue
+import atexit
+import json
 import os
 import logging
+import threading
+
+from kazoo import version as kazoo_version
+from tornado import concurrent
+from tornado.ioloop import IOLoop
 
 log = logging.getLogger(__name__)
 
@@ -28,6 +36,12 @@ __author__ = 'Matt Wise (matt@nextdoor.com)'
 # Constants for some of the utilities below
 STATIC_PATH_NAME = 'static'
 
+# Log records waiting for the logging thread before new ones are dropped
+LOG_QUEUE_SIZE = 10000
+
+# Kazoo major versions whose watch internals stopWatcher() knows
+KAZOO_WATCH_VERSIONS = ('2',)
+
 
 def strToClass(string):
     """Method that converts a string name into a usable Class name
@@ -44,18 +58,18 @@ def strToClass(string):
     """
     # Split the string up. The last element is the Class, the rest is
     # the package name.
-    log.debug('Translating "%s" into a Module and Class...' % string)
+    log.debug('Translating "%s" into a Module and Class...', string)
     string_elements = string.split('.')
     class_name = string_elements.pop()
     module_name = '.'.join(string_elements)
-    log.debug('Module: %s, Class: %s' % (module_name, class_name))
+    log.debug('Module: %s, Class: %s', module_name, class_name)
 
     # load the module, will raise ImportError if module cannot be loaded
     m = __import__(module_name, globals(), locals(), class_name)
     # get the class, will raise AttributeError if class cannot be found
     c = getattr(m, class_name)
 
-    log.debug('Class Reference: %s' % c)
+    log.debug('Class Reference: %s', c)
     return c
 
 
@@ -77,13 +91,222 @@ def getStaticPath():
     return '%s/%s' % (getRootPath(), STATIC_PATH_NAME)
 
 
-def setupLogger(level=logging.WARNING, syslog=None):
+def kazooFuture(method, *args):
+    """Run a Kazoo *_async method and return a Tornado Future for it.
+
+    Kazoo completes its async results on its own threads, so the result is
+    handed back to the IOLoop before the Future is resolved.
+
+    args:
+        method: A Kazoo *_async method, eg. zk.get_children_async
+        args: Arguments for the method
+
+    returns:
+        A tornado.concurrent.Future resolving to the result
+    """
+    future = concurrent.Future()
+    io_loop = IOLoop.current()
+
+    def done(result):
+        try:
+            io_loop.add_callback(future.set_result, result.get())
+        except Exception, e:
+            io_loop.add_callback(future.set_exception, e)
+
+    method(*args).rawlink(done)
+    return future
+
+
+def stopWatcher(ndsr, path):
+    """Stop watching a path through the Service Registry for good.
+
+    The Service Registry has no public way to drop the watcher of a path,
+    and Watcher.stop() only silences its callbacks: the Kazoo DataWatch and
+    ChildrenWatch behind it keep their session listener, and re-arm their
+    watch every time it fires. This is the one place that reaches into both
+    libraries to release them. On Kazoo versions we do not know, the Kazoo
+    watches are left to lapse, and their callbacks must be ignored.
+
+    args:
+        ndsr: nd_service_registry object
+        path: The watched path.
+
+    returns:
+        The stopped Watcher, or None if the path was not watched.
+    """
+    watchers = getattr(ndsr, '_watchers', None)
+    watcher = watchers.pop(path, None) if watchers is not None else None
+    if watcher is None:
+        return None
+    watcher.stop()
+
+    if kazoo_version.__version__.split('.')[0] not in KAZOO_WATCH_VERSIONS:
+        return watcher
+
+    for name in ('_current_data_watch', '_current_children_watch'):
+        watch = getattr(watcher, name, None)
+        zk = getattr(watch, '_client', None)
+        if zk is None:
+            continue
+        watch._stopped = True
+        listener = getattr(watch, '_session_watcher', None)
+        if listener is not None:
+            zk.remove_listener(listener)
+        for pending in (getattr(zk, '_data_watchers', {}),
+                        getattr(zk, '_child_watchers', {})):
+            if path in pending:
+                pending[path].discard(getattr(watch, '_watcher', None))
+    return watcher
+
+
+class Formatter(logging.Formatter):
+    """Plain text log lines, noting records dropped by a SamplingFilter."""
+
+    def format(self, record):
+        line = logging.Formatter.format(self, record)
+        dropped = getattr(record, 'dropped', 0)
+        if dropped:
+            line += ' [%d similar records dropped]' % dropped
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON document per log record."""
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'function': record.funcName,
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if getattr(record, 'dropped', 0):
+            entry['dropped'] = record.dropped
+        return json.dumps(entry, sort_keys=True)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets at most `rate` records per second and logger through.
+
+    Errors are never dropped. The first record of a logger let through after
+    some were dropped carries their number in its `dropped` attribute.
+    """
+
+    def __init__(self, rate):
+        logging.Filter.__init__(self)
+        self._rate = rate
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+
+        second = int(record.created)
+        with self._lock:
+            window = self._windows.get(record.name)
+            if window is None or window[0] != second:
+                dropped = window[2] if window is not None else 0
+                self._windows[record.name] = [second, 1, 0]
+                if dropped:
+                    record.dropped = dropped
+                return True
+            if window[1] < self._rate:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class QueueHandler(logging.Handler):
+    """Hands log records over to a QueueListener thread.
+
+    Nothing is formatted here: the message arguments are only rendered (by
+    the listener's handler) if the record is written at all, on the logging
+    thread. Objects passed as arguments are therefore read a moment later
+    than they were logged. When the queue is full, records are dropped
+    rather than making the caller wait.
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+
+
+class QueueListener(object):
+    """Writes the records of a QueueHandler through a handler, on a thread.
+    """
+
+    _STOP = object()
+
+    def __init__(self, source, handler):
+        """
+        args:
+            source: The QueueHandler whose queue to read.
+            handler: logging.Handler doing the formatting and I/O.
+        """
+        self._source = source
+        self._handler = handler
+        self._reported = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name='zk_monitor-logging')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Write out what is queued, then stop the thread."""
+        if self._thread is None:
+            return
+        self._source.queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        queue = self._source.queue
+        while True:
+            record = queue.get()
+            if record is self._STOP:
+                break
+            self._handler.handle(record)
+
+            dropped = self._source.dropped
+            if dropped > self._reported:
+                self._handler.handle(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING,
+                    'levelname': 'WARNING', 'funcName': '_run',
+                    'msg': 'Log queue full, dropped %d records',
+                    'args': (dropped - self._reported,)}))
+                self._reported = dropped
+
+
+def setupLogger(level=logging.WARNING, syslog=None, structured=False,
+                sample=0, queue_size=0):
     """Configures the root logger.
 
     args:
         level: Logging.<LEVEL> object to set logging level
         syslog: String representing syslog facility to output to.
                 If empty, logs are written to console.
+        structured: Write every record as a JSON document.
+        sample: Maximum records per second and logger (errors excluded).
+                0 keeps every record.
+        queue_size: If set, records are queued (up to this many) for a
+                    background thread to format and write, so logging never
+                    blocks the caller.
 
     returns:
         A root Logger object
@@ -109,11 +332,27 @@ def setupLogger(level=logging.WARNING, syslog=None):
         format = '[' + str(pid) + '] [%(name)s] ' \
                  '[%(funcName)s]: (%(levelname)s) %(message)s'
 
-    formatter = logging.Formatter(format)
+    if structured:
+        formatter = JsonFormatter()
+    else:
+        formatter = Formatter(format)
 
     # Append the formatter to the handler, then set the handler as our default
     # handler for the root logger.
     handler.setFormatter(formatter)
+
+    # Hand the formatting and writing to a thread of its own
+    if queue_size:
+        writer = handler
+        handler = QueueHandler(Queue.Queue(queue_size))
+        handler.listener = QueueListener(handler, writer)
+        handler.listener.start()
+        atexit.register(handler.listener.stop)
+
+    # Under storms, drop the excess of chatty loggers right away
+    if sample:
+        handler.addFilter(SamplingFilter(sample))
+
     logger.addHandler(handler)
 
     return logger
@@ -0,0 +1,122 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Runtime administration of the monitored paths.
+
+    GET    /admin/paths/<path>    Returns the config of a monitored path.
+    PUT    /admin/paths/<path>    Adds a path, or replaces its config. The
+                                  body is the JSON equivalent of its YAML
+                                  config (or null to just watch it).
+    DELETE /admin/paths/<path>    Stops monitoring a path.
+
+Every request must carry the admin token:
+
+    Authorization: Bearer <token>
+
+Only the state of the path at hand is touched; no other watches are
+registered again.
+"""
+
+import hmac
+import json
+import logging
+
+from tornado import web
+
+from zk_monitor import monitor
+
+log = logging.getLogger(__name__)
+
+
+def _bytes(value):
+    """Returns a (header) string as UTF-8 bytes, for comparing them."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+class PathAdminHandler(web.RequestHandler):
+    """Serves up the zk_monitor /admin/paths/<path> API"""
+
+    def initialize(self, settings):
+        self.monitor = settings['monitor']
+        self.dispatcher = settings['dispatcher']
+        self.token = settings['admin_token']
+        self.save_config = settings.get('save_config')
+        self.anomalies = settings.get('anomalies')
+
+    def prepare(self):
+        header = self.request.headers.get('Authorization', '')
+        scheme, _, token = header.partition(' ')
+        if scheme.lower() != 'bearer' or \
+                not hmac.compare_digest(_bytes(token.strip()),
+                                        _bytes(self.token)):
+            raise web.HTTPError(401, 'Invalid or missing admin token')
+
+    def _config(self, path):
+        """Returns the config of a monitored path, or a 404."""
+        try:
+            return self.monitor.get_path(path)
+        except KeyError:
+            raise web.HTTPError(404, '%s is not monitored' % path)
+
+    def _save(self):
+        """Write the path configs back to their source, if asked to."""
+        if self.save_config is None:
+            return
+        try:
+            self.save_config()
+        except Exception, e:
+            log.exception('Could not write the path configs back')
+            raise web.HTTPError(500, 'Change applied, but not saved: %s' % e)
+
+    def _respond(self, path, config):
+        self.set_header('Content-Type', 'text/json; charset=UTF-8')
+        self.write(json.dumps({'path': path, 'config': config}))
+
+    def get(self, path):
+        self._respond(path, self._config(path))
+
+    def put(self, path):
+        try:
+            config = json.loads(self.request.body or 'null')
+        except ValueError, e:
+            raise web.HTTPError(400, 'Invalid JSON: %s' % e)
+        if config is not None and not isinstance(config, dict):
+            raise web.HTTPError(400, 'The config must be an object or null')
+
+        try:
+            new = self.monitor.set_path(path, config)
+        except monitor.InvalidConfigException, e:
+            raise web.HTTPError(400, 'Invalid config: %s' % e)
+        self.dispatcher.set_path(path, config)
+        if self.anomalies:
+            self.anomalies.set_path(path)
+        log.warning('Path %s %s via the admin API' % (
+            path, 'added' if new else 'updated'))
+
+        self._save()
+        self.set_status(201 if new else 200)
+        self._respond(path, config)
+
+    def delete(self, path):
+        self._config(path)
+        self.monitor.remove_path(path)
+        self.dispatcher.remove_path(path)
+        if self.anomalies:
+            self.anomalies.remove_path(path)
+        log.warning('Path %s removed via the admin API' % path)
+
+        self._save()
+        self.set_status(204)
@@ -0,0 +1,182 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Serves up the status of every zk_monitor agent of the cluster as one JSON
+document.
+
+The agents are discovered from their registrations in the cluster workspace
+and their /status pages are fetched concurrently. Agents that do not answer
+within the timeout are reported with an error instead of holding up the
+whole document:
+
+    $ curl 'http://localhost:8080/cluster/status?timeout=1'
+
+Every agent reports its own evaluation (never the shared snapshot). On top of
+the individual documents, the one agent holding the alerter lock and the
+paths whose state the agents disagree on are pulled out.
+"""
+
+import json
+import logging
+import time
+
+from tornado import gen
+from tornado import httpclient
+from tornado import web
+
+from zk_monitor.web import state
+
+log = logging.getLogger(__name__)
+
+# Default (and maximum) seconds to wait for a single agent, and the maximum
+# number of agents queried at once.
+TIMEOUT = 2
+CONCURRENCY = 10
+
+
+class Aggregator(object):
+    """Fetches the /status documents of all agents of the cluster."""
+
+    def __init__(self, cluster_state, port, timeout=TIMEOUT,
+                 concurrency=CONCURRENCY):
+        """
+        args:
+            cluster_state: cluster.State object to discover agents with.
+            port: Port that agents without a registered endpoint listen to
+                  (our own).
+            timeout: Default seconds to wait for each agent.
+            concurrency: Maximum number of agents queried at once.
+        """
+        self._cs = cluster_state
+        self._port = port
+        self.timeout = timeout
+        self._concurrency = concurrency
+        self._client = None
+
+    def _http(self):
+        """Returns our own pool of HTTP connections, created on first use."""
+        if self._client is None:
+            self._client = httpclient.AsyncHTTPClient(
+                force_instance=True, max_clients=self._concurrency)
+        return self._client
+
+    def _endpoint(self, name, registration):
+        """Returns the base URL of an agent.
+
+        Agents that did not register an endpoint are assumed to run on the
+        host in their name (<host>-<pid>), on the same port as we do.
+        """
+        endpoint = registration.get('endpoint')
+        if endpoint:
+            return endpoint.rstrip('/')
+        return 'http://%s:%s' % (name.rsplit('-', 1)[0], self._port)
+
+    @gen.coroutine
+    def _fetch(self, endpoint, timeout):
+        """Returns the result of fetching the status of a single agent."""
+        began = time.time()
+        result = {'endpoint': endpoint}
+        try:
+            response = yield self._http().fetch(
+                '%s/status?live=1' % endpoint,
+                connect_timeout=timeout, request_timeout=timeout)
+            result['status'] = json.loads(response.body)
+        except Exception, e:
+            log.debug('Could not fetch the status of %s: %s' % (endpoint, e))
+            result['error'] = str(e)
+        result['elapsed'] = round(time.time() - began, 3)
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def collect(self, local, timeout=None):
+        """Fetch the status of every agent at once.
+
+        args:
+            local: Function returning our own status document; we never
+                   query ourselves over HTTP.
+            timeout: Seconds to wait for each agent.
+
+        returns:
+            A dict of {agent name: result}. Every result has the 'endpoint'
+            and 'elapsed' keys, and either 'status' or 'error'.
+        """
+        timeout = timeout or self.timeout
+        me = self._cs.name
+
+        agents = yield self._cs.getAgents()
+        fetches = {}
+        for name, registration in agents.iteritems():
+            if name != me:
+                fetches[name] = self._fetch(
+                    self._endpoint(name, registration), timeout)
+
+        # Build our own document while the others are on their way
+        mine = {'endpoint': None, 'elapsed': 0, 'status': local()}
+
+        results = yield fetches
+        results[me] = mine
+        raise gen.Return(results)
+
+    @staticmethod
+    def merge(results):
+        """Merge the results of collect() into one cluster document."""
+        alerters = []
+        states = {}
+        for name, result in results.iteritems():
+            status = result.get('status')
+            if not status:
+                continue
+            if status.get('dispatcher', {}).get('alerting'):
+                alerters.append(name)
+            compliance = status.get('monitor', {}).get('compliance', {})
+            for path, record in compliance.iteritems():
+                states.setdefault(path, {})[name] = record.get('state')
+
+        disagreements = dict(
+            (path, by_agent) for path, by_agent in states.iteritems()
+            if len(set(by_agent.values())) > 1)
+
+        return {
+            'agents': results,
+            'answered': sum(1 for r in results.values() if 'status' in r),
+            'complete': all('status' in r for r in results.values()),
+            'alerters': sorted(alerters),
+            'disagreements': disagreements,
+        }
+
+
+class ClusterStatusHandler(web.RequestHandler):
+    """Serves up the zk_monitor /cluster/status page"""
+
+    def initialize(self, settings):
+        self._settings = settings
+        self.aggregator = settings['aggregator']
+
+    @gen.coroutine
+    def get(self):
+        timeout = self.get_argument('timeout', None)
+        try:
+            timeout = timeout and float(timeout)
+        except ValueError:
+            raise web.HTTPError(400, 'Invalid timeout: %s' % timeout)
+        if timeout:
+            timeout = min(timeout, self.aggregator.timeout)
+
+        results = yield self.aggregator.collect(
+            lambda: state.getStatus(self._settings, live=True),
+            timeout=timeout)
+
+        self.set_header('Content-Type', 'text/json; charset=UTF-8')
+        self.write(json.dumps(self.aggregator.merge(results),
+                              indent=4, sort_keys=True))
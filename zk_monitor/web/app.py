@@ -20,6 +20,11 @@ import logging
 from tornado import web
 
 from zk_monitor import utils
+from zk_monitor.web import admin
+from zk_monitor.web import aggregate
+from zk_monitor.web import health
+from zk_monitor.web import history
+from zk_monitor.web import operations
 from zk_monitor.web import root
 from zk_monitor.web import state
 
@@ -28,12 +33,24 @@ log = logging.getLogger(__name__)
 __author__ = 'matt@nextdoor.com (Matt Wise)'
 
 
-def getApplication(ndsr, monitor, dispatcher):
+def getApplication(ndsr, monitor, dispatcher, heartbeat=None,
+                   admin_token=None, save_config=None, aggregator=None,
+                   snapshots=None, servers=None, canary=None,
+                   operation_stats=None, anomalies=None):
     # Group our passed in options into a common settings dict
     settings = {
         'ndsr': ndsr,
         'monitor': monitor,
         'dispatcher': dispatcher,
+        'heartbeat': heartbeat,
+        'admin_token': admin_token,
+        'save_config': save_config,
+        'aggregator': aggregator,
+        'snapshots': snapshots,
+        'servers': servers,
+        'canary': canary,
+        'operation_stats': operation_stats,
+        'anomalies': anomalies,
     }
 
     # Default list of URLs provided by Hooky and links to their classes
@@ -44,11 +61,34 @@ def getApplication(ndsr, monitor, dispatcher):
         # Handle initial web clients at the root of our service.
         (r"/status", state.StatusHandler, dict(settings=settings)),
 
+        # Cheap liveness and readiness checks, never touching Zookeeper
+        (r"/healthz", health.LivenessHandler, dict(settings=settings)),
+        (r"/readyz", health.ReadinessHandler, dict(settings=settings)),
+
+        # Evaluation history of a single monitored path
+        (r"/history(/.*)", history.HistoryHandler, dict(settings=settings)),
+
         # Provide access to our static content
         (r'/static/(.*)', web.StaticFileHandler,
             {'path': utils.getStaticPath()}),
 
         # Handle incoming hook requests
     ]
+
+    # The admin API only exists when a token to protect it is configured
+    if admin_token:
+        URLS.append((r"/admin/paths(/.*)", admin.PathAdminHandler,
+                     dict(settings=settings)))
+
+    # The status of all agents of the cluster at once
+    if aggregator:
+        URLS.append((r"/cluster/status", aggregate.ClusterStatusHandler,
+                     dict(settings=settings)))
+
+    # Latency and throughput of our Zookeeper operations
+    if operation_stats:
+        URLS.append((r"/operations", operations.OperationsHandler,
+                     dict(settings=settings)))
+
     application = web.Application(URLS)
     return application
@@ -0,0 +1,82 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Cheap liveness (/healthz) and readiness (/readyz) checks.
+
+Unlike /status, these never touch Zookeeper and never look at individual
+paths. They only read a handful of in-memory flags, so orchestrators can
+poll them as often as they like.
+
+    /healthz: 200 while the IOLoop keeps beating on time, 503 otherwise.
+    /readyz: 200 once connected to Zookeeper and every path has been
+             evaluated (and no re-evaluation pass is running), 503 otherwise.
+"""
+
+import json
+
+from tornado import web
+
+
+class HealthHandler(web.RequestHandler):
+    """Base class for the health checks."""
+
+    def initialize(self, settings):
+        self.monitor = settings['monitor']
+        self.dispatcher = settings['dispatcher']
+        self.heartbeat = settings.get('heartbeat')
+
+    def _loop(self):
+        """Returns the liveness of the IOLoop as a dict.
+
+        Serving this request proves little by itself; a loop that was stuck
+        for minutes may just have caught up. Instead, the heartbeat tells
+        how long ago it last beat ('age') and how late that beat was ('lag'),
+        and either growing past the stall limit means the loop is not alive.
+        """
+        if self.heartbeat is None:
+            # Nothing to judge the IOLoop by
+            return {'alive': True, 'age': None, 'lag': None}
+        age = self.heartbeat.age()
+        lag = self.heartbeat.lag
+        return {'alive': age < self.heartbeat.stall and
+                lag < self.heartbeat.stall,
+                'age': round(age, 3),
+                'lag': round(lag, 3)}
+
+    def _respond(self, healthy, body):
+        self.set_status(200 if healthy else 503)
+        self.set_header('Content-Type', 'text/json; charset=UTF-8')
+        self.set_header('Cache-Control', 'no-cache')
+        self.write(json.dumps(body, sort_keys=True))
+
+
+class LivenessHandler(HealthHandler):
+    """Serves up the zk_monitor /healthz page"""
+
+    def get(self):
+        loop = self._loop()
+        self._respond(loop['alive'], loop)
+
+
+class ReadinessHandler(HealthHandler):
+    """Serves up the zk_monitor /readyz page"""
+
+    def get(self):
+        body = self.monitor.health()
+        body['alerting'] = self.dispatcher.alerting()
+        body['loop'] = self._loop()
+
+        ready = body['loop']['alive'] and body['connected'] and body['warm']
+        body['ready'] = ready
+        self._respond(ready, body)
@@ -0,0 +1,62 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+
+"""
+Serves up the evaluation history of a monitored path as JSON.
+
+    $ curl 'http://localhost:8080/history/services/foo?points=100&since=3600'
+
+'points' downsamples the series to at most that many entries, 'since' only
+returns the entries of the last that many seconds.
+"""
+
+import json
+import time
+
+from tornado import web
+
+# Default (and maximum) number of points returned
+POINTS = 500
+
+
+class HistoryHandler(web.RequestHandler):
+    """Serves up the zk_monitor /history/<path> page"""
+
+    def initialize(self, settings):
+        self.monitor = settings['monitor']
+
+    def _number(self, name, default, cast):
+        """Returns a numeric query argument, or a 400 if it is invalid."""
+        value = self.get_argument(name, None)
+        if value is None:
+            return default
+        try:
+            return cast(value)
+        except ValueError:
+            raise web.HTTPError(400, 'Invalid %s: %s' % (name, value))
+
+    def get(self, path):
+        points = min(self._number('points', POINTS, int), POINTS)
+        seconds = self._number('since', None, float)
+        since = time.time() - seconds if seconds is not None else None
+
+        series = self.monitor.history(path, since=since, points=points)
+        if series is None:
+            raise web.HTTPError(404, '%s is not monitored' % path)
+
+        self.set_header('Content-Type', 'text/json; charset=UTF-8')
+        self.write(json.dumps({
+            'path': path,
+            'fields': ['time', 'children', 'state'],
+            'history': series}))
@@ -0,0 +1,39 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Serves up the latency and throughput of our Zookeeper operations as JSON,
+per operation and path prefix (see zk_monitor.instrument):
+
+    $ curl 'http://localhost:8080/operations?operation=watch_fire'
+"""
+
+import json
+
+from tornado import web
+
+
+class OperationsHandler(web.RequestHandler):
+    """Serves up the zk_monitor /operations page"""
+
+    def initialize(self, settings):
+        self.stats = settings['operation_stats']
+
+    def get(self):
+        summary = self.stats.summary()
+        operation = self.get_argument('operation', None)
+        if operation is not None:
+            summary = {operation: summary.get(operation, {})}
+
+        self.set_header('Content-Type', 'text/json; charset=UTF-8')
+        self.write(json.dumps(summary, indent=4, sort_keys=True))
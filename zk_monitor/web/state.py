@@ -16,7 +16,14 @@
 Serves up a JSON status document.
 
 Includes the status for all of the monitored paths from the Monitor
-object as well as connection state information for Zookeeper.
+object as well as connection state information for Zookeeper, and the
+metrics reported by the Zookeeper servers we poll, the watch latency
+measured by the canary and the paths flagged by the anomaly detector (if
+any).
+
+Agents that do not hold the alerter lock serve the status of the paths from
+the snapshot published by the one that does, if there is one (see
+zk_monitor.snapshot). Add ?live=1 to get their own evaluation instead.
 """
 
 import json
@@ -28,20 +35,57 @@ from zk_monitor.version import __version__ as VERSION
 __author__ = 'matt@nextdoor.com (Matt Wise)'
 
 
+def getStatus(settings, live=False):
+    """Returns the status document of this agent.
+
+    args:
+        settings: The application settings dict (ndsr, monitor, dispatcher).
+        live: Always evaluate the paths ourselves, even if we could serve
+              them from a snapshot.
+    """
+    monitor = None
+    snapshots = settings.get('snapshots')
+    if snapshots and not live:
+        monitor = snapshots.following()
+    if monitor is None:
+        monitor = settings['monitor'].status()
+
+    status = {
+        'version': VERSION,
+        'zookeeper': {
+            'connected': settings['ndsr']._zk.connected,
+        },
+        'monitor': monitor,
+        'dispatcher': settings['dispatcher'].status(),
+    }
+
+    # The health and metrics of the Zookeeper servers, if we poll any
+    servers = settings.get('servers')
+    if servers:
+        status['servers'] = servers.status()
+
+    # End-to-end watch latency, if the canary runs
+    canary = settings.get('canary')
+    if canary:
+        status['canary'] = canary.status()
+
+    # Paths whose child count is off their baseline, if we look for them
+    anomalies = settings.get('anomalies')
+    if anomalies:
+        status['anomalies'] = anomalies.status()
+
+    return status
+
+
 class StatusHandler(web.RequestHandler):
     """Serves up the zk_monitor /status page"""
 
     def initialize(self, settings):
         """Log the initialization of this root handler"""
-        self.status = {
-            'version': VERSION,
-            'zookeeper': {
-                'connected': settings['ndsr']._zk.connected,
-            },
-            'monitor': settings['monitor'].status(),
-            'dispatcher': settings['dispatcher'].status(),
-        }
+        self._settings = settings
 
     def get(self):
+        live = self.get_argument('live', '') not in ('', '0', 'false')
+        status = getStatus(self._settings, live=live)
         self.set_header('Content-Type', 'text/json; charset=UTF-8')
-        self.write(json.dumps(self.status, indent=4, sort_keys=True))
+        self.write(json.dumps(status, indent=4, sort_keys=True))
@@ -0,0 +1,107 @@
+import json
+import mock
+
+from tornado import testing
+from tornado import web
+
+from zk_monitor import monitor
+from zk_monitor.web import admin
+
+
+class PathAdminHandlerTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        self.mocked_disp = mock.MagicMock(name='Dispatcher')
+        self.mocked_ndsr = mock.MagicMock(name='ND Serv. Reg')
+        self.mocked_ndsr.get.return_value = {
+            'data': None, 'stat': None, 'children': []}
+        self.mocked_cs = mock.MagicMock(name='Cluster State')
+        self.paths = {'/foo': {'children': 1}}
+        self.monitor = monitor.Monitor(
+            self.mocked_disp, self.mocked_ndsr, self.mocked_cs, self.paths)
+        self.save_config = mock.Mock()
+
+        settings = self.settings = {
+            'monitor': self.monitor,
+            'dispatcher': self.mocked_disp,
+            'admin_token': 's3cret',
+            'save_config': self.save_config,
+        }
+        URLS = [(r'/admin/paths(/.*)', admin.PathAdminHandler,
+                 dict(settings=settings))]
+        return web.Application(URLS)
+
+    def request(self, method, path, body=None, token='s3cret'):
+        headers = {}
+        if token:
+            headers['Authorization'] = 'Bearer %s' % token
+        if body is not None:
+            body = json.dumps(body)
+        return self.fetch('/admin/paths%s' % path, method=method,
+                          headers=headers, body=body)
+
+    def testAuthentication(self):
+        self.assertEquals(401, self.request('GET', '/foo', token=None).code)
+        self.assertEquals(401, self.request('GET', '/foo', token='x').code)
+        self.assertEquals(200, self.request('GET', '/foo').code)
+        self.assertEquals(401, self.request('GET', '/foo',
+                                            token=u'caf\xe9').code)
+        self.assertEquals(401, self.request('GET', '/foo',
+                                            token='caf\xc3\xa9').code)
+
+    def testBytes(self):
+        self.assertEquals('caf\xc3\xa9', admin._bytes(u'caf\xe9'))
+        self.assertEquals('caf\xc3\xa9', admin._bytes('caf\xc3\xa9'))
+
+    def testGet(self):
+        response = self.request('GET', '/foo')
+        self.assertEquals({'path': '/foo', 'config': {'children': 1}},
+                          json.loads(response.body))
+        self.assertEquals(404, self.request('GET', '/bar').code)
+
+    def testPut(self):
+        response = self.request('PUT', '/bar', {'children': 2})
+        self.assertEquals(201, response.code)
+        self.assertEquals({'children': 2}, self.paths['/bar'])
+        self.mocked_disp.set_path.assert_called_once_with(
+            '/bar', {'children': 2})
+        self.save_config.assert_called_once_with()
+
+        response = self.request('PUT', '/bar', {'children': 3})
+        self.assertEquals(200, response.code)
+        self.assertEquals({'children': 3}, self.paths['/bar'])
+
+    def testPutNull(self):
+        # A null config just watches the path
+        response = self.fetch('/admin/paths/bar', method='PUT', body='null',
+                              headers={'Authorization': 'Bearer s3cret'})
+        self.assertEquals(201, response.code)
+        self.assertEquals(None, self.paths['/bar'])
+        self.mocked_disp.set_path.assert_called_once_with('/bar', None)
+
+    def testAnomalies(self):
+        anomalies = mock.Mock()
+        self.settings['anomalies'] = anomalies
+        self.assertEquals(201, self.request('PUT', '/bar', {}).code)
+        anomalies.set_path.assert_called_once_with('/bar')
+        self.assertEquals(204, self.request('DELETE', '/bar').code)
+        anomalies.remove_path.assert_called_once_with('/bar')
+
+    def testPutInvalid(self):
+        self.assertEquals(
+            400, self.request('PUT', '/bar', {'children': 'x'}).code)
+        self.assertEquals(400, self.request('PUT', '/bar', [1]).code)
+        response = self.fetch('/admin/paths/bar', method='PUT', body='{',
+                              headers={'Authorization': 'Bearer s3cret'})
+        self.assertEquals(400, response.code)
+
+        self.assertFalse('/bar' in self.paths)
+        self.assertFalse(self.mocked_disp.set_path.called)
+        self.assertFalse(self.save_config.called)
+
+    def testDelete(self):
+        self.assertEquals(204, self.request('DELETE', '/foo').code)
+        self.assertFalse('/foo' in self.paths)
+        self.mocked_disp.remove_path.assert_called_once_with('/foo')
+        self.save_config.assert_called_once_with()
+
+        self.assertEquals(404, self.request('DELETE', '/foo').code)
@@ -0,0 +1,98 @@
+import json
+import mock
+import time
+
+from tornado import concurrent
+from tornado import gen
+from tornado import testing
+from tornado import web
+
+from zk_monitor.web import aggregate
+
+
+class FakeStatusHandler(web.RequestHandler):
+    def initialize(self, state, alerting=False, delay=0):
+        self.state = state
+        self.alerting = alerting
+        self.delay = delay
+
+    @gen.coroutine
+    def get(self):
+        if self.delay:
+            yield gen.sleep(self.delay)
+        self.write(json.dumps({
+            'monitor': {'compliance': {'/foo': {'state': self.state}}},
+            'dispatcher': {'alerting': self.alerting}}))
+
+
+class ClusterStatusHandlerTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        self.mocked_cs = mock.MagicMock(name='Cluster State')
+        self.mocked_cs.name = 'me-1'
+        self.aggregator = aggregate.Aggregator(self.mocked_cs, 0, timeout=5)
+
+        settings = {
+            'ndsr': mock.MagicMock(name='ND Serv. Reg'),
+            'monitor': mock.MagicMock(name='Monitor'),
+            'dispatcher': mock.MagicMock(name='Dispatcher'),
+            'aggregator': self.aggregator,
+        }
+        settings['monitor'].status.return_value = {
+            'compliance': {'/foo': {'state': 'OK'}}}
+        settings['dispatcher'].status.return_value = {'alerting': True}
+        settings['ndsr']._zk.connected = True
+
+        URLS = [
+            (r'/cluster/status', aggregate.ClusterStatusHandler,
+             dict(settings=settings)),
+            (r'/ok/status', FakeStatusHandler, dict(state='OK')),
+            (r'/error/status', FakeStatusHandler, dict(state='Error')),
+            (r'/slow/status', FakeStatusHandler, dict(state='OK', delay=2)),
+        ]
+        return web.Application(URLS)
+
+    def agents(self, *names):
+        base = 'http://127.0.0.1:%d' % self.get_http_port()
+        agents = {'me-1': {}}
+        for name in names:
+            agents['%s-1' % name] = {'endpoint': '%s/%s' % (base, name)}
+        future = concurrent.Future()
+        future.set_result(agents)
+        self.mocked_cs.getAgents.return_value = future
+
+    def testEndpoint(self):
+        self.assertEquals(
+            'http://zk1:8080',
+            aggregate.Aggregator(None, 8080)._endpoint('zk1-123', {}))
+        self.assertEquals(
+            'http://other:1', aggregate.Aggregator(None, 8080)._endpoint(
+                'zk1-123', {'endpoint': 'http://other:1/'}))
+
+    def testMerge(self):
+        self.agents('ok', 'error')
+        body = json.loads(self.fetch('/cluster/status').body)
+
+        self.assertTrue(body['complete'])
+        self.assertEquals(3, body['answered'])
+        self.assertEquals(['me-1'], body['alerters'])
+        self.assertEquals(
+            {'/foo': {'me-1': 'OK', 'ok-1': 'OK', 'error-1': 'Error'}},
+            body['disagreements'])
+        self.assertEquals('OK', body['agents']['me-1']['status']['monitor']
+                          ['compliance']['/foo']['state'])
+
+    def testPartial(self):
+        self.agents('ok', 'slow')
+        began = time.time()
+        body = json.loads(self.fetch('/cluster/status?timeout=0.2').body)
+
+        # The slow agent does not hold up the others
+        self.assertTrue(time.time() - began < 1.5)
+        self.assertFalse(body['complete'])
+        self.assertEquals(2, body['answered'])
+        self.assertTrue('error' in body['agents']['slow-1'])
+        self.assertTrue('status' in body['agents']['ok-1'])
+
+    def testInvalidTimeout(self):
+        self.agents()
+        self.assertEquals(400, self.fetch('/cluster/status?timeout=x').code)
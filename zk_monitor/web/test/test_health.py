@@ -0,0 +1,82 @@
+import json
+import mock
+import time
+
+from tornado import testing
+from tornado import web
+
+from zk_monitor import heartbeat
+from zk_monitor.web import health
+
+
+class HealthHandlerTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        self.mocked_monitor = mock.MagicMock(name='Monitor')
+        self.mocked_monitor.health.return_value = {
+            'connected': True, 'warm': True}
+        self.mocked_disp = mock.MagicMock(name='Dispatcher')
+        self.mocked_disp.alerting.return_value = False
+        self.beat = heartbeat.Heartbeat()
+
+        settings = {
+            'ndsr': mock.MagicMock(name='ND Serv. Reg'),
+            'monitor': self.mocked_monitor,
+            'dispatcher': self.mocked_disp,
+            'heartbeat': self.beat,
+        }
+        URLS = [(r'/healthz', health.LivenessHandler,
+                 dict(settings=settings)),
+                (r'/readyz', health.ReadinessHandler,
+                 dict(settings=settings))]
+        return web.Application(URLS)
+
+    def fetch_json(self, path):
+        response = self.fetch(path)
+        self.assertTrue('text/json' in response.headers['Content-Type'])
+        return response.code, json.loads(response.body)
+
+    def testLiveness(self):
+        code, body = self.fetch_json('/healthz')
+        self.assertEquals(200, code)
+        self.assertEquals(True, body['alive'])
+        self.assertTrue(body['age'] < heartbeat.STALL)
+
+        self.beat.last = time.time() - heartbeat.STALL - 1
+        code, body = self.fetch_json('/healthz')
+        self.assertEquals(503, code)
+        self.assertEquals(False, body['alive'])
+
+    def testLivenessAfterStall(self):
+        # The loop just caught up: the last beat is fresh, but it ran late
+        self.beat.last = time.time()
+        self.beat.lag = heartbeat.STALL + 5
+        code, body = self.fetch_json('/healthz')
+        self.assertEquals(503, code)
+        self.assertEquals(False, body['alive'])
+        self.assertTrue(body['age'] < heartbeat.STALL)
+
+        self.beat.lag = 0.0
+        code, body = self.fetch_json('/healthz')
+        self.assertEquals(200, code)
+
+    def testReadiness(self):
+        code, body = self.fetch_json('/readyz')
+        self.assertEquals(200, code)
+        self.assertEquals(True, body['ready'])
+        self.assertEquals(False, body['alerting'])
+
+        # Never asks for the (expensive) full status
+        self.assertFalse(self.mocked_monitor.status.called)
+        self.assertFalse(self.mocked_disp.status.called)
+
+    def testNotReady(self):
+        self.mocked_monitor.health.return_value = {
+            'connected': True, 'warm': False}
+        code, body = self.fetch_json('/readyz')
+        self.assertEquals(503, code)
+        self.assertEquals(False, body['ready'])
+
+        self.mocked_monitor.health.return_value = {
+            'connected': False, 'warm': True}
+        code, body = self.fetch_json('/readyz')
+        self.assertEquals(503, code)
@@ -0,0 +1,52 @@
+import json
+import mock
+from tornado import web
+from tornado import testing
+
+from zk_monitor.web import history
+
+
+class HistoryHandlerIntegrationTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        self.mocked_monitor = mock.MagicMock(name='Monitor')
+        self.mocked_monitor.history.return_value = [[1.0, 2, 'OK']]
+
+        settings = {'monitor': self.mocked_monitor}
+        URLS = [(r'/history(/.*)', history.HistoryHandler,
+                dict(settings=settings))]
+        return web.Application(URLS)
+
+    def testHistory(self):
+        """Make sure the history of a path is returned"""
+        self.http_client.fetch(self.get_url('/history/foo/bar'), self.stop)
+        response = self.wait()
+
+        self.assertEquals(200, response.code)
+        self.assertTrue('text/json' in response.headers['Content-Type'])
+        self.assertEquals(
+            {'path': '/foo/bar', 'fields': ['time', 'children', 'state'],
+             'history': [[1.0, 2, 'OK']]},
+            json.loads(response.body))
+        self.mocked_monitor.history.assert_called_with(
+            '/foo/bar', since=None, points=history.POINTS)
+
+    def testHistoryArguments(self):
+        """Make sure points and since are passed on"""
+        self.http_client.fetch(
+            self.get_url('/history/foo?points=10&since=60'), self.stop)
+        response = self.wait()
+
+        self.assertEquals(200, response.code)
+        args = self.mocked_monitor.history.call_args
+        self.assertEquals(10, args[1]['points'])
+        self.assertTrue(args[1]['since'] > 0)
+
+    def testInvalidArguments(self):
+        self.http_client.fetch(
+            self.get_url('/history/foo?points=many'), self.stop)
+        self.assertEquals(400, self.wait().code)
+
+    def testUnknownPath(self):
+        self.mocked_monitor.history.return_value = None
+        self.http_client.fetch(self.get_url('/history/foo'), self.stop)
+        self.assertEquals(404, self.wait().code)
@@ -0,0 +1,30 @@
+import json
+
+from tornado import testing
+from tornado import web
+
+from zk_monitor import instrument
+from zk_monitor.web import operations
+
+
+class OperationsHandlerTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        self.stats = instrument.OperationStats()
+        self.stats.record('get', '/services/foo', 0)
+        self.stats.record('watch_fire', '/services/foo', 0)
+        settings = {'operation_stats': self.stats}
+        return web.Application([
+            (r'/operations', operations.OperationsHandler,
+             dict(settings=settings))])
+
+    def testOperations(self):
+        body = json.loads(self.fetch('/operations').body)
+        self.assertEquals(['get', 'watch_fire'], sorted(body))
+        self.assertEquals(1, body['get']['/services/foo']['count'])
+
+    def testOperation(self):
+        body = json.loads(self.fetch('/operations?operation=get').body)
+        self.assertEquals(['get'], body.keys())
+
+        body = json.loads(self.fetch('/operations?operation=lock').body)
+        self.assertEquals({'lock': {}}, body)
@@ -69,3 +69,43 @@ class StatusHandlerIntegrationTests(testing.AsyncHTTPTestCase):
             'Unknown')
 
         self.assertEquals('disp_test', body_to_dict['dispatcher'])
+
+    def testSnapshot(self):
+        """Followers serve the status of the paths from the snapshot"""
+        self.mocked_ndsr._zk.connected = True
+        self.settings['snapshots'] = mock.MagicMock()
+        self.settings['snapshots'].following.return_value = {
+            'compliance': {'/foo': {'state': 'OK', 'message': 'Fine'}}}
+
+        body = json.loads(self.fetch('/').body)
+        self.assertEquals('OK',
+                          body['monitor']['compliance']['/foo']['state'])
+
+        body = json.loads(self.fetch('/?live=1').body)
+        self.assertEquals('Unknown',
+                          body['monitor']['compliance']['/foo']['state'])
+
+    def testServers(self):
+        """The state and metrics of polled servers are included"""
+        self.mocked_ndsr._zk.connected = True
+        body = json.loads(self.fetch('/').body)
+        self.assertFalse('servers' in body)
+
+        self.settings['servers'] = mock.MagicMock()
+        self.settings['servers'].status.return_value = {
+            'zk://zk1:2181': {'state': 'OK', 'metrics': {'zk_znode_count': 5}}}
+        body = json.loads(self.fetch('/').body)
+        self.assertEquals(
+            5, body['servers']['zk://zk1:2181']['metrics']['zk_znode_count'])
+
+    def testAnomalies(self):
+        """The paths flagged by the anomaly detector are included"""
+        self.mocked_ndsr._zk.connected = True
+        body = json.loads(self.fetch('/').body)
+        self.assertFalse('anomalies' in body)
+
+        self.settings['anomalies'] = mock.MagicMock()
+        self.settings['anomalies'].status.return_value = {
+            'paths': 2, 'anomalous': ['/foo']}
+        body = json.loads(self.fetch('/').body)
+        self.assertEquals(['/foo'], body['anomalies']['anomalous'])